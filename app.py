@@ -1,26 +1,32 @@
 import streamlit as st
-from PIL import Image
-import io
 import base64
-import pandas as pd
-from docx import Document
 from docx.shared import Inches
 # Importa la librería de Vertex AI
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part, Image as VertexImage, GenerationConfig
+from vertexai.generative_models import Part
 import json
-import random # Necesario para la clave aleatoria
-from google.cloud import storage
 import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from taxonomia import CargadorTaxonomia, opciones as opciones_taxonomia
+from clientes_gcp import iniciar_vertex, precalentar_en_segundo_plano
+# Generador, auditor y exportadores (compartidos con el modo por lotes, lote_items.py)
+from motor_items import (crear_excel, crear_word, producir_item,
+                         OPORTUNIDAD_MEJORA_POR_DEFECTO, generar_oportunidad_mejora_llm,
+                         generar_y_auditar_candidato,
+                         INSTRUCCIONES_GENERADOR, INSTRUCCIONES_AUDITOR)
 
 # --- IMPORTACIÓN CLAVE ---
 # Importamos las TRES funciones que necesitamos
 try:
-    from graficos_plugins import crear_grafico, generar_grafico_desde_texto, build_visual_json_with_llm
+    from graficos_plugins import crear_grafico, generar_grafico_desde_texto, build_visual_json_with_llm, GRAFICOS_DPI_PREVIA
     GRAFICOS_DISPONIBLES = True
 except ImportError:
     st.error("Advertencia: No se encontró el archivo 'graficos_plugins.py'. La previsualización de gráficos no funcionará.")
     GRAFICOS_DISPONIBLES = False
+    GRAFICOS_DPI_PREVIA = 72
     # Definir funciones placeholder si falla la importación
     def crear_grafico(*args, **kwargs):
         return None
@@ -32,498 +38,179 @@ except ImportError:
 # Usa variables de entorno para el proyecto y la región, con valores por defecto
 GCP_PROJECT = os.environ.get("GCP_PROJECT", "espejazos")
 GCP_LOCATION = os.environ.get("GCP_LOCATION", "us-central1")
-vertexai.init(project=GCP_PROJECT, location=GCP_LOCATION)
+iniciar_vertex(GCP_PROJECT, GCP_LOCATION)
 
-# --- 1. FUNCIÓN DEL GENERADOR (CORREGIDA PARA TEXTO NATURAL PURO) ---
-def generar_item_llm(imagen_cargada, taxonomia_dict, contexto_adicional, model_name, feedback_auditor=""):
-    """
-    GENERADOR: Genera el ítem, pidiendo descripciones de gráficos en LENGUAJE NATURAL PURO.
-    """
-    
-    # --- Configuración del Modelo ---
-    model = GenerativeModel(model_name) 
-    
-    # --- Procesamiento de Imagen ---
-    img_pil = Image.open(imagen_cargada)
-    buffered = io.BytesIO()
-    img_pil.save(buffered, format="PNG")
-    img_bytes = buffered.getvalue()
-    vertex_img = VertexImage.from_bytes(img_bytes)
-
-    # --- Preparación de variables del Prompt ---
-    taxonomia_texto = "\n".join([f"* {k}: {v}" for k, v in taxonomia_dict.items()])
-    clave_aleatoria = random.choice(['A', 'B', 'C', 'D'])
-
-    seccion_feedback = ""
-    if feedback_auditor:
-        seccion_feedback = f"""
-        --- RETROALIMENTACIÓN DE AUDITORÍA (Error a corregir) ---
-        El intento anterior fue rechazado. DEBES corregir los siguientes errores:
-        {feedback_auditor}
-        --- VUELVE A GENERAR EL ÍTEM CORRIGIENDO ESTO ---
-        """
-
-    # --- 4. Diseño del Prompt (Generador) - ¡EJEMPLOS CORREGIDOS! ---
-    prompt_texto = f"""
-    Eres un  experto en evaluación educativa, con especialización en el diseño de ítems de lectura crítica para pruebas estandarizadas de alto impacto, como la prueba Saber 11 en Colombia. Tu misión es crear una pregunta espejo que sea un clon psicométrico de la pregunta original. Esto significa que, aunque se aplique a un texto nuevo, debe evaluar exactamente la misma habilidad, con el mismo formato y nivel de dificultad, garantizando que ambos ítems sean funcionalmente equivalentes.
-
-    {seccion_feedback}
-
-    **Shell Cognitivo (Pregunta Original):**
-    Analiza la estructura lógica y la "Tarea Cognitiva" de la pregunta en la IMAGEN ADJUNTA.
-    - Si la pregunta original usa una tabla o gráfico, tu ítem espejo también debería usar uno.
-    - **¡IMPORTANTE!** Si las *opciones de respuesta* en la imagen original son gráficas o tablas, debes replicar esa estructura para las opciones del ítem espejo.
-    2. Análisis de la pregunta modelo
-
-    Identifica la habilidad cognitiva (p. ej., inferencia, comprensión literal, vocabulario).
-    Observa el formato (cita breve, expresión subrayada, pregunta abierta, etc.).
-    Revisa el tipo de distractores (antónimos, conceptos afines, distractores temáticos).
-      
-    **¡INSTRUCCIÓN CRÍTICA DE SIMILITUD!**
-        1.  **NO CAMBIES LA ESTRUCTURA**: Si la pregunta usa una tabla, tu ítem espejo debe usar una tabla con la MISMA ESTRUCTURA (mismas columnas y filas).
-        2.  **DEBES CAMBIAR**:
-            - Los **valores numéricos** 
-            - Los **nombres ficticios**
-            - Los **contextos**
-        3. Creación de la pregunta espejo
-        Sobre el texto nuevo, elabora una pregunta que:
-        Evalúe la misma competencia y evidencia, con igual nivel de dificultad.
-        Repita el formato estructural.
-        Garantice una respuesta correcta única y clara; los distractores deben ser plausibles, pero inequívocamente incorrectos.
-        Utilice vocabulario y complejidad adecuados para estudiantes de grado 11.
-
-    **Taxonomía Requerida (Tu Guía):**
-    {taxonomia_texto}
-    
-    **Contexto Adicional del Usuario (Tema del ítem nuevo):**
-    {contexto_adicional}
-
-    --- ANÁLISIS COGNITIVO OBLIGATORIO (Tu paso 1) ---
-    Basado en la taxonomía (Evidencia, Afirmación, Competencia), define la Tarea Cognitiva exacta que el ítem espejo debe evaluar.
-    
-    --- CONSTRUCCIÓN DEL ÍTEM (Tu paso 2) ---
-    Basado en tu análisis, construye el ítem.
-    - ENUNCIADO: Debe ser claro y **NO** usar jerarquías ("más", "mejor", "principalmente").
-    - CLAVE: La respuesta correcta DEBE ser la opción **{clave_aleatoria}**.
-    - DISTRACTORES: Plausibles, basados en errores comunes de la Tarea Cognitiva. Deben tener la redacción "El estudiante podria escoger la opción XX porque... Sin embargo esto es incorrecto porque...
-    - DIFERENCIAS CON EL ITEM INICIAL: *CRITICO* NO se puede usar ninguno de los valores numéricos del ítem inicial. Deben ser totalmente diferentes.
-    
-    
-    --- INSTRUCCIONES DE SALIDA PARA GRÁFICO (ENUNCIADO Y OPCIONES) ---
-    ¡INSTRUCCIÓN CRÍTICA! Para los gráficos, NO debes generar el JSON.
-    En su lugar, proporciona una descripción detallada en LENGUAJE NATURAL de lo que el gráfico debe mostrar.
-    
-    Si el elemento (enunciado u opción) NO necesita un gráfico, usa "NO" y "N/A".
-    Si SÍ necesita un gráfico, usa "SÍ" y escribe la descripción.
-    
-    Ejemplo de descripción: "Una tabla de 3 columnas y 2 filas. Las columnas son 'País', 'Capital', 'Población'. La primera fila es 'Colombia', 'Bogotá', '8M'. La segunda es 'Argentina', 'Buenos Aires', '3M'."
-    Otro ejemplo: "Un gráfico de barras verticales simple con 3 barras. El eje X tiene las etiquetas 'A', 'B', 'C'. El eje Y (valores) tiene '10', '20', '15'."
-
-    --- FORMATO DE SALIDA OBLIGATORIO (JSON VÁLIDO) ---
-    Responde ÚNICAMENTE con el objeto JSON. No incluyas ```json.
-    {{
-      "pregunta_espejo": "Texto completo del enunciado/stem...",
-      "clave": "{clave_aleatoria}",
-      "descripcion_imagen_original": "Descripción de la imagen que el usuario subió...",
-      "justificacion_clave": "Razón por la que la clave es correcta...",
-      
-      "grafico_necesario_enunciado": "SÍ",
-      "descripcion_texto_grafico_enunciado": "Una tabla simple. La primera fila es el encabezado con 'País' y 'Capital'. La segunda fila tiene 'Colombia' y 'Bogotá'.",
-      
-      "opciones": {{
-        "A": {{
-          "texto": "Ver gráfico A",
-          "grafico_necesario": "SÍ",
-          "descripcion_texto_grafico": "Un gráfico de barras verticales simple. El eje X tiene dos categorías: 'X' y 'Y'. Los valores del eje Y son 5 para 'X' y 10 para 'Y'."
-        }},
-        "B": {{
-          "texto": "Texto de la Opción B (sin gráfico)",
-          "grafico_necesario": "NO",
-          "descripcion_texto_grafico": "N/A"
-        }},
-        "C": {{
-          "texto": "Texto de la Opción C",
-          "grafico_necesario": "NO",
-          "descripcion_texto_grafico": "N/A"
-        }},
-        "D": {{
-          "texto": "Texto de la Opción D",
-          "grafico_necesario": "NO",
-          "descripcion_texto_grafico": "N/A"
-        }}
-      }},
-      
-      "justificaciones_distractores": [
-        {{ "opcion": "A", "justificacion": "Justificación para A..." }},
-        {{ "opcion": "B", "justificacion": "Justificación para B..." }},
-        {{ "opcion": "C", "justificacion": "Justificación para C..." }},
-        {{ "opcion": "D", "justificacion": "Justificación para D..." }}
-      ]
-    }}
-    """
-
-    config_generacion = GenerationConfig(
-        response_mime_type="application/json"
-    )
+MODELOS_DISPONIBLES = ["gemini-2.5-pro", "gemini-2.5-flash","gemini-2.5-flash-lite"]
 
-    try:
-        # --- 1. LLAMADA A LA API ---
-        response = model.generate_content(
-            [vertex_img, prompt_texto], 
-            generation_config=config_generacion
-        )
-        
-        raw_text = response.text
-        
-        # --- 2. MEJORA: LIMPIEZA DE JSON ---
-        try:
-            start_index = raw_text.find('{')
-            end_index = raw_text.rfind('}') + 1
-            if start_index == -1 or end_index == 0:
-                raise ValueError("No se encontraron los delimitadores JSON '{' o '}'.")
-            json_str = raw_text[start_index:end_index]
-            json.loads(json_str) 
-            return json_str
-        
-        except (ValueError, json.JSONDecodeError) as json_e:
-            st.error(f"Error al limpiar/parsear la respuesta del Generador: {json_e}")
-            st.error(f"Respuesta cruda recibida (esto puede ayudar a depurar): {raw_text}")
-            return None
-        # --- FIN DE LA MEJORA DE LIMPIEZA ---
-
-    except Exception as e:
-        st.error(f"Error al contactar Vertex AI (Generador): {e}")
+# --- Clientes compartidos (clientes_gcp) ---
+# Una sola vez por proceso: abre por adelantado los canales de Gemini y GCS en segundo plano y
+# deja listos los prefijos en caché del generador y del auditor para el modelo por defecto
+@st.cache_resource
+def precalentar_clientes():
+    if os.environ.get("CLIENTES_PRECALENTAR", "1").strip().lower() in ("0", "false", "no"):
         return None
-
-# --- 2. FUNCIÓN DEL AUDITOR (ACTUALIZADA CON LIMPIEZA DE JSON) ---
-def auditar_item_llm(item_json_texto, taxonomia_dict, model_name):
+    modelo_por_defecto = MODELOS_DISPONIBLES[0]
+    return precalentar_en_segundo_plano(
+        MODELOS_DISPONIBLES, os.environ.get("GCS_BUCKET_NAME", "bucket-espejos1"),
+        prefijos=[(modelo_por_defecto, INSTRUCCIONES_GENERADOR), (modelo_por_defecto, INSTRUCCIONES_AUDITOR)])
+
+precalentar_clientes()
+
+# --- Backend de renderizado en procesos (opcional, GRAFICOS_BACKEND=procesos) ---
+# Se crea una sola vez por proceso para que los workers arranquen "calientes" antes del primer render
+@st.cache_resource
+def iniciar_pool_render():
+    from pool_render import obtener_pool
+    return obtener_pool()
+
+if GRAFICOS_DISPONIBLES and os.environ.get("GRAFICOS_BACKEND", "local").lower().strip() == "procesos":
+    iniciar_pool_render()
+
+def mostrar_vista_previa_item(campos):
+    """Pinta (en el contenedor activo) los campos del ítem que ya llegaron por streaming."""
+    if "pregunta_espejo" in campos:
+        st.markdown(f"**Enunciado:** {campos['pregunta_espejo']}")
+    if "clave" in campos:
+        st.markdown(f"**Clave:** {campos['clave']}")
+    if "justificacion_clave" in campos:
+        st.caption(f"Justificación de la clave: {campos['justificacion_clave']}")
+    opciones = campos.get("opciones")
+    if isinstance(opciones, dict):
+        for letra in ["A", "B", "C", "D"]:
+            texto = (opciones.get(letra) or {}).get("texto", "")
+            st.markdown(f"- **{letra}.** {texto}")
+    justifs = campos.get("justificaciones_distractores")
+    if isinstance(justifs, list):
+        for j in justifs:
+            if isinstance(j, dict):
+                st.caption(f"{j.get('opcion', '?')}: {j.get('justificacion', '')}")
+
+# --- TAXONOMÍA DESDE GCS (una copia compartida y versionada por proceso) ---
+@st.cache_resource
+def obtener_cargador_taxonomia(bucket_name, file_path):
+    return CargadorTaxonomia(bucket_name, file_path)
+
+def obtener_taxonomia_vigente(bucket_name, file_path):
     """
-    AUDITOR: Audita el ítem Y la coherencia de los gráficos (enunciado Y opciones).
-    """
-    
-    # Modelo de Gemini (ahora dinámico)
-    model = GenerativeModel(model_name)
-    taxonomia_texto = "\n".join([f"* {k}: {v}" for k, v in taxonomia_dict.items()])
-
-    prompt_auditor = f"""
-    Eres un auditor psicométrico experto y riguroso. Tu tarea es auditar el siguiente ítem (en JSON)
-    contra la taxonomía y las reglas de estilo.
-    
-    **Taxonomía de Referencia (ObligatorIA):**
-    {taxonomia_texto}
-
-    **Ítem Generado (JSON a Auditar):**
-    {item_json_texto}
-
-    --- CRITERIOS DE AUDITORÍA (Evalúa uno por uno) ---
-    1.  **Alineación con Taxonomía:** ¿El ítem evalúa CLARAMENTE la Evidencia, Afirmación y Competencia?
-    2.  **Estilo del Enunciado (No Jerarquización):** ¿El enunciado usa palabras prohibidas como "más", "mejor", "principalmente"? (RECHAZO automático).
-    3.  **Calidad de Distractores:** ¿Las justificaciones de los distractores explican el *error* (ej. "El estudiante podría...")?
-    4.  **Clave y Opciones:** ¿Hay 4 opciones? ¿La clave coincide con una opción?
-    5.  **Coherencia de Gráficos (¡ACTUALIZADO!):** - ¿Es coherente el "grafico_necesario_enunciado" con la pregunta?
-        - ¿Son coherentes los "grafico_necesario" DENTRO de cada opción?
-        - Si un gráfico existe, ¿es un JSON válido?
-
-    --- FORMATO DE SALIDA OBLIGATORIO (JSON VÁLIDO) ---
-    Devuelve tu auditoría como un único objeto JSON. No uses ```json.
-    {{
-      "criterios": [
-        {{ "criterio": "1. Alineación con Taxonomía", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." }},
-        {{ "criterio": "2. Estilo (No Jerarquización)", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." }},
-        {{ "criterio": "3. Calidad de Distractores", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." }},
-        {{ "criterio": "4. Clave y Opciones", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." }},
-        {{ "criterio": "5. Coherencia de Gráficos", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." }}
-      ],
-      "dictamen_final": "✅ CUMPLE" o "❌ RECHAZADO",
-      "observaciones_finales": "Si es RECHAZADO, explica aquí CLARAMENTE qué debe corregir el generador. (Ej: 'El enunciado usa la palabra 'principalmente'. O 'El gráfico de la opción C es SÍ pero no se proporcionó JSON.')"
-    }}
+    Versión vigente de la taxonomía ({generacion, hojas, indice, ...}), compartida por todas las
+    sesiones sin copias. Se actualiza sola en segundo plano cuando cambia el archivo en GCS.
     """
-    
-    config_generacion = GenerationConfig(
-        response_mime_type="application/json"
-    )
-
     try:
-        response = model.generate_content(
-            prompt_auditor, 
-            generation_config=config_generacion
-        )
-        
-        raw_text = response.text
-        
-        # --- INICIO DE LA MEJORA: LIMPIEZA DE JSON (AUDITOR) ---
-        try:
-            # Encuentra el primer { y el último } para eliminar texto extra
-            start_index = raw_text.find('{')
-            end_index = raw_text.rfind('}') + 1
-            
-            if start_index == -1 or end_index == 0:
-                raise ValueError("No se encontraron los delimitadores JSON '{' o '}'.")
-
-            # Extrae solo el JSON
-            json_str = raw_text[start_index:end_index]
-            
-            # Valida que es un JSON antes de devolver
-            json.loads(json_str) 
-            return json_str
-        
-        except (ValueError, json.JSONDecodeError) as json_e:
-            st.error(f"Error al limpiar/parsear la respuesta del Auditor: {json_e}")
-            st.error(f"Respuesta cruda recibida (esto puede ayudar a depurar): {raw_text}")
-            return None
-        # --- FIN DE LA MEJORA DE LIMPIEZA ---
-
+        return obtener_cargador_taxonomia(bucket_name, file_path).actual()
+    except FileNotFoundError as e:
+        st.error(f"Error: {e}")
+        return None
     except Exception as e:
-        st.error(f"Error al contactar Vertex AI (Auditor): {e}")
+        st.error(f"Error al leer Excel desde GCS: {e}")
+        st.info("Asegúrate de que la cuenta de servicio de Streamlit tenga permisos de 'Storage Object Viewer' en el bucket 'bucket-espejos1'.")
         return None
 
-# --- 3. FUNCIONES DE EXPORTACIÓN (ACTUALIZADAS) ---
 
-# --- 3. FUNCIONES DE EXPORTACIÓN (ACTUALIZADAS) ---
-
-def reemplazar_texto_en_doc(doc, reemplazos):
-    """
-    Recorre todos los párrafos y tablas en un documento y reemplaza los placeholders.
-    """
-    for p in doc.paragraphs:
-        for clave, valor in reemplazos.items():
-            if clave in p.text:
-                p.text = p.text.replace(clave, valor)
-    
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    for clave, valor in reemplazos.items():
-                        if clave in p.text:
-                            p.text = p.text.replace(clave, valor)
-    return doc
-
-# --- 3. FUNCIONES DE EXPORTACIÓN (EXCEL REESCRITO CON AFIRMACIÓN) ---
-
-def crear_excel(datos_generados, taxonomia_seleccionada, oportunidad_mejora):
-    """
-    Crea un Excel en formato HORIZONTAL (una fila por ítem) con las columnas
-    específicas solicitadas.
-    """
-    
-    # 1. Mapear las justificaciones a un diccionario para fácil acceso
-    justificaciones = datos_generados.get("justificaciones_distractores", [])
-    justifs_map = {j.get('opcion'): j.get('justificacion') for j in justificaciones}
-    
-    # 2. Crear el diccionario de datos para la única fila
-    data_dict = {
-        # --- Columnas de Taxonomía ---
-        "Área": taxonomia_seleccionada.get("Área", "N/A"),
-        "RESPONSABLE": "IA ESPEJAZOS",
-        "COMPONENTE": taxonomia_seleccionada.get("Componente_Estructura", "N/A"),
-        "Competencia": taxonomia_seleccionada.get("Competencia", "N/A"),
-        "Afirmación": taxonomia_seleccionada.get("Afirmación", "N/A"), # <-- AÑADIDA DE VUELTA
-        "Evidencia": taxonomia_seleccionada.get("Evidencia", "N/A"),
-        "Temática": taxonomia_seleccionada.get("Ref. Temática", "N/A"),
-        "Nivel (curso)": taxonomia_seleccionada.get("Grado", "N/A"),
-        
-        # --- Columnas de Metadatos (Fijas) ---
-        "PASTILLA": "NA",
-        "Dificultad estimada": "NA",
-        "Estándar": "NA",
-        "Estado": "Espejo",
-        "Número en el PDF": "NA",
-        "ID ÍTEM": "NA",
-        "ID CONTEXTO": "NA",
-
-        # --- Columnas de Contenido del Ítem ---
-        "Guía (Primeras palabras del ítem)": datos_generados.get("pregunta_espejo", "N/A"),
-        "Oportunidad de mejora": oportunidad_mejora,
-        "Justificación de la respuesta A": justifs_map.get("A", "N/A"),
-        "Justificación de la respuesta B": justifs_map.get("B", "N/A"),
-        "Justificación de la respuesta C": justifs_map.get("C", "N/A"),
-        "Justificación de la respuesta D": justifs_map.get("D", "N/A"),
-        "Clave": datos_generados.get("clave", "N/A")
-    }
+# Memoización en segundo plano: un cálculo por (taxonomía, justificación de la clave, modelo).
+# Los reruns de Streamlit reutilizan el resultado y solo se vuelve a llamar al LLM si cambia una entrada.
+MAX_OPORTUNIDADES_MEMO = 256
 
-    # 3. Crear el DataFrame
-    df = pd.DataFrame([data_dict])
-    
-    # 4. Forzar el orden de columnas exacto que pediste
-    columnas_ordenadas = [
-        "Área",
-        "RESPONSABLE",
-        "COMPONENTE",
-        "Competencia",
-        "Afirmación", # <-- AÑADIDA DE VUELTA
-        "Evidencia",
-        "PASTILLA",
-        "Temática",
-        "Dificultad estimada",
-        "Estándar",
-        "Estado",
-        "Nivel (curso)",
-        "Número en el PDF",
-        "ID ÍTEM",
-        "ID CONTEXTO",
-        "Guía (Primeras palabras del ítem)",
-        "Oportunidad de mejora",
-        "Justificación de la respuesta A",
-        "Justificación de la respuesta B",
-        "Justificación de la respuesta C",
-        "Justificación de la respuesta D",
-        "Clave"
-    ]
-    
-    # Filtra solo las columnas que existen en el df para evitar errores
-    columnas_finales = [col for col in columnas_ordenadas if col in df.columns]
-    df = df[columnas_finales]
+@st.cache_resource
+def _estado_oportunidades():
+    """Estado compartido por el proceso: pool de fondo y futuros indexados por clave."""
+    return {"pool": ThreadPoolExecutor(max_workers=2), "futuros": OrderedDict(), "lock": threading.Lock()}
 
-    # 5. Guardar en el buffer de Excel
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Item Generado')
-    return output.getvalue()
 
-def crear_word(datos_editados, taxonomia_seleccionada, oportunidad_mejora):
+def solicitar_oportunidad_mejora(taxonomia_data, justificacion_clave, model_name):
     """
-    Genera un documento Word rellenando una plantilla desde GCS.
+    Devuelve el Future de la oportunidad de mejora para estas entradas, lanzándolo en segundo
+    plano si aún no existe. Los resultados por defecto (fallo del LLM) no se memoizan.
     """
-    try:
-        # 1. Descargar la plantilla desde GCS (usando variables de entorno)
-        bucket_name = os.environ.get("GCS_BUCKET_NAME", "bucket-espejos1")
-        template_name = os.environ.get("WORD_TEMPLATE_NAME", "formato_limpio.docx")
-        storage_client = storage.Client(project=GCP_PROJECT)
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(template_name)
-        
-        if not blob.exists():
-            st.error(f"Error: La plantilla '{template_name}' no se encontró en el bucket '{bucket_name}'.")
-            return None
-            
-        doc_buffer = io.BytesIO(blob.download_as_bytes())
-        doc = Document(doc_buffer)
-        
-        # 2. Oportunidad de mejora (Ahora se recibe como argumento)
-        # (La llamada a la IA se eliminó de aquí)
-        
-        # 3. Preparar los distractores
-        clave = datos_editados.get("clave", "")
-        distractores_texto = []
-        for just in datos_editados.get("justificaciones_distractores", []):
-            opcion = just.get("opcion")
-            if opcion and opcion != clave:
-                distractores_texto.append(f"Opción {opcion}: {just.get('justificacion', 'N/A')}")
-        analisis_distractores = "\n".join(distractores_texto)
-
-        # 4. Preparar las instrucciones de gráficos (convierte JSON a string)
-        def get_grafico_json(data):
-            if not data or data == "[]" or data == []:
-                return "N/A"
-            # Usamos ensure_ascii=False para que no escape tildes (ej. \u00f3)
-            return json.dumps(data, ensure_ascii=False, indent=2)
-
-        inst_enunciado = get_grafico_json(datos_editados.get("descripcion_grafico_enunciado", []))
-        inst_a = get_grafico_json(datos_editados.get("opciones", {}).get("A", {}).get("descripcion_grafico", []))
-        inst_b = get_grafico_json(datos_editados.get("opciones", {}).get("B", {}).get("descripcion_grafico", []))
-        inst_c = get_grafico_json(datos_editados.get("opciones", {}).get("C", {}).get("descripcion_grafico", []))
-        inst_d = get_grafico_json(datos_editados.get("opciones", {}).get("D", {}).get("descripcion_grafico", []))
-
-        # 5. Definir todos los reemplazos (¡TODOS CON str()!)
-        reemplazos = {
-            "{{ItemPruebaId}}": str(taxonomia_seleccionada.get("Área", "N/A")),
-            "{{ItemGradoId}}": str(taxonomia_seleccionada.get("Grado", "N/A")), 
-            "{{CompetenciaNombre}}": str(taxonomia_seleccionada.get("Competencia", "N/A")),
-            "{{ComponenteNombre}}": str(taxonomia_seleccionada.get("Componente_Estructura", "N/A")),
-            "{{AfirmacionNombre}}": str(taxonomia_seleccionada.get("Afirmación", "N/A")),
-            "{{EvidenciaNombre}}": str(taxonomia_seleccionada.get("Evidencia", "N/A")),
-            "{{ItemContexto}}": "", 
-            "{{ItemEnunciado}}": str(datos_editados.get("pregunta_espejo", "N/A")),
-            "{{Opción A}}": str(datos_editados.get("opciones", {}).get("A", {}).get("texto", "N/A")),
-            "{{Opción B}}": str(datos_editados.get("opciones", {}).get("B", {}).get("texto", "N/A")),
-            "{{Opción C}}": str(datos_editados.get("opciones", {}).get("C", {}).get("texto", "N/A")),
-            "{{Opción D}}": str(datos_editados.get("opciones", {}).get("D", {}).get("texto", "N/A")),
-            "{{  Clave}}": str(clave),
-            "{{Justificacion_Correcta}}": str(datos_editados.get("justificacion_clave", "N/A")),
-            "{{Analisis_Distractores}}": str(analisis_distractores),
-            "{{Instrucciones_enuncuado}}": str(inst_enunciado),
-            "{{Instrucciones_A}}": str(inst_a),
-            "{{Instrucciones_B}}": str(inst_b),
-            "{{Instrucciones_C}}": str(inst_c),
-            "{{Instrucciones_D}}": str(inst_d),
-            "Enunciado: {{Instrucciones_D}}": str(inst_d), # Por si acaso
-            "{{Oportunidad_mejora}}": str(oportunidad_mejora)
-        }
-
-        # 6. Ejecutar los reemplazos
-        doc = reemplazar_texto_en_doc(doc, reemplazos)
-
-        # 7. Guardar el documento final en un nuevo buffer
-        final_buffer = io.BytesIO()
-        doc.save(final_buffer)
-        final_buffer.seek(0)
-        return final_buffer
-
-    except Exception as e:
-        st.error(f"Error al crear el documento Word: {e}")
-        return None
-
-
-# --- NUEVA FUNCIÓN PARA LEER EXCEL DESDE GCS ---
-@st.cache_data
-def leer_excel_desde_gcs(bucket_name, file_path):
+    estado = _estado_oportunidades()
+    justificacion_clave = str(justificacion_clave or "").strip()
+    clave = json.dumps([taxonomia_data, justificacion_clave, model_name], sort_keys=True, ensure_ascii=False, default=str)
+    with estado["lock"]:
+        futuro = estado["futuros"].get(clave)
+        if futuro is not None and futuro.done() and futuro.result() == OPORTUNIDAD_MEJORA_POR_DEFECTO:
+            futuro = None
+        if futuro is None:
+            futuro = estado["pool"].submit(generar_oportunidad_mejora_llm, dict(taxonomia_data), justificacion_clave, model_name)
+            estado["futuros"][clave] = futuro
+            while len(estado["futuros"]) > MAX_OPORTUNIDADES_MEMO:
+                estado["futuros"].popitem(last=False)
+        else:
+            estado["futuros"].move_to_end(clave)
+    return futuro
+
+
+# --- 2c. GENERACIÓN EN PARALELO DE LOS GRÁFICOS DEL ÍTEM ---
+# Claves de session_state de cada gráfico posible del ítem: enunciado + opciones A-D
+GRAFICOS_ITEM = [{
+    "etiqueta": "Enunciado",
+    "nec": "editable_grafico_nec_enunciado",
+    "texto": "editable_grafico_texto_enunciado",
+    "json": "editable_grafico_json_enunciado",
+    "img": "img_buffer_enunciado",
+}] + [{
+    "etiqueta": f"Opción {letra}",
+    "nec": f"editable_opcion_{letra.lower()}_grafico_nec",
+    "texto": f"editable_opcion_{letra.lower()}_grafico_texto",
+    "json": f"editable_opcion_{letra.lower()}_grafico_json",
+    "img": f"img_buffer_op_{letra}",
+} for letra in ["A", "B", "C", "D"]]
+
+MAX_HILOS_GRAFICOS = int(os.environ.get("GRAFICOS_MAX_HILOS", "5"))
+
+
+def generar_specs_en_paralelo(descripciones):
     """
-    Lee un archivo Excel (con todas sus hojas) directamente desde GCS.
+    Lanza build_visual_json_with_llm para todas las descripciones a la vez (pool de hilos acotado)
+    y va entregando (clave, spec, error) a medida que cada llamada termina.
+    El renderizado se deja al hilo llamador: pyplot no es seguro entre hilos.
     """
-    try:
-        storage_client = storage.Client(project=GCP_PROJECT) # Usa el proyecto ya inicializado
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(file_path)
-        
-        if not blob.exists():
-            st.error(f"Error: El archivo '{file_path}' no se encontró en el bucket '{bucket_name}'.")
-            return None
-            
-        file_bytes = blob.download_as_bytes()
-        # Cargar todas las hojas del Excel
-        data = pd.read_excel(io.BytesIO(file_bytes), sheet_name=None)
-        st.success(f"Éxito: Cargado '{file_path}' desde GCS.")
-        return data
-    except Exception as e:
-        st.error(f"Error al leer Excel desde GCS: {e}")
-        st.info("Asegúrate de que la cuenta de servicio de Streamlit tenga permisos de 'Storage Object Viewer' en el bucket 'bucket-espejos1'.")
-        return None
-# --- FIN DE LA NUEVA FUNCIÓN ---
+    if not descripciones:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_HILOS_GRAFICOS, len(descripciones)))) as pool:
+        futuros = {pool.submit(build_visual_json_with_llm, texto): clave for clave, texto in descripciones.items()}
+        for futuro in as_completed(futuros):
+            try:
+                yield futuros[futuro], futuro.result(), None
+            except Exception as e:
+                yield futuros[futuro], None, e
 
 
-# --- 2b. NUEVA FUNCIÓN: GENERADOR DE OPORTUNIDAD DE MEJORA ---
-def generar_oportunidad_mejora_llm(taxonomia_data, justificacion_clave, model_name):
+# --- 2d. GENERACIÓN ESPECULATIVA (varios candidatos en paralelo) ---
+# GENERADOR_CANDIDATOS: candidatos por defecto en la primera ronda (1 = flujo secuencial de siempre)
+# GENERADOR_MAX_CONCURRENCIA: llamadas simultáneas a Gemini por ronda
+# GENERADOR_PRESUPUESTO: máximo de generaciones por ítem (candidatos + reintentos con feedback)
+MAX_CANDIDATOS = int(os.environ.get("GENERADOR_MAX_CANDIDATOS", "4"))
+CANDIDATOS_POR_DEFECTO = max(1, min(MAX_CANDIDATOS, int(os.environ.get("GENERADOR_CANDIDATOS", "1"))))
+MAX_CONCURRENCIA_CANDIDATOS = int(os.environ.get("GENERADOR_MAX_CONCURRENCIA", "3"))
+PRESUPUESTO_GENERACIONES = int(os.environ.get("GENERADOR_PRESUPUESTO", "6"))
+
+def generar_candidatos_en_paralelo(n_candidatos, imagen_bytes, taxonomia_dict, contexto_adicional, modelo_gen, modelo_aud):
     """
-    Genera una breve recomendación académica basada en la habilidad evaluada.
+    Lanza n candidatos (generar + auditar) a la vez y entrega (indice, item_json_str, campos, audit_data)
+    a medida que cada uno termina. Al cerrar el generador (break tras el primer ✅ CUMPLE) se cancelan
+    los demás: los que no empezaron no se ejecutan y los que están en streaming se cortan en el siguiente trozo.
     """
+    cancelar = threading.Event()
+    ctx = get_script_run_ctx()
+    pool = ThreadPoolExecutor(
+        max_workers=max(1, min(n_candidatos, MAX_CONCURRENCIA_CANDIDATOS)),
+        initializer=add_script_run_ctx, initargs=(None, ctx)  # st.error desde los hilos
+    )
     try:
-        model = GenerativeModel(model_name)
-        
-        # Extraemos los datos clave para el prompt
-        evidencia = taxonomia_data.get("Evidencia", "la habilidad evaluada")
-        competencia = taxonomia_data.get("Competencia", "la competencia general")
-        
-        prompt = f"""
-        Eres un tutor académico experto. Tu tarea es escribir una breve recomendación (1-2 frases)
-        para un estudiante o profesor.
-        
-        HABILIDAD EVALUADA (Evidencia): {evidencia}
-        COMPETENCIA: {competencia}
-        JUSTIFICACIÓN DE LA RESPUESTA CORRECTA: {justificacion_clave}
-
-        Basado en esta información, escribe una recomendación fácil de aplicar durante clase.
-        Habla en tercera persona y manten un tono formal pero sencillo
-        NO uses más de 50 palabras.
-        """
-        
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    
-    except Exception as e:
-        print(f"Error al generar oportunidad de mejora: {e}")
-        return "Para mejorar en esta habilidad, repasa los conceptos clave de la competencia y practica con ejercicios similares."
-
+        futuros = {
+            pool.submit(generar_y_auditar_candidato, imagen_bytes, taxonomia_dict, contexto_adicional,
+                        modelo_gen, modelo_aud, cancelar): i
+            for i in range(1, n_candidatos + 1)
+        }
+        for futuro in as_completed(futuros):
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                print(f"❌ Candidato {futuros[futuro]} falló: {e}")
+                resultado = (None, None, None)
+            yield (futuros[futuro], *resultado)
+    finally:
+        cancelar.set()
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 # --- 4. INTERFAZ DE STREAMLIT (UI) ---
@@ -549,7 +236,7 @@ with col2:
     st.header("2. Configurar Generación")
 
     # --- Selección de Modelos ---
-    modelos_disponibles = ["gemini-2.5-pro", "gemini-2.5-flash","gemini-2.5-flash-lite"]
+    modelos_disponibles = MODELOS_DISPONIBLES
     st.subheader("Selección de Modelos")
     modelo_generador_sel = st.selectbox(
         "Modelo para Generar Ítem",
@@ -561,84 +248,69 @@ with col2:
         options=modelos_disponibles,
         index=0  # Flash por defecto
     )
+    n_candidatos = st.number_input(
+        "Candidatos en paralelo (modo especulativo)",
+        min_value=1, max_value=max(1, MAX_CANDIDATOS), value=CANDIDATOS_POR_DEFECTO,
+        help="Con más de 1 se generan y auditan varios ítems a la vez y se queda el primero aprobado."
+    )
     
     # --- MODIFICACIÓN: Cargar Excel desde GCS ---
     bucket_name = os.environ.get("GCS_BUCKET_NAME", "bucket-espejos1")
     excel_file_path = os.environ.get("EXCEL_TAXONOMY_PATH", "Estructura privados1.xlsx")
     
-    # Intentamos cargar los datos desde GCS
-    data = leer_excel_desde_gcs(bucket_name, excel_file_path)
+    # Intentamos cargar los datos desde GCS (versión vigente compartida; sin copia por sesión)
+    version_tax = obtener_taxonomia_vigente(bucket_name, excel_file_path)
+    data = version_tax["hojas"] if version_tax is not None else None
     # --- FIN DE MODIFICACIÓN ---
     
     grado_sel, area_sel, comp1_sel, comp2_sel, ref_sel, competen_sel, afirm_sel, evid_sel = (None,) * 8
+    hojas_tax = list(data.values()) if data is not None else []
     
     if data is not None: # Cambiamos 'excel_file is not None' por 'data is not None'
         try:
-            if 'df1' not in st.session_state or 'df2' not in st.session_state:
-                # data ya está cargado por la función de GCS
-                sheet_names = list(data.keys())
-                if len(sheet_names) < 2:
-                    st.error("Error: El archivo Excel debe tener al menos dos hojas.")
-                    data = None # Anulamos data para detener la ejecución
-                else:
-                    st.session_state.df1 = data[sheet_names[0]]
-                    st.session_state.df2 = data[sheet_names[1]]
-                    # La función leer_excel_desde_gcs ya muestra el st.success
-            
-            if 'df1' in st.session_state:
-                df1 = st.session_state.df1
-                df2 = st.session_state.df2
+            if len(hojas_tax) < 2:
+                st.error("Error: El archivo Excel debe tener al menos dos hojas.")
+                data = None # Anulamos data para detener la ejecución
+            else:
+                # Índice de la versión vigente: cada selectbox se resuelve con una búsqueda en dicts
+                if version_tax["indice"] is None:
+                    raise version_tax["error_indice"]
+                indice_tax = version_tax["indice"]
 
                 # --- Filtros Comunes ---
-                grados = df1['Grado'].unique()
+                grados = opciones_taxonomia(indice_tax, "h1")
                 grado_sel = st.selectbox("Grado", options=grados)
                 
-                df_grado_h1 = df1[df1['Grado'] == grado_sel]
-                areas = df_grado_h1['Área'].unique() # Con tilde
+                areas = opciones_taxonomia(indice_tax, "h1", grado_sel) # Con tilde
                 area_sel = st.selectbox("Área", options=areas) # Con tilde
 
                 # --- Cascada 1: (Hoja 1 - Estructura) ---
                 st.subheader("Taxonomía (Hoja 1 - Estructura)")
-                df_area_h1 = df_grado_h1[df_grado_h1['Área'] == area_sel]
-                componentes1 = df_area_h1['Componente1'].unique() 
+                componentes1 = opciones_taxonomia(indice_tax, "h1", grado_sel, area_sel)
                 comp1_sel = st.selectbox("Componente (Estructura)", options=componentes1) 
 
-                df_comp1 = df_area_h1[df_area_h1['Componente1'] == comp1_sel]
-                competencias = df_comp1['Competencia'].unique()
+                competencias = opciones_taxonomia(indice_tax, "h1", grado_sel, area_sel, comp1_sel)
                 competen_sel = st.selectbox("Competencia", options=competencias)
 
-                df_competencia = df_comp1[df_comp1['Competencia'] == competen_sel]
-                
-                if area_sel == 'Ciencias Naturales': 
-                    df_afirmacion_base = df_competencia[df_competencia['Componente1'] == comp1_sel]
-                else:
-                    df_afirmacion_base = df_competencia
-                    
-                afirmaciones = df_afirmacion_base['Afirmación'].unique()
+                # (En Ciencias Naturales la afirmación también depende del Componente1, que ya es parte de la ruta)
+                afirmaciones = opciones_taxonomia(indice_tax, "h1", grado_sel, area_sel, comp1_sel, competen_sel)
                 afirm_sel = st.selectbox("Afirmación", options=afirmaciones)
 
-                df_afirmacion = df_afirmacion_base[df_afirmacion_base['Afirmación'] == afirm_sel]
-                evidencias = df_afirmacion['Evidencia'].unique()
+                evidencias = opciones_taxonomia(indice_tax, "h1", grado_sel, area_sel, comp1_sel, competen_sel, afirm_sel)
                 evid_sel = st.selectbox("Evidencia", options=evidencias)
 
                 # --- Cascada 2: (Hoja 2 - Temática) ---
                 st.subheader("Taxonomía (Hoja 2 - Temática)")
-                df_area_h2 = df2[
-                    (df2['Grado'] == grado_sel) & 
-                    (df2['Área'] == area_sel) # Con tilde
-                ]
-                componentes2 = df_area_h2['Componente2'].unique()
+                componentes2 = opciones_taxonomia(indice_tax, "h2", grado_sel, area_sel)
                 comp2_sel = st.selectbox("Componente (Temática)", options=componentes2)
 
-                df_comp2 = df_area_h2[df_area_h2['Componente2'] == comp2_sel]
-                
-                refs = df_comp2['Ref. Temática'].unique() if not df_comp2.empty else ["N/A"] # Con tilde y espacio
+                refs = opciones_taxonomia(indice_tax, "h2", grado_sel, area_sel, comp2_sel) or ["N/A"] # Con tilde y espacio
                 ref_sel = st.selectbox("Ref. Temática", options=refs) # Con tilde y espacio
 
         except KeyError as e:
             st.error(f"Error de Columna: No se encontró la columna {e}. Revisa las tildes/mayúsculas.")
-            if 'df1' in st.session_state: st.error(f"Columnas H1: {list(st.session_state.df1.columns)}")
-            if 'df2' in st.session_state: st.error(f"Columnas H2: {list(st.session_state.df2.columns)}")
+            st.error(f"Columnas H1: {list(hojas_tax[0].columns)}")
+            st.error(f"Columnas H2: {list(hojas_tax[1].columns)}")
             data = None # Anulamos data para detener la ejecución
         except Exception as e:
             st.error(f"Error inesperado al procesar el Excel: {e}")
@@ -677,47 +349,79 @@ if st.button("🚀 Generar Ítem Espejo (con Auditoría)", use_container_width=T
         intento_actual = 0
         feedback_auditor = ""
         item_final_json = None
+        item_final_obj = None
 
-        with st.status("Iniciando proceso...", expanded=True) as status:
-            while intento_actual < max_intentos:
-                intento_actual += 1
-                
-                status.update(label=f"Intento {intento_actual}/{max_intentos}: Generando ítem con {modelo_generador_sel}...")
-                item_json_str = generar_item_llm(
-                    imagen_subida, 
-                    taxonomia_seleccionada,
-                    info_adicional,
-                    modelo_generador_sel, # <--- MODELO SELECCIONADO
-                    feedback_auditor 
-                )
-                
-                if item_json_str is None:
-                    status.update(label=f"Error en la generación (Intento {intento_actual}).", state="error")
-                    continue 
+        generaciones = 0
 
-                status.update(label=f"Intento {intento_actual}/{max_intentos}: Auditando ítem con {modelo_auditor_sel}...")
-                audit_json_str = auditar_item_llm(item_json_str, taxonomia_seleccionada, modelo_auditor_sel) # <--- MODELO SELECCIONADO
-
-                if audit_json_str is None:
-                    status.update(label=f"Error en la auditoría (Intento {intento_actual}).", state="error")
-                    continue 
+        with st.status("Iniciando proceso...", expanded=True) as status:
+            vista_previa = st.empty()
 
-                try:
-                    # --- FIX: Asegurarse de parsear la respuesta del auditor ---
-                    audit_data = json.loads(audit_json_str)
-                    
+            # --- Ronda especulativa: N candidatos a la vez, gana el primero aprobado ---
+            n_ronda = min(int(n_candidatos), PRESUPUESTO_GENERACIONES)
+            if n_ronda > 1:
+                intento_actual += 1
+                status.update(label=f"Generando {n_ronda} candidatos en paralelo con {modelo_generador_sel}...")
+                imagen_bytes = imagen_subida.getvalue()
+                for indice, item_json_str, campos, audit_data in generar_candidatos_en_paralelo(
+                    n_ronda, imagen_bytes, taxonomia_seleccionada, info_adicional,
+                    modelo_generador_sel, modelo_auditor_sel
+                ):
+                    if audit_data is None:
+                        st.write(f"Candidato {indice}: sin respuesta válida del generador o del auditor.")
+                        continue
                     if audit_data.get("dictamen_final") == "✅ CUMPLE":
-                        status.update(label="¡Auditoría Aprobada!", state="complete")
+                        status.update(label=f"¡Auditoría Aprobada! (candidato {indice})", state="complete")
                         item_final_json = item_json_str
-                        break 
-                    else:
+                        item_final_obj = campos or None
+                        with vista_previa.container():
+                            mostrar_vista_previa_item(campos or {})
+                        break  # cierra el generador: cancela al resto de candidatos
+                    if not feedback_auditor:
                         feedback_auditor = audit_data.get("observaciones_finales", "Rechazado sin observaciones.")
-                        status.update(label=f"Intento {intento_actual} Rechazado. Preparando re-intento...")
-                        st.expander(f"Detalles del Rechazo (Intento {intento_actual})").json(audit_data)
-                
-                except json.JSONDecodeError:
-                    st.error(f"Error al leer respuesta JSON del auditor: {audit_json_str}")
-                    feedback_auditor = "La respuesta del auditor no fue un JSON válido."
+                    st.write(f"Candidato {indice} rechazado.")
+                    st.expander(f"Detalles del Rechazo (Candidato {indice})").json(audit_data)
+                generaciones += n_ronda
+
+            # --- Reintentos secuenciales con la retroalimentación del auditor (mismo bucle que lote_items) ---
+            if item_final_json is None:
+                # Los campos llegan por streaming: se muestran al vuelo y se reutilizan sin volver a parsear
+                campos_recibidos = {}
+
+                def _al_recibir_campo(campo, valor):
+                    campos_recibidos[campo] = valor
+                    with vista_previa.container():
+                        mostrar_vista_previa_item(campos_recibidos)
+
+                def _al_avanzar(evento, intento, detalle=None):
+                    if evento == "generando":
+                        campos_recibidos.clear()
+                        status.update(label=f"Intento {intento}/{max_intentos}: Generando ítem con {modelo_generador_sel}...")
+                    elif evento == "error_generacion":
+                        status.update(label=f"Error en la generación (Intento {intento}).", state="error")
+                    elif evento == "rechazado_local":
+                        status.update(label=f"Intento {intento} Rechazado por las reglas locales. Preparando re-intento...")
+                        st.expander(f"Detalles del Rechazo (Intento {intento}, reglas locales)").json(detalle)
+                    elif evento == "auditando":
+                        status.update(label=f"Intento {intento}/{max_intentos}: Auditando ítem con {modelo_auditor_sel}...")
+                    elif evento == "error_auditoria":
+                        status.update(label=f"Error en la auditoría (Intento {intento}).", state="error")
+                    elif evento == "rechazado":
+                        status.update(label=f"Intento {intento} Rechazado. Preparando re-intento...")
+                        st.expander(f"Detalles del Rechazo (Intento {intento})").json(detalle)
+                    elif evento == "aprobado":
+                        status.update(label="¡Auditoría Aprobada!", state="complete")
+
+                resultado = producir_item(
+                    imagen_subida, taxonomia_seleccionada, info_adicional,
+                    modelo_generador_sel, modelo_auditor_sel,  # <--- MODELOS SELECCIONADOS
+                    max_intentos=max_intentos,
+                    al_recibir_campo=_al_recibir_campo, al_avanzar=_al_avanzar,
+                    intento_inicial=intento_actual, feedback_inicial=feedback_auditor,
+                    max_generaciones=PRESUPUESTO_GENERACIONES - generaciones
+                )
+                if resultado["aprobado"]:
+                    item_final_json, item_final_obj = resultado["item_json"], resultado["item"]
+                feedback_auditor = resultado["feedback"] or feedback_auditor
 
             if item_final_json is None:
                 status.update(label=f"No se pudo generar un ítem de alta calidad después de {max_intentos} intentos.", state="error")
@@ -727,7 +431,7 @@ if st.button("🚀 Generar Ítem Espejo (con Auditoría)", use_container_width=T
             st.success("¡Ítem generado y auditado con éxito! Puedes editarlo abajo.")
             try:
                 # --- FIX: Asegurarse de parsear la respuesta del generador ---
-                datos_obj = json.loads(item_final_json)
+                datos_obj = item_final_obj if item_final_obj is not None else json.loads(item_final_json)
                 st.session_state['resultado_json_obj'] = datos_obj
                 
                 # --- LÓGICA DE INICIALIZACIÓN (ACTUALIZADA para nuevo JSON con TEXTO) ---
@@ -763,6 +467,13 @@ if st.button("🚀 Generar Ítem Espejo (con Auditoría)", use_container_width=T
                 st.session_state.editable_just_d = justifs_map.get("D", "N/A")
                 
                 st.session_state.show_editor = True
+
+                # Adelanta en segundo plano la oportunidad de mejora mientras el usuario edita
+                solicitar_oportunidad_mejora(
+                    taxonomia_seleccionada,
+                    st.session_state.editable_just_clave,
+                    modelo_auditor_sel
+                )
                 
             except json.JSONDecodeError:
                 st.error(f"Error al parsear el JSON final: {item_final_json}")
@@ -772,6 +483,51 @@ if st.button("🚀 Generar Ítem Espejo (con Auditoría)", use_container_width=T
 if 'show_editor' in st.session_state and st.session_state.show_editor:
     st.divider()
     st.header("3. Edita el Ítem Generado")
+
+    # --- Botón global: JSON + imagen de TODOS los gráficos marcados con "SÍ", en paralelo ---
+    # (Va antes de los widgets del editor para poder escribir sus claves en session_state)
+    graficos_pendientes = [
+        g for g in GRAFICOS_ITEM
+        if st.session_state.get(g["nec"]) == "SÍ"
+        and str(st.session_state.get(g["texto"], "")).strip() not in ("", "N/A")
+    ]
+    if st.button(f"⚡ Generar todos los gráficos ({len(graficos_pendientes)})", key="btn_gen_todos_graficos",
+                 disabled=not graficos_pendientes):
+        if GRAFICOS_DISPONIBLES:
+            por_clave = {g["texto"]: g for g in graficos_pendientes}
+            descripciones = {g["texto"]: st.session_state[g["texto"]] for g in graficos_pendientes}
+            with st.status(f"Generando {len(descripciones)} gráficos en paralelo...", expanded=True) as status:
+                errores = 0
+                for clave_texto, spec, error in generar_specs_en_paralelo(descripciones):
+                    g = por_clave[clave_texto]
+                    if not spec:
+                        errores += 1
+                        st.session_state[g["img"]] = None
+                        detalle = f" ({error})" if error else ""
+                        status.write(f"❌ {g['etiqueta']}: la IA de plugins no pudo generar un JSON{detalle}.")
+                        continue
+                    st.session_state[g["json"]] = json.dumps([spec], indent=2)
+                    try:
+                        buffer_imagen = crear_grafico(
+                            tipo_grafico=spec.get("tipo_elemento"),
+                            datos=spec.get("datos", {}),
+                            configuracion=spec.get("configuracion", {}),
+                            formato="webp", dpi=GRAFICOS_DPI_PREVIA  # previsualización; el Word se renderiza a resolución de exportación
+                        )
+                    except Exception:
+                        buffer_imagen = None
+                    st.session_state[g["img"]] = buffer_imagen
+                    if buffer_imagen:
+                        status.write(f"✅ {g['etiqueta']}: JSON y gráfico generados.")
+                    else:
+                        errores += 1
+                        status.write(f"⚠️ {g['etiqueta']}: JSON generado, pero no se pudo renderizar el gráfico.")
+                status.update(
+                    label="Gráficos generados." if not errores else f"Gráficos generados con {errores} error(es).",
+                    state="complete" if not errores else "error"
+                )
+        else:
+            st.warning("El módulo 'graficos_plugins.py' no está disponible.")
     
     # --- ENUNCIADO Y GRÁFICO DEL ENUNCIADO ---
     st.subheader("Enunciado")
@@ -824,7 +580,8 @@ if 'show_editor' in st.session_state and st.session_state.show_editor:
                         buffer_imagen = crear_grafico(
                             tipo_grafico=spec.get("tipo_elemento"),
                             datos=spec.get("datos", {}),
-                            configuracion=spec.get("configuracion", {})
+                            configuracion=spec.get("configuracion", {}),
+                            formato="webp", dpi=GRAFICOS_DPI_PREVIA
                         )
                         if buffer_imagen:
                             st.session_state['img_buffer_enunciado'] = buffer_imagen
@@ -896,7 +653,8 @@ if 'show_editor' in st.session_state and st.session_state.show_editor:
                             buffer_imagen = crear_grafico(
                                 tipo_grafico=spec.get("tipo_elemento"),
                                 datos=spec.get("datos", {}),
-                                configuracion=spec.get("configuracion", {})
+                                configuracion=spec.get("configuracion", {}),
+                                formato="webp", dpi=GRAFICOS_DPI_PREVIA
                             )
                             if buffer_imagen:
                                 st.session_state[f'img_buffer_op_{letra}'] = buffer_imagen
@@ -967,39 +725,61 @@ if 'show_editor' in st.session_state and st.session_state.show_editor:
     # --- GENERAR DATOS ADICIONALES ANTES DE LA DESCARGA ---
     taxonomia_actual = st.session_state.get('taxonomia_actual', {})
     
-    with st.spinner("Generando oportunidad de mejora..."):
-        # 1. Generar Oportunidad de Mejora (una sola vez)
-        oportunidad_mejora = generar_oportunidad_mejora_llm(
-            taxonomia_actual,
-            datos_editados.get("justificacion_clave", ""),
-            modelo_auditor_sel # <-- Pasa el modelo del auditor
-        )
+    # 1. Oportunidad de Mejora (memoizada: solo se recalcula si cambian taxonomía, justificación o modelo)
+    futuro_oportunidad = solicitar_oportunidad_mejora(
+        taxonomia_actual,
+        datos_editados.get("justificacion_clave", ""),
+        modelo_auditor_sel # <-- Pasa el modelo del auditor
+    )
     # --- FIN DE CAMBIOS ---
 
-    col_word, col_excel = st.columns(2)
-    
-    with col_word:
-        # 2. Pasar la oportunidad_mejora a la función de Word
-        archivo_word = crear_word(datos_editados, taxonomia_actual, oportunidad_mejora)
-        st.download_button(
-            label="Descargar en Word (.docx)",
-            data=archivo_word,
-            file_name="item_espejo_auditado.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            use_container_width=True
-        )
+    # Los archivos se construyen SOLO cuando se piden y se reutilizan mientras el contenido
+    # editado (hash) no cambie; los reruns del editor ya no regeneran Word ni Excel.
+    hash_contenido = hashlib.sha256(json.dumps(
+        [datos_editados, taxonomia_actual, modelo_auditor_sel],
+        sort_keys=True, ensure_ascii=False, default=str
+    ).encode("utf-8")).hexdigest()
+    exportacion = st.session_state.get("exportacion_item")
+    if not exportacion or exportacion.get("hash") != hash_contenido:
+        exportacion = None
+        if st.button("📦 Preparar archivos para descargar", use_container_width=True, key="btn_preparar_descargas"):
+            with st.spinner("Preparando Word y Excel..."):
+                oportunidad_mejora = futuro_oportunidad.result()
+                # 2. Pasar la oportunidad_mejora a la función de Word
+                archivo_word = crear_word(datos_editados, taxonomia_actual, oportunidad_mejora)
+                # 3. Pasar los datos a la nueva función de Excel
+                archivo_excel = crear_excel(
+                    datos_editados, 
+                    taxonomia_actual, 
+                    oportunidad_mejora
+                )
+            exportacion = {
+                "hash": hash_contenido,
+                "word": archivo_word.getvalue() if archivo_word else None,
+                "excel": archivo_excel,
+            }
+            st.session_state["exportacion_item"] = exportacion
+
+    if exportacion:
+        col_word, col_excel = st.columns(2)
         
-    with col_excel:
-        # 3. Pasar los datos a la nueva función de Excel
-        archivo_excel = crear_excel(
-            datos_editados, 
-            taxonomia_actual, 
-            oportunidad_mejora
-        )
-        st.download_button(
-            label="Descargar en Excel (.xlsx)",
-            data=archivo_excel,
-            file_name="item_espejo_auditado.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
-        )
+        with col_word:
+            if exportacion["word"]:
+                st.download_button(
+                    label="Descargar en Word (.docx)",
+                    data=exportacion["word"],
+                    file_name="item_espejo_auditado.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    use_container_width=True
+                )
+            else:
+                st.error("No se pudo generar el documento Word.")
+            
+        with col_excel:
+            st.download_button(
+                label="Descargar en Excel (.xlsx)",
+                data=exportacion["excel"],
+                file_name="item_espejo_auditado.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de los plugins de graficos_plugins (sin conexión: backend Agg, sin Vertex AI).
+
+Renderiza cada plugin de PLUGIN_REGISTRY con especificaciones representativas en tres
+tamaños (pequeno, mediano, grande) y mide, por caso:
+
+- tiempo del primer render (incluye importar las dependencias del plugin) y mediana/mínimo
+  de --repeticiones renders siguientes (sin la caché de renders);
+- RSS pico del proceso y cuánto creció durante los renders (cada caso corre en su propio
+  subproceso para que el pico de memoria sea solo suyo);
+- tamaño del PNG y número de artistas de Matplotlib de la figura.
+
+Con --guardar-base se escribe la línea base (JSON) y con --base se compara contra ella:
+los casos que empeoran más de la tolerancia (o que antes funcionaban y ahora fallan) se
+marcan como regresión y el comando termina con código 1. La línea base depende de la
+máquina: se genera en cada entorno, no se versiona.
+
+Uso:
+    python benchmark_graficos.py --guardar-base base_graficos.json
+    python benchmark_graficos.py --base base_graficos.json --plugins tabla,heatmap --tamanos grande
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+
+import numpy as np
+
+TAMANOS = ("pequeno", "mediano", "grande")
+BASE_VERSION = 1
+
+# Tolerancias por defecto para marcar una regresión (fracción sobre la línea base)
+TOLERANCIA_TIEMPO = 0.25
+TOLERANCIA_MEMORIA = 0.25
+TOLERANCIA_PNG = 0.10
+# Diferencias absolutas por debajo de estas no cuentan (ruido de medición)
+MINIMO_TIEMPO_S = 0.01
+MINIMO_MEMORIA_MB = 5.0
+
+
+# ------------------ Corpus de especificaciones ------------------
+def _rng(semilla=0):
+    return np.random.RandomState(semilla)
+
+
+def _barras(n):
+    return ({"categorias": [f"C{i}" for i in range(n)], "valores": _rng().randint(1, 100, n).tolist()},
+            {"titulo": "Barras", "xticks_rotation": 90 if n > 10 else 0})
+
+
+def _circular(n):
+    return {"etiquetas": [f"Sector {i}" for i in range(n)], "valores": _rng().randint(1, 50, n).tolist()}, {}
+
+
+def _tabla(filas, columnas):
+    r = _rng()
+    palabras = ["área", "perímetro", "fracción", "promedio", "total", "gráfico", "estudiantes", "resultado"]
+    encabezado = [f"Columna {c + 1}" for c in range(columnas)]
+    cuerpo = [[" ".join(r.choice(palabras, r.randint(1, 6))) for _ in range(columnas)] for _ in range(filas)]
+    return {"matrix": [encabezado] + cuerpo}, {"title": "Tabla"}
+
+
+def _construccion(n):
+    r = _rng()
+    elementos = []
+    for i in range(n):
+        x, y = r.uniform(0, 10, 2).tolist()
+        tipo = i % 3
+        if tipo == 0:
+            elementos.append({"type": "point", "coords": [x, y], "config": {"marker": "o", "label": f"P{i}"}})
+        elif tipo == 1:
+            elementos.append({"type": "polygon", "coords": [[x, y], [x + 1, y], [x, y + 1]],
+                              "config": {"fill": False}})
+        else:
+            elementos.append({"type": "circle", "config": {"center": [x, y], "radius": 0.5, "fill": False}})
+    return {"elements": elementos}, {}
+
+
+def _arbol(niveles):
+    nodos = [str(i) for i in range(2 ** niveles - 1)]
+    aristas = [[str((i - 1) // 2), str(i)] for i in range(1, len(nodos))]
+    return {"nodes": nodos, "edges": aristas}, {"layout": "planar"}
+
+
+def _flujograma(n):
+    pasos = " -> ".join(f"p{i}" for i in range(n))
+    return {"dot_source": f"digraph G {{ rankdir=TB; {pasos}; }}"}, {}
+
+
+def _pictograma(categorias, filas):
+    valores = {f"Cat {i}": int(v) for i, v in enumerate(_rng().randint(5, 40, categorias))}
+    return {"values": valores}, {"rows": filas}
+
+
+def _xy(n):
+    r = _rng()
+    x = np.sort(r.uniform(0, 100, n))
+    return {"x": x.round(4).tolist(), "y": (np.sin(x / 7) * 10 + r.normal(0, 1, n)).round(4).tolist()}, {}
+
+
+def _hist(n):
+    return {"values": _rng().normal(50, 10, n).round(4).tolist()}, {"bins": 30}
+
+
+def _grupos(grupos, n):
+    r = _rng()
+    return {"data": [r.normal(i, 1 + i / 5, n).round(4).tolist() for i in range(grupos)]}, {}
+
+
+def _heatmap(n):
+    return {"matrix": _rng().randint(0, 100, (n, n)).tolist()}, {"annot": n <= 10}
+
+
+def _contorno(n):
+    g = np.linspace(-3, 3, n)
+    X, Y = np.meshgrid(g, g)
+    return {"x": g.round(4).tolist(), "y": g.round(4).tolist(), "z": (np.sin(X) * np.cos(Y)).round(4).tolist()}, {}
+
+
+def _superficie(n):
+    g = np.linspace(-2, 2, n)
+    X, Y = np.meshgrid(g, g)
+    return ({"X": X.round(4).tolist(), "Y": Y.round(4).tolist(), "Z": np.exp(-(X ** 2 + Y ** 2)).round(4).tolist()},
+            {"plot_type": "surface"})
+
+
+def _red(n):
+    r = _rng()
+    nodos = [f"N{i}" for i in range(n)]
+    aristas = [[f"N{i}", f"N{int(j)}"] for i in range(1, n) for j in r.choice(i, min(i, 2), replace=False)]
+    return {"nodes": nodos, "edges": aristas}, {"layout": "kamada_kawai", "node_size": 300}
+
+
+def _area(n):
+    x = np.arange(n)
+    return {"x": x.tolist(), "y": (np.abs(np.sin(x / 9)) * 10).round(4).tolist()}, {}
+
+
+def _radar(variables, series):
+    r = _rng()
+    return ({"labels": [f"V{i}" for i in range(variables)], "values": r.randint(1, 10, (series, variables)).tolist()},
+            {})
+
+
+def _venn(subsets):
+    return {"subsets": subsets}, {}
+
+
+def _fractal(lado):
+    return {"type": "mandelbrot", "config": {"width": lado, "height": lado, "max_iter": 80}}, {}
+
+
+CORPUS = {
+    "grafico_barras_verticales": {"pequeno": lambda: _barras(5), "mediano": lambda: _barras(40),
+                                  "grande": lambda: _barras(300)},
+    "grafico_circular": {"pequeno": lambda: _circular(3), "mediano": lambda: _circular(12),
+                         "grande": lambda: _circular(40)},
+    "tabla": {"pequeno": lambda: _tabla(4, 3), "mediano": lambda: _tabla(20, 4), "grande": lambda: _tabla(60, 6)},
+    "construccion_geometrica": {"pequeno": lambda: _construccion(3), "mediano": lambda: _construccion(30),
+                                "grande": lambda: _construccion(300)},
+    "diagrama_arbol": {"pequeno": lambda: _arbol(3), "mediano": lambda: _arbol(5), "grande": lambda: _arbol(7)},
+    "flujograma": {"pequeno": lambda: _flujograma(4), "mediano": lambda: _flujograma(20),
+                   "grande": lambda: _flujograma(100)},
+    "pictograma": {"pequeno": lambda: _pictograma(3, 10), "mediano": lambda: _pictograma(6, 20),
+                   "grande": lambda: _pictograma(10, 40)},
+    "scatter_plot": {"pequeno": lambda: _xy(100), "mediano": lambda: _xy(5000), "grande": lambda: _xy(100000)},
+    "line_plot": {"pequeno": lambda: _xy(100), "mediano": lambda: _xy(5000), "grande": lambda: _xy(100000)},
+    "histogram": {"pequeno": lambda: _hist(100), "mediano": lambda: _hist(10000), "grande": lambda: _hist(500000)},
+    "box_plot": {"pequeno": lambda: _grupos(3, 50), "mediano": lambda: _grupos(8, 1000),
+                 "grande": lambda: _grupos(20, 10000)},
+    "violin_plot": {"pequeno": lambda: _grupos(3, 50), "mediano": lambda: _grupos(8, 1000),
+                    "grande": lambda: _grupos(20, 10000)},
+    "heatmap": {"pequeno": lambda: _heatmap(8), "mediano": lambda: _heatmap(60), "grande": lambda: _heatmap(300)},
+    "contour_plot": {"pequeno": lambda: _contorno(20), "mediano": lambda: _contorno(100),
+                     "grande": lambda: _contorno(400)},
+    "3d_plot": {"pequeno": lambda: _superficie(10), "mediano": lambda: _superficie(40),
+                "grande": lambda: _superficie(120)},
+    "network_diagram": {"pequeno": lambda: _red(8), "mediano": lambda: _red(40), "grande": lambda: _red(150)},
+    "area_plot": {"pequeno": lambda: _area(50), "mediano": lambda: _area(2000), "grande": lambda: _area(50000)},
+    "radar_chart": {"pequeno": lambda: _radar(5, 1), "mediano": lambda: _radar(10, 3),
+                    "grande": lambda: _radar(24, 6)},
+    "venn_diagram": {"pequeno": lambda: _venn([10, 8, 3]), "mediano": lambda: _venn([10, 8, 3, 6, 2, 2, 1]),
+                     "grande": lambda: _venn([5000, 4000, 1200, 3500, 900, 800, 300])},
+    "fractal": {"pequeno": lambda: _fractal(100), "mediano": lambda: _fractal(400), "grande": lambda: _fractal(1000)},
+}
+
+
+# ------------------ Medición de un caso (subproceso) ------------------
+def _rss_pico_mb() -> float:
+    import resource
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024.0 * 1024.0) if sys.platform == "darwin" else pico / 1024.0  # bytes en macOS, KiB en Linux
+
+
+def _contar_artistas(plugin_key, datos, configuracion):
+    """Artistas de la figura que arma el plugin (None si el plugin devuelve una imagen ya rasterizada)."""
+    import graficos_plugins as gp
+    from pool_figuras import liberar_figura
+    resultado = gp.PLUGIN_REGISTRY[plugin_key](datos, configuracion)
+    if not (isinstance(resultado, tuple) and len(resultado) == 2):
+        return None
+    fig = resultado[0]
+    try:
+        return len(fig.findobj())
+    finally:
+        liberar_figura(fig)
+
+
+def medir_caso(plugin_key: str, tamano: str, repeticiones: int) -> dict:
+    """Mide un (plugin, tamaño) en el proceso actual. Pensado para correr en un subproceso limpio."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import graficos_plugins as gp
+
+    datos, configuracion = CORPUS[plugin_key][tamano]()
+    resultado = {"plugin": plugin_key, "tamano": tamano, "estado": "ok"}
+    salida = io.StringIO()  # los plugins informan sus errores con print
+    try:
+        with contextlib.redirect_stdout(salida):
+            t0 = time.perf_counter()
+            gp._cargar_dependencias(plugin_key)
+            resultado["importar_s"] = round(time.perf_counter() - t0, 4)
+            rss_inicial = _rss_pico_mb()
+
+            t0 = time.perf_counter()
+            buf = gp.crear_grafico(plugin_key, datos, configuracion, usar_cache=False)
+            resultado["primero_s"] = round(time.perf_counter() - t0, 4)
+            if buf is None:
+                raise RuntimeError("el plugin no generó imagen")
+            resultado["png_bytes"] = len(buf.getvalue())
+
+            tiempos = []
+            for _ in range(max(1, repeticiones)):
+                t0 = time.perf_counter()
+                gp.crear_grafico(plugin_key, datos, configuracion, usar_cache=False)
+                tiempos.append(time.perf_counter() - t0)
+            resultado["mediana_s"] = round(statistics.median(tiempos), 4)
+            resultado["minimo_s"] = round(min(tiempos), 4)
+            resultado["artistas"] = _contar_artistas(plugin_key, datos, configuracion)
+    except Exception as e:
+        lineas = [l for l in salida.getvalue().splitlines() if l.strip()]
+        resultado.update(estado="error", error=lineas[-1].lstrip("❌ ") if lineas else f"{type(e).__name__}: {e}")
+        return resultado
+    resultado["rss_pico_mb"] = round(_rss_pico_mb(), 1)
+    resultado["rss_delta_mb"] = round(resultado["rss_pico_mb"] - rss_inicial, 1)
+    return resultado
+
+
+def _correr_en_subproceso(plugin_key, tamano, repeticiones, timeout) -> dict:
+    entorno = dict(os.environ, MPLBACKEND="Agg", GRAFICOS_BACKEND="local", GRAFICOS_CACHE_DIR="")
+    comando = [sys.executable, os.path.abspath(__file__), "--caso", plugin_key, tamano,
+               "--repeticiones", str(repeticiones)]
+    try:
+        proceso = subprocess.run(comando, capture_output=True, text=True, timeout=timeout, env=entorno,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+    except subprocess.TimeoutExpired:
+        return {"plugin": plugin_key, "tamano": tamano, "estado": "error", "error": f"excedió {timeout:.0f}s"}
+    lineas = proceso.stdout.strip().splitlines()
+    try:
+        return json.loads(lineas[-1])
+    except (IndexError, ValueError):
+        detalle = (proceso.stderr.strip().splitlines() or ["sin salida"])[-1]
+        return {"plugin": plugin_key, "tamano": tamano, "estado": "error",
+                "error": f"el subproceso terminó con código {proceso.returncode}: {detalle}"}
+
+
+# ------------------ Línea base y comparación ------------------
+def entorno_actual() -> dict:
+    import matplotlib
+    return {"python": platform.python_version(), "matplotlib": matplotlib.__version__,
+            "numpy": np.__version__, "plataforma": platform.platform(), "cpus": os.cpu_count()}
+
+
+def _empeora(nuevo, base, tolerancia, minimo=0.0) -> bool:
+    if nuevo is None or base is None:
+        return False
+    return nuevo > base * (1 + tolerancia) and nuevo - base > minimo
+
+
+def comparar(resultados: dict, base: dict, tol_tiempo=TOLERANCIA_TIEMPO, tol_memoria=TOLERANCIA_MEMORIA,
+             tol_png=TOLERANCIA_PNG) -> list:
+    """Lista de regresiones [(caso, descripción)] de 'resultados' respecto de la línea base."""
+    regresiones = []
+    for caso, r in resultados.items():
+        b = base.get(caso)
+        if b is None:
+            continue
+        if b.get("estado") == "ok" and r.get("estado") != "ok":
+            regresiones.append((caso, f"antes funcionaba; ahora: {r.get('error')}"))
+            continue
+        if r.get("estado") != "ok" or b.get("estado") != "ok":
+            continue
+        if _empeora(r["mediana_s"], b["mediana_s"], tol_tiempo, MINIMO_TIEMPO_S):
+            regresiones.append((caso, f"tiempo {b['mediana_s']:.3f}s -> {r['mediana_s']:.3f}s"))
+        if _empeora(r["rss_delta_mb"], b["rss_delta_mb"], tol_memoria, MINIMO_MEMORIA_MB):
+            regresiones.append((caso, f"memoria +{b['rss_delta_mb']:.1f}MB -> +{r['rss_delta_mb']:.1f}MB"))
+        if _empeora(r["png_bytes"], b["png_bytes"], tol_png):
+            regresiones.append((caso, f"PNG {b['png_bytes']} -> {r['png_bytes']} bytes"))
+        if r.get("artistas") != b.get("artistas"):
+            regresiones.append((caso, f"artistas {b.get('artistas')} -> {r.get('artistas')} (cambió la figura)"))
+    return regresiones
+
+
+def _imprimir(resultados: dict) -> None:
+    print(f"{'caso':<38} {'1º (s)':>8} {'med (s)':>8} {'RSS pico':>9} {'Δ RSS':>7} {'PNG (KB)':>9} {'artistas':>8}")
+    for caso, r in resultados.items():
+        if r["estado"] != "ok":
+            print(f"{caso:<38} ❌ {r.get('error')}")
+            continue
+        artistas = "-" if r.get("artistas") is None else r["artistas"]
+        print(f"{caso:<38} {r['primero_s']:>8.3f} {r['mediana_s']:>8.3f} {r['rss_pico_mb']:>8.1f}M "
+              f"{r['rss_delta_mb']:>6.1f}M {r['png_bytes'] / 1024:>9.1f} {artistas:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sin conexión de los plugins de gráficos.")
+    parser.add_argument("--plugins", help="plugins separados por comas (por defecto, todos los registrados)")
+    parser.add_argument("--tamanos", default=",".join(TAMANOS), help="pequeno,mediano,grande")
+    parser.add_argument("--repeticiones", type=int, default=5, help="renders medidos por caso (tras el primero)")
+    parser.add_argument("--timeout", type=float, default=300, help="segundos máximos por caso")
+    parser.add_argument("--base", help="línea base JSON contra la que comparar")
+    parser.add_argument("--guardar-base", help="escribir los resultados como línea base JSON")
+    parser.add_argument("--tolerancia-tiempo", type=float, default=TOLERANCIA_TIEMPO)
+    parser.add_argument("--tolerancia-memoria", type=float, default=TOLERANCIA_MEMORIA)
+    parser.add_argument("--tolerancia-png", type=float, default=TOLERANCIA_PNG)
+    parser.add_argument("--caso", nargs=2, metavar=("PLUGIN", "TAMANO"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.caso:
+        print(json.dumps(medir_caso(args.caso[0], args.caso[1], args.repeticiones), ensure_ascii=False))
+        return 0
+
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    from graficos_plugins import PLUGIN_REGISTRY, _resolve_plugin_key
+
+    plugins = ([_resolve_plugin_key(p) for p in args.plugins.split(",") if p.strip()]
+               if args.plugins else sorted(PLUGIN_REGISTRY))
+    tamanos = [t.strip() for t in args.tamanos.split(",") if t.strip()]
+    desconocidos = [p for p in plugins if p not in PLUGIN_REGISTRY] + [t for t in tamanos if t not in TAMANOS]
+    if desconocidos:
+        parser.error(f"plugins o tamaños desconocidos: {', '.join(desconocidos)}")
+    sin_corpus = [p for p in plugins if p not in CORPUS]
+    if sin_corpus:
+        print(f"⚠️ Sin especificaciones de prueba (agrégalas a CORPUS): {', '.join(sin_corpus)}")
+
+    resultados = {}
+    for plugin_key in plugins:
+        if plugin_key not in CORPUS:
+            continue
+        for tamano in tamanos:
+            caso = f"{plugin_key}/{tamano}"
+            print(f"⏱️ {caso}...", file=sys.stderr)
+            resultados[caso] = _correr_en_subproceso(plugin_key, tamano, args.repeticiones, args.timeout)
+    _imprimir(resultados)
+
+    if args.guardar_base:
+        with open(args.guardar_base, "w", encoding="utf-8") as f:
+            json.dump({"version": BASE_VERSION, "entorno": entorno_actual(), "resultados": resultados},
+                      f, ensure_ascii=False, indent=2)
+        print(f"💾 Línea base guardada en '{args.guardar_base}'.")
+
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        if base.get("entorno") != entorno_actual():
+            print("⚠️ La línea base se generó en otro entorno; los tiempos pueden no ser comparables.")
+        regresiones = comparar(resultados, base.get("resultados", {}), args.tolerancia_tiempo,
+                               args.tolerancia_memoria, args.tolerancia_png)
+        if regresiones:
+            print(f"❌ {len(regresiones)} regresión(es) respecto de '{args.base}':")
+            for caso, detalle in regresiones:
+                print(f"   - {caso}: {detalle}")
+            return 1
+        print(f"✅ Sin regresiones respecto de '{args.base}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
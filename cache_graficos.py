@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Caché de dos niveles para los resultados del motor de gráficos.
+
+- Nivel 1: LRU en memoria del proceso, acotado por bytes.
+- Nivel 2 (opcional): directorio en disco que sobrevive a reinicios del contenedor
+  (p. ej. un volumen montado en Cloud Run).
+- Caducidad opcional (TTL) por entrada, contada desde que se escribió.
+
+Este módulo NO importa Matplotlib: un acierto devuelve los bytes guardados sin
+tocar pyplot.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def clave_canonica(*partes) -> str:
+    """Hash SHA-256 de la serialización JSON canónica (claves ordenadas) de las partes."""
+    payload = json.dumps(partes, sort_keys=True, ensure_ascii=False,
+                         separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheLRU:
+    """
+    Caché clave→bytes con un nivel LRU en memoria (presupuesto en bytes y,
+    opcionalmente, en nº de entradas) y un nivel opcional en disco.
+    Con ttl (segundos) las entradas caducan. Es segura entre hilos.
+    """
+
+    def __init__(self, nombre: str, max_bytes: int, directorio=None, max_bytes_disco: int = 0,
+                 max_entradas=None, ttl=None):
+        self.nombre = nombre
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entradas = int(max_entradas) if max_entradas else None
+        self.ttl = float(ttl) if ttl else None
+        self.directorio = directorio or None
+        self.max_bytes_disco = max(0, int(max_bytes_disco))
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self._bytes_disco = 0
+        self._lock = threading.Lock()
+        self._stats = {"aciertos_memoria": 0, "aciertos_disco": 0, "fallos": 0, "escrituras": 0,
+                       "desalojos": 0, "caducados": 0}
+
+        if self.directorio:
+            try:
+                os.makedirs(self.directorio, exist_ok=True)
+                self._bytes_disco = sum(size for _, size, _ in self._archivos_disco())
+            except OSError as e:
+                print(f"⚠️ Caché '{nombre}': disco deshabilitado ({e}).")
+                self.directorio = None
+
+    # ------------------ API pública ------------------
+    def obtener(self, clave: str):
+        """Devuelve los bytes guardados para la clave, o None si no están."""
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                valor, creado = entrada
+                if not self._caducado(creado):
+                    self._memoria.move_to_end(clave)
+                    self._stats["aciertos_memoria"] += 1
+                    return valor
+                self._quitar_memoria(clave)
+                self._stats["caducados"] += 1
+
+        leido = self._leer_disco(clave)
+        with self._lock:
+            if leido is None:
+                self._stats["fallos"] += 1
+                return None
+            valor, creado = leido
+            self._stats["aciertos_disco"] += 1
+            self._guardar_memoria(clave, valor, creado)
+        return valor
+
+    def guardar(self, clave: str, valor: bytes) -> None:
+        """Guarda los bytes en memoria y, si está configurado, en disco."""
+        if not isinstance(valor, (bytes, bytearray)):
+            raise TypeError("CacheLRU solo almacena bytes.")
+        valor = bytes(valor)
+        with self._lock:
+            self._stats["escrituras"] += 1
+            self._guardar_memoria(clave, valor, time.time())
+        self._escribir_disco(clave, valor)
+
+    def limpiar(self) -> None:
+        """Vacía el nivel en memoria (el disco se conserva)."""
+        with self._lock:
+            self._memoria.clear()
+            self._bytes_memoria = 0
+
+    def estadisticas(self) -> dict:
+        """Contadores de aciertos/fallos y ocupación de cada nivel."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "nombre": self.nombre,
+                "entradas_memoria": len(self._memoria),
+                "bytes_memoria": self._bytes_memoria,
+                "bytes_disco": self._bytes_disco if self.directorio else 0,
+            })
+        consultas = stats["aciertos_memoria"] + stats["aciertos_disco"] + stats["fallos"]
+        stats["tasa_aciertos"] = (stats["aciertos_memoria"] + stats["aciertos_disco"]) / consultas if consultas else 0.0
+        return stats
+
+    # ------------------ nivel en memoria ------------------
+    def _caducado(self, creado) -> bool:
+        return self.ttl is not None and time.time() - creado > self.ttl
+
+    def _quitar_memoria(self, clave):
+        entrada = self._memoria.pop(clave, None)
+        if entrada is not None:
+            self._bytes_memoria -= len(entrada[0])
+
+    def _guardar_memoria(self, clave, valor, creado):
+        """Inserta en el LRU y desaloja lo más antiguo hasta respetar el presupuesto (requiere lock)."""
+        if len(valor) > self.max_bytes:
+            return
+        self._quitar_memoria(clave)
+        self._memoria[clave] = (valor, creado)
+        self._bytes_memoria += len(valor)
+        while self._memoria and (self._bytes_memoria > self.max_bytes
+                                 or (self.max_entradas and len(self._memoria) > self.max_entradas)):
+            _, (viejo, _) = self._memoria.popitem(last=False)
+            self._bytes_memoria -= len(viejo)
+            self._stats["desalojos"] += 1
+
+    # ------------------ nivel en disco ------------------
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.bin")
+
+    def _archivos_disco(self):
+        """Lista (ruta, tamaño, mtime) de las entradas en disco."""
+        out = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".bin"):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            out.append((ruta, st.st_size, st.st_mtime))
+        return out
+
+    def _leer_disco(self, clave):
+        if not self.directorio:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            st = os.stat(ruta)
+            creado = st.st_mtime
+            if self._caducado(creado):
+                os.remove(ruta)
+                with self._lock:
+                    self._bytes_disco = max(0, self._bytes_disco - st.st_size)
+                    self._stats["caducados"] += 1
+                return None
+            with open(ruta, "rb") as f:
+                return f.read(), creado
+        except OSError:
+            return None
+
+    def _escribir_disco(self, clave, valor):
+        if not self.directorio:
+            return
+        ruta = self._ruta(clave)
+        tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            existia = os.path.exists(ruta)
+            with open(tmp, "wb") as f:
+                f.write(valor)
+            os.replace(tmp, ruta)  # escritura atómica: nunca se lee un archivo a medias
+        except OSError as e:
+            print(f"⚠️ Caché '{self.nombre}': no se pudo escribir en disco ({e}).")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if not existia:
+                self._bytes_disco += len(valor)
+            excedido = self.max_bytes_disco and self._bytes_disco > self.max_bytes_disco
+        if excedido:
+            self._podar_disco()
+
+    def _podar_disco(self):
+        """Borra las entradas escritas hace más tiempo hasta quedar en el 90% del presupuesto."""
+        archivos = sorted(self._archivos_disco(), key=lambda a: a[2])
+        total = sum(size for _, size, _ in archivos)
+        objetivo = int(self.max_bytes_disco * 0.9)
+        for ruta, size, _ in archivos:
+            if total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+                total -= size
+                with self._lock:
+                    self._stats["desalojos"] += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._bytes_disco = total
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de clientes de Google Cloud compartidos por todo el proceso.
+
+Crear un GenerativeModel, un storage.Client o un ChatVertexAI en cada llamada
+repite la resolución de credenciales y el establecimiento del canal (gRPC/HTTP).
+Aquí se crea UNO por modelo (y un único cliente de GCS) la primera vez que se pide
+y se reutiliza desde cualquier hilo o sesión de Streamlit.
+
+También gestiona la caché de los prefijos estáticos de los prompts (instrucciones
+del generador y del auditor) con Vertex AI context caching: ver generar_con_prefijo.
+
+Las librerías de Google se importan de forma diferida, para que importar este módulo
+sea barato (p. ej. desde los procesos de pool_render).
+"""
+import os
+import time
+import hashlib
+import threading
+from datetime import timedelta, timezone
+
+GCP_PROJECT = os.environ.get("GCP_PROJECT", "espejazos")
+GCP_LOCATION = os.environ.get("GCP_LOCATION", "us-central1")
+
+# Caché de prefijos de prompt (instrucciones estáticas como system_instruction):
+#   PROMPT_CACHE=vertex    -> Vertex AI context caching (CachedContent) con TTL y recreación
+#   PROMPT_CACHE=implicito -> solo system_instruction (caché implícita de Gemini por prefijo idéntico)
+PROMPT_CACHE = os.environ.get("PROMPT_CACHE", "vertex").lower().strip()
+PROMPT_CACHE_TTL_S = int(os.environ.get("PROMPT_CACHE_TTL_S", "3600"))
+PROMPT_CACHE_MARGEN_S = int(os.environ.get("PROMPT_CACHE_MARGEN_S", "120"))      # se recrea antes de vencer
+PROMPT_CACHE_REINTENTO_S = int(os.environ.get("PROMPT_CACHE_REINTENTO_S", "900"))  # tras un fallo al crearla
+# Vertex rechaza CachedContent por debajo de este tamaño; esos prefijos se quedan con la caché implícita
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", "2048"))
+
+_LOCK = threading.Lock()
+_MODELOS = {}
+_CHATS = {}
+_STORAGE = {}
+_PREFIJOS = {}
+_PREFIJOS_LOCKS = {}
+_VERTEX_INICIADO = False
+
+
+def iniciar_vertex(project: str = None, location: str = None) -> None:
+    """vertexai.init una sola vez por proceso."""
+    global _VERTEX_INICIADO
+    with _LOCK:
+        if _VERTEX_INICIADO:
+            return
+        import vertexai
+        vertexai.init(project=project or GCP_PROJECT, location=location or GCP_LOCATION)
+        _VERTEX_INICIADO = True
+
+
+def obtener_modelo(model_name: str):
+    """GenerativeModel compartido para el modelo dado (se crea en el primer uso)."""
+    modelo = _MODELOS.get(model_name)
+    if modelo is not None:
+        return modelo
+    from vertexai.generative_models import GenerativeModel
+    with _LOCK:
+        modelo = _MODELOS.get(model_name)
+        if modelo is None:
+            modelo = GenerativeModel(model_name)
+            _MODELOS[model_name] = modelo
+    return modelo
+
+
+def obtener_storage(project: str = None):
+    """storage.Client compartido (reutiliza credenciales y conexiones HTTP)."""
+    project = project or GCP_PROJECT
+    cliente = _STORAGE.get(project)
+    if cliente is not None:
+        return cliente
+    from google.cloud import storage
+    with _LOCK:
+        cliente = _STORAGE.get(project)
+        if cliente is None:
+            cliente = storage.Client(project=project)
+            _STORAGE[project] = cliente
+    return cliente
+
+
+def obtener_chat_vertex(model_name: str, temperature: float, max_output_tokens: int = 8192):
+    """ChatVertexAI (LangChain) compartido por (modelo, temperatura, tokens)."""
+    clave = (model_name, float(temperature), int(max_output_tokens))
+    chat = _CHATS.get(clave)
+    if chat is not None:
+        return chat
+    from langchain_google_vertexai import ChatVertexAI
+    with _LOCK:
+        chat = _CHATS.get(clave)
+        if chat is None:
+            chat = ChatVertexAI(
+                model_name=model_name,
+                temperature=temperature,
+                max_output_tokens=max_output_tokens,
+            )
+            _CHATS[clave] = chat
+    return chat
+
+
+def _huella(texto: str) -> str:
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+def _buscar_cache_existente(caching, model_name, nombre, ahora):
+    """Reutiliza un CachedContent vigente con el mismo nombre (p. ej. creado por otra instancia)."""
+    try:
+        for cc in caching.CachedContent.list():
+            if cc.display_name != nombre or not str(cc.model_name).endswith(model_name):
+                continue
+            if cc.expire_time.timestamp() - PROMPT_CACHE_MARGEN_S > ahora:
+                return cc
+    except Exception:
+        pass
+    return None
+
+
+def _tokens_prefijo(model_name: str, instrucciones: str):
+    """Tokens del prefijo según count_tokens (None si no se pudo contar)."""
+    try:
+        return obtener_modelo(model_name).count_tokens(instrucciones).total_tokens
+    except Exception:
+        return None
+
+
+def _es_prefijo_pequeno(error) -> bool:
+    texto = str(error).lower()
+    return "token" in texto and ("minimum" in texto or "min_total_token_count" in texto or "too small" in texto)
+
+
+def _prefijo_implicito(model_name: str, instrucciones: str, expira: float):
+    from vertexai.generative_models import GenerativeModel
+    return {"modelo": GenerativeModel(model_name, system_instruction=instrucciones), "expira": expira, "cache": None}
+
+
+def _crear_prefijo(model_name: str, instrucciones: str):
+    """Crea (o reutiliza) el CachedContent del prefijo; si no se puede, cae a system_instruction."""
+    from vertexai.generative_models import GenerativeModel
+    ahora = time.time()
+    if PROMPT_CACHE == "vertex":
+        tokens = _tokens_prefijo(model_name, instrucciones)
+        if tokens is not None and tokens < PROMPT_CACHE_MIN_TOKENS:
+            # Nunca alcanzará el mínimo: caché implícita para siempre, sin reintentos
+            print(f"ℹ️ Prefijo de {tokens} tokens para '{model_name}' (< {PROMPT_CACHE_MIN_TOKENS}); se usa caché implícita.")
+            return _prefijo_implicito(model_name, instrucciones, float("inf"))
+        try:
+            from vertexai.preview import caching
+            nombre = f"espejos-{model_name}-{_huella(instrucciones)}"
+            cc = _buscar_cache_existente(caching, model_name, nombre, ahora)
+            if cc is None:
+                cc = caching.CachedContent.create(
+                    model_name=model_name,
+                    system_instruction=instrucciones,
+                    ttl=timedelta(seconds=PROMPT_CACHE_TTL_S),
+                    display_name=nombre,
+                )
+            expira = cc.expire_time
+            if expira.tzinfo is None:
+                expira = expira.replace(tzinfo=timezone.utc)
+            return {"modelo": GenerativeModel.from_cached_content(cached_content=cc),
+                    "expira": expira.timestamp(), "cache": cc.resource_name}
+        except Exception as e:
+            if _es_prefijo_pequeno(e):
+                print(f"ℹ️ El prefijo de '{model_name}' no alcanza el mínimo de la caché de contexto; se usa caché implícita.")
+                return _prefijo_implicito(model_name, instrucciones, float("inf"))
+            # P. ej. región sin soporte o un error transitorio
+            print(f"⚠️ Caché de contexto no disponible para '{model_name}' ({e}); se usa caché implícita.")
+            # Se vuelve a intentar crearla pasados PROMPT_CACHE_REINTENTO_S (en segundo plano)
+            return _prefijo_implicito(model_name, instrucciones, ahora + PROMPT_CACHE_REINTENTO_S + PROMPT_CACHE_MARGEN_S)
+    # Modo implícito: el prefijo estático va primero (system_instruction) y Gemini lo cachea solo
+    return _prefijo_implicito(model_name, instrucciones, float("inf"))
+
+
+def _renovar_prefijo(clave, model_name: str, instrucciones: str, lock) -> None:
+    try:
+        _PREFIJOS[clave] = _crear_prefijo(model_name, instrucciones)
+    except Exception as e:
+        print(f"⚠️ No se pudo renovar el prefijo de '{model_name}': {e}")
+    finally:
+        lock.release()
+
+
+def obtener_modelo_con_prefijo(model_name: str, instrucciones: str):
+    """
+    GenerativeModel cuyo prefijo estático (instrucciones) no se reenvía completo en cada llamada:
+    vive en un CachedContent de Vertex que se recrea al acercarse su vencimiento.
+    Mientras la entrada actual siga vigente, la renovación corre en segundo plano y la
+    petición usa la actual; solo se espera cuando no hay ninguna utilizable.
+    """
+    clave = (model_name, _huella(instrucciones))
+    ahora = time.time()
+    entrada = _PREFIJOS.get(clave)
+    if entrada is not None and entrada["expira"] - PROMPT_CACHE_MARGEN_S > ahora:
+        return entrada["modelo"]
+    with _LOCK:
+        lock = _PREFIJOS_LOCKS.setdefault(clave, threading.Lock())
+    if entrada is not None and entrada["expira"] > ahora:
+        if lock.acquire(blocking=False):  # un solo hilo renueva cada prefijo
+            threading.Thread(target=_renovar_prefijo, args=(clave, model_name, instrucciones, lock),
+                             daemon=True, name="renovar-prefijo").start()
+        return entrada["modelo"]
+    with lock:  # un solo hilo (re)crea la caché de cada prefijo
+        entrada = _PREFIJOS.get(clave)
+        if entrada is None or entrada["expira"] <= time.time():
+            entrada = _crear_prefijo(model_name, instrucciones)
+            _PREFIJOS[clave] = entrada
+    return entrada["modelo"]
+
+
+def invalidar_prefijo(model_name: str, instrucciones: str) -> None:
+    """Olvida la caché del prefijo (p. ej. si Vertex ya la borró) para que se cree de nuevo."""
+    _PREFIJOS.pop((model_name, _huella(instrucciones)), None)
+
+
+def _es_cache_vencida(error) -> bool:
+    texto = str(error).lower()
+    return type(error).__name__ == "NotFound" or "cachedcontent" in texto or "cached content" in texto
+
+
+def _stream_con_reintento(model_name, instrucciones, contenido, kwargs):
+    emitio = False
+    try:
+        for chunk in obtener_modelo_con_prefijo(model_name, instrucciones).generate_content(contenido, stream=True, **kwargs):
+            emitio = True
+            yield chunk
+    except Exception as e:
+        if emitio or not _es_cache_vencida(e):
+            raise
+        invalidar_prefijo(model_name, instrucciones)
+        yield from obtener_modelo_con_prefijo(model_name, instrucciones).generate_content(contenido, stream=True, **kwargs)
+
+
+def generar_con_prefijo(model_name: str, instrucciones: str, contenido, stream: bool = False, **kwargs):
+    """
+    generate_content con el prefijo estático en caché y 'contenido' como sufijo variable.
+    Si la caché venció o fue borrada en Vertex, se recrea y se reintenta una vez.
+    """
+    if stream:
+        return _stream_con_reintento(model_name, instrucciones, contenido, kwargs)
+    try:
+        return obtener_modelo_con_prefijo(model_name, instrucciones).generate_content(contenido, **kwargs)
+    except Exception as e:
+        if not _es_cache_vencida(e):
+            raise
+        invalidar_prefijo(model_name, instrucciones)
+        return obtener_modelo_con_prefijo(model_name, instrucciones).generate_content(contenido, **kwargs)
+
+
+def precalentar(modelos=(), bucket_name: str = None, prefijos=()) -> dict:
+    """
+    Crea los clientes por adelantado y abre sus conexiones con una llamada barata
+    (count_tokens para Gemini, metadatos de un blob para GCS), de modo que la primera
+    petición real no pague la autenticación ni el handshake.
+    'prefijos' son pares (modelo, instrucciones): para cada uno se crea (o se reutiliza) el
+    CachedContent y el modelo que luego usa generar_con_prefijo.
+    Devuelve los segundos que tardó cada cliente; los fallos solo se informan.
+    """
+    tiempos = {}
+    for model_name in modelos:
+        t0 = time.perf_counter()
+        try:
+            obtener_modelo(model_name).count_tokens("ping")
+            tiempos[model_name] = round(time.perf_counter() - t0, 3)
+        except Exception as e:
+            print(f"⚠️ No se pudo precalentar el modelo '{model_name}': {e}")
+    for model_name, instrucciones in prefijos:
+        t0 = time.perf_counter()
+        try:
+            obtener_modelo_con_prefijo(model_name, instrucciones)
+            tiempos[f"{model_name}/prefijo-{_huella(instrucciones)}"] = round(time.perf_counter() - t0, 3)
+        except Exception as e:
+            print(f"⚠️ No se pudo precalentar el prefijo de '{model_name}': {e}")
+    if bucket_name:
+        t0 = time.perf_counter()
+        try:
+            obtener_storage().bucket(bucket_name).blob("__precalentar__").exists()
+            tiempos["storage"] = round(time.perf_counter() - t0, 3)
+        except Exception as e:
+            print(f"⚠️ No se pudo precalentar el cliente de GCS: {e}")
+    return tiempos
+
+
+def precalentar_en_segundo_plano(modelos=(), bucket_name: str = None, prefijos=()) -> threading.Thread:
+    """Lanza precalentar() en un hilo daemon para no retrasar el arranque de la app."""
+    hilo = threading.Thread(target=precalentar, args=(tuple(modelos), bucket_name, tuple(prefijos)),
+                            daemon=True, name="precalentar-clientes")
+    hilo.start()
+    return hilo
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Exportador de ítems a Excel por filas, con memoria constante.
+
+crear_excel armaba un DataFrame de una fila y escribía un libro completo con
+pd.ExcelWriter por cada ítem. ExportadorExcel abre UN libro de openpyxl en modo
+write-only (las filas se vuelcan a un XML temporal en vez de quedar en memoria) y
+agrega una fila por ítem, de modo que un banco de miles de ítems cabe en un solo
+archivo sin que la memoria crezca con el número de filas.
+
+Opcionalmente escribe en paralelo un CSV (fila a fila) y un Parquet (por lotes de
+filas, requiere pyarrow) con las mismas columnas, para cargarlos en otros sistemas.
+
+    with ExportadorExcel("banco.xlsx", COLUMNAS_EXCEL, csv="banco.csv") as exportador:
+        for fila in filas:
+            exportador.agregar(fila)
+"""
+import io
+import csv as csv_mod
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    PARQUET_DISPONIBLE = False
+
+FILAS_POR_LOTE_PARQUET = 1000
+
+# Mismo estilo de encabezado que pandas.DataFrame.to_excel
+_FUENTE_ENCABEZADO = Font(bold=True)
+_BORDE_ENCABEZADO = Border(*(Side(style="thin"),) * 4)
+_ALINEACION_ENCABEZADO = Alignment(horizontal="center", vertical="top")
+
+
+def _celda_texto(valor):
+    """Valor apto para una celda/columna de texto (None -> '', sin caracteres de control ilegales en XML)."""
+    if valor is None:
+        return ""
+    if isinstance(valor, (int, float)):
+        return valor
+    return ILLEGAL_CHARACTERS_RE.sub("", str(valor))
+
+
+class ExportadorExcel:
+    """
+    Libro de Excel (una hoja) al que se le agregan filas con agregar(); cerrar() lo guarda.
+    'destino' es una ruta o un archivo binario (p. ej. BytesIO). 'csv' y 'parquet' (rutas,
+    opcionales) reciben las mismas filas.
+    """
+
+    def __init__(self, destino, columnas, hoja="Item Generado", csv=None, parquet=None,
+                 filas_por_lote_parquet=FILAS_POR_LOTE_PARQUET):
+        self.destino = destino
+        self.columnas = list(columnas)
+        self.filas = 0
+        self._libro = Workbook(write_only=True)
+        self._hoja = self._libro.create_sheet(hoja)
+        self._hoja.append([self._encabezado(c) for c in self.columnas])
+
+        self._csv_archivo = None
+        self._csv = None
+        if csv:
+            # utf-8-sig: Excel abre el CSV con las tildes bien
+            self._csv_archivo = open(csv, "w", encoding="utf-8-sig", newline="")
+            self._csv = csv_mod.writer(self._csv_archivo)
+            self._csv.writerow(self.columnas)
+
+        self._parquet = None
+        self._lote_parquet = []
+        self._filas_por_lote = max(1, int(filas_por_lote_parquet))
+        if parquet:
+            if PARQUET_DISPONIBLE:
+                esquema = pa.schema([(c, pa.string()) for c in self.columnas])
+                self._parquet = pq.ParquetWriter(parquet, esquema)
+            else:
+                print("⚠️ pyarrow no está instalado; no se escribirá la salida Parquet.")
+        self._cerrado = False
+
+    def _encabezado(self, texto):
+        celda = WriteOnlyCell(self._hoja, value=texto)
+        celda.font = _FUENTE_ENCABEZADO
+        celda.border = _BORDE_ENCABEZADO
+        celda.alignment = _ALINEACION_ENCABEZADO
+        return celda
+
+    def agregar(self, fila: dict) -> None:
+        """Agrega una fila (dict columna -> valor; las columnas que falten quedan vacías)."""
+        if self._cerrado:
+            raise ValueError("El exportador ya fue cerrado.")
+        valores = [_celda_texto(fila.get(c)) for c in self.columnas]
+        self._hoja.append(valores)
+        if self._csv is not None:
+            self._csv.writerow(valores)
+        if self._parquet is not None:
+            self._lote_parquet.append(valores)
+            if len(self._lote_parquet) >= self._filas_por_lote:
+                self._volcar_parquet()
+        self.filas += 1
+
+    def _volcar_parquet(self):
+        if not self._lote_parquet:
+            return
+        columnas = list(zip(*self._lote_parquet))
+        tabla = pa.table({c: pa.array([str(v) for v in columnas[i]], type=pa.string())
+                          for i, c in enumerate(self.columnas)})
+        self._parquet.write_table(tabla)
+        self._lote_parquet = []
+
+    def cerrar(self):
+        """Guarda el libro y cierra las salidas auxiliares. Con destino BytesIO devuelve sus bytes."""
+        if self._cerrado:
+            return None
+        self._cerrado = True
+        try:
+            self._libro.save(self.destino)
+        finally:
+            if self._csv_archivo is not None:
+                self._csv_archivo.close()
+            if self._parquet is not None:
+                self._volcar_parquet()
+                self._parquet.close()
+        if isinstance(self.destino, io.BytesIO):
+            return self.destino.getvalue()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
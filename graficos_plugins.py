@@ -1,26 +1,75 @@
 # -*- coding: utf-8 -*-
+import time
+_T0_IMPORT = time.perf_counter()
+
 import os
 import io
 import json
 import re
+import importlib
+import tempfile
+import functools
+import threading
+import unicodedata
+from typing import TYPE_CHECKING
 
 # Visualización y Datos
+# Las dependencias pesadas (pyplot, mplot3d, matplotlib_venn, networkx, graphviz, shapely,
+# LangChain/Vertex) NO se importan aquí: cada plugin declara las suyas en register_chart(deps=...)
+# y se cargan la primera vez que se renderiza ese tipo de gráfico (ver _cargar_dependencias).
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Polygon as mpl_Polygon, Circle as mpl_Circle, FancyArrowPatch as mpl_FancyArrowPatch
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib_venn import venn2, venn3
-import networkx as nx
-import graphviz
-from shapely.geometry import LineString, Polygon
-
-# IA (LangChain)
-from langchain.prompts import PromptTemplate
-import vertexai
-from langchain_google_vertexai import ChatVertexAI
+
+if TYPE_CHECKING:
+    from langchain_google_vertexai import ChatVertexAI
+
+from cache_graficos import CacheLRU, clave_canonica
+from pool_figuras import liberar_figura
 
 PLUGIN_REGISTRY = {}
 PLUGIN_ALIASES = {}
+PLUGIN_META = {}       # key -> {"deps": (módulos...), "cargado": bool}
+IMPORT_REPORT = {}     # módulo -> segundos que tomó su primera importación
+_IMPORT_LOCK = threading.Lock()
+
+PYPLOT = "matplotlib.pyplot"
+
+# Caché de renders (PNG) indexada por el hash canónico de la especificación.
+# Subir RENDER_CACHE_VERSION invalida el nivel en disco cuando cambie la salida de los plugins.
+RENDER_CACHE_VERSION = 2
+RENDER_CACHE = CacheLRU(
+    "render",
+    max_bytes=float(os.environ.get("GRAFICOS_CACHE_MB", "64")) * 1024 * 1024,
+    directorio=os.environ.get("GRAFICOS_CACHE_DIR") or None,
+    max_bytes_disco=float(os.environ.get("GRAFICOS_CACHE_DISCO_MB", "512")) * 1024 * 1024,
+)
+
+# Caché persistente descripción→spec JSON del LLM (clave: descripción normalizada, modelo y temperatura).
+SPEC_CACHE = CacheLRU(
+    "specs",
+    max_bytes=float(os.environ.get("SPEC_CACHE_MB", "8")) * 1024 * 1024,
+    directorio=os.environ.get("SPEC_CACHE_DIR", os.path.join(tempfile.gettempdir(), "espejazos_specs")) or None,
+    max_bytes_disco=float(os.environ.get("SPEC_CACHE_DISCO_MB", "64")) * 1024 * 1024,
+    max_entradas=int(os.environ.get("SPEC_CACHE_MAX_ENTRADAS", "2000")),
+    ttl=float(os.environ.get("SPEC_CACHE_TTL_S", str(7 * 24 * 3600))),
+)
+
+# Backend de renderizado: "local" (pyplot en este proceso) o "procesos" (pool_render.py)
+GRAFICOS_BACKEND = os.environ.get("GRAFICOS_BACKEND", "local").lower().strip()
+
+# Formatos de salida de crear_grafico. Las previsualizaciones de la app se piden en WebP a
+# GRAFICOS_DPI_PREVIA (rápidas y livianas); la exportación (Word, lotes) a GRAFICOS_DPI_EXPORTACION.
+FORMATOS_GRAFICO = {"png": "image/png", "svg": "image/svg+xml", "pdf": "application/pdf", "webp": "image/webp"}
+GRAFICOS_DPI_PREVIA = float(os.environ.get("GRAFICOS_DPI_PREVIA", "72"))
+GRAFICOS_DPI_EXPORTACION = float(os.environ.get("GRAFICOS_DPI_EXPORTACION", "150"))
+# WebP sin pérdida por defecto: con colores planos y texto es más liviano (y rápido) que con pérdida
+GRAFICOS_WEBP_SIN_PERDIDA = os.environ.get("GRAFICOS_WEBP_SIN_PERDIDA", "1").strip().lower() not in ("0", "false", "no")
+GRAFICOS_WEBP_CALIDAD = int(os.environ.get("GRAFICOS_WEBP_CALIDAD", "80"))
+FORMATOS_VECTORIALES = ("svg", "pdf")
+# Codificación PNG: nivel de zlib (0-9); GRAFICOS_PNG_OPTIMIZAR pasa a paleta las imágenes con
+# <= 256 colores sin perder información; GRAFICOS_PNG_COLORES > 0 cuantiza (con pérdida) a ese número.
+GRAFICOS_PNG_COMPRESION = max(0, min(9, int(os.environ.get("GRAFICOS_PNG_COMPRESION", "6"))))
+GRAFICOS_PNG_OPTIMIZAR = os.environ.get("GRAFICOS_PNG_OPTIMIZAR", "1").strip().lower() not in ("0", "false", "no")
+GRAFICOS_PNG_COLORES = max(0, min(256, int(os.environ.get("GRAFICOS_PNG_COLORES", "0"))))
 
 def _escape_braces(text: str) -> str:
     """Duplica llaves para que LangChain no las trate como variables en el prompt."""
@@ -36,41 +85,98 @@ def _init_vertex() -> None:
     pass # La dejamos vacía para que no haga nada.
 
 
-def _get_llm() -> ChatVertexAI:
-    """Retorna un ChatVertexAI (Gemini en Vertex) listo para usar."""
+def _llm_config():
+    """Modelo y temperatura del LLM de especificaciones (desde env vars)."""
+    # Puedes ajustar el modelo si lo necesitas
+    model_name = os.environ.get("VERTEX_MODEL", "gemini-2.5-flash")
+    temperature = float(os.environ.get("LLM_TEMPERATURE", "0.2"))
+    return model_name, temperature
+
+
+def _get_llm() -> "ChatVertexAI":
+    """Retorna el ChatVertexAI (Gemini en Vertex) compartido del proceso (ver clientes_gcp)."""
     
     # --- CORRECCIÓN: YA NO LLAMAMOS A _init_vertex() ---
     # La conexión ya fue inicializada por app.py
     
-    # Puedes ajustar el modelo si lo necesitas
-    model_name = os.environ.get("VERTEX_MODEL", "gemini-2.5-flash") 
-    temperature = float(os.environ.get("LLM_TEMPERATURE", "0.2"))
-    return ChatVertexAI(
-        model_name=model_name,
-        temperature=temperature,
-        max_output_tokens=8192,
-    )
+    _importar("langchain_google_vertexai")
+    from clientes_gcp import obtener_chat_vertex
 
-def register_chart(name, *aliases):
-    """Decorador para registrar una función como un plugin para crear gráficos."""
+    model_name, temperature = _llm_config()
+    return obtener_chat_vertex(model_name, temperature, max_output_tokens=8192)
+
+def register_chart(name, *aliases, deps=(PYPLOT,)):
+    """
+    Decorador para registrar una función como un plugin para crear gráficos.
+    deps: módulos pesados que el plugin necesita; se importan en su primer render.
+    """
     def _inner(func):
         key = str(name).lower().strip()
         PLUGIN_REGISTRY[key] = func
+        PLUGIN_META[key] = {"deps": tuple(deps), "cargado": False}
         for a in aliases:
             PLUGIN_ALIASES[str(a).lower().strip()] = key
         return func
     return _inner
 
+
+def _importar(modulo: str):
+    """Importa un módulo registrando cuánto tardó su primera importación."""
+    with _IMPORT_LOCK:
+        if modulo not in IMPORT_REPORT:
+            t0 = time.perf_counter()
+            importlib.import_module(modulo)
+            IMPORT_REPORT[modulo] = time.perf_counter() - t0
+            if os.environ.get("GRAFICOS_IMPORT_REPORT"):
+                print(f"⏱️ import {modulo}: {IMPORT_REPORT[modulo] * 1000:.0f} ms")
+    return importlib.import_module(modulo)
+
+
+def _cargar_dependencias(plugin_key: str) -> None:
+    """Importa (una sola vez) las dependencias declaradas por el plugin."""
+    meta = PLUGIN_META.get(plugin_key)
+    if meta is None or meta["cargado"]:
+        return
+    for modulo in meta["deps"]:
+        _importar(modulo)
+    meta["cargado"] = True
+
+
+def precargar_plugins(tipos=None) -> None:
+    """Importa por adelantado las dependencias de los plugins indicados (o de todos)."""
+    for tipo in (tipos if tipos is not None else list(PLUGIN_REGISTRY)):
+        try:
+            _cargar_dependencias(_resolve_plugin_key(tipo))
+        except ImportError as e:
+            print(f"⚠️ No se pudieron precargar las dependencias de '{tipo}': {e}")
+
+
+def reporte_importaciones() -> dict:
+    """
+    Reporte de tiempos de importación para detectar regresiones de arranque en frío:
+    tiempo del propio módulo, módulos pesados cargados y plugins aún sin cargar.
+    """
+    return {
+        "modulo_s": _TIEMPO_IMPORT_MODULO,
+        "dependencias_s": dict(sorted(IMPORT_REPORT.items(), key=lambda kv: kv[1], reverse=True)),
+        "plugins_cargados": sorted(k for k, m in PLUGIN_META.items() if m["cargado"]),
+        "plugins_pendientes": sorted(k for k, m in PLUGIN_META.items() if not m["cargado"]),
+    }
+
 def _resolve_plugin_key(tipo: str) -> str:
     """Resuelve un nombre o alias al nombre oficial del plugin."""
     t = str(tipo).lower().strip()
     return PLUGIN_ALIASES.get(t, t)
 
-def ensure_fig_ax(ax=None, **kwargs):
-    """Asegura que tengamos una figura y ejes de Matplotlib para dibujar."""
+def ensure_fig_ax(ax=None, figsize=None, projection=None):
+    """
+    Asegura que tengamos una figura y ejes de Matplotlib para dibujar. Sin 'ax', la figura
+    sale del pool de figuras Agg (pool_figuras.py), no de pyplot: el plugin no debe usar
+    funciones de estado de pyplot (plt.xticks, plt.colorbar, plt.tight_layout...), sino fig/ax.
+    """
     if ax is None:
-        fig, ax = plt.subplots(**kwargs)
-        return fig, ax
+        from pool_figuras import tomar_figura
+        return tomar_figura(figsize, projection)
     return ax.get_figure(), ax
 
 
@@ -91,13 +197,7 @@ def plugin_grafico_barras_verticales(datos: dict, configuracion: dict, ax=None,
       4) "series": [{"x":[...],"y":[...]}]
       5) CSV: "A,B,C" y "12,9,15"
     """
-    import matplotlib.pyplot as plt
-
-    # --- Normalizar fig/ax sin suponer tipo del 3er argumento ---
-    if ax is None:
-        fig, ax = plt.subplots(figsize=(6, 4))
-    else:
-        fig = ax.get_figure()
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
 
     def _split_csv(x):
         if isinstance(x, str) and "," in x:
@@ -221,10 +321,11 @@ def plugin_grafico_barras_verticales(datos: dict, configuracion: dict, ax=None,
     ax.set_title((configuracion or {}).get("titulo", "Gráfico de Barras"), pad=10)
     ax.set_xlabel((configuracion or {}).get("xlabel", "Categoría"))
     ax.set_ylabel((configuracion or {}).get("ylabel", "Valor"))
-    plt.xticks(
-        rotation=(configuracion or {}).get("xticks_rotation", 0),
-        ha=(configuracion or {}).get("xticks_ha", "center")
-    )
+    for etiqueta in ax.get_xticklabels():
+        etiqueta.set(
+            rotation=(configuracion or {}).get("xticks_rotation", 0),
+            ha=(configuracion or {}).get("xticks_ha", "center")
+        )
     return fig, ax
 
 
@@ -232,14 +333,14 @@ def plugin_grafico_barras_verticales(datos: dict, configuracion: dict, ax=None,
 
 # 2) grafico_circular
 @register_chart("grafico_circular", "pie")
-def plugin_circular(datos, configuracion, debug=False):
+def plugin_circular(datos, configuracion, debug=False, ax=None):
     text_keys = [k for k, v in datos.items() if isinstance(v, list) and all(isinstance(x, str) for x in v)]
     num_keys  = [k for k, v in datos.items() if isinstance(v, list) and all(isinstance(x, (int, float)) for x in v)]
     if len(text_keys) != 1 or len(num_keys) != 1:
         raise ValueError("Se requiere 1 lista de etiquetas (texto) y 1 lista numérica.")
     labels_key, values_key = text_keys[0], num_keys[0]
     labels, sizes = datos[labels_key], datos[values_key]
-    fig, ax = plt.subplots(figsize=(6, 4))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
     ax.pie(
         sizes,
         labels=labels,
@@ -254,18 +355,215 @@ def plugin_circular(datos, configuracion, debug=False):
     return fig, ax
 
 
+# --- Maquetado de texto para tablas ---
+# El ancho de cada texto se mide una vez por (texto, tamaño, peso, familia, dpi) y queda en una
+# caché compartida entre renders; los cortes de palabras largas se buscan por bisección.
+TABLA_CACHE_ANCHOS = int(os.environ.get("TABLA_CACHE_ANCHOS", "50000"))
+
+
+@functools.lru_cache(maxsize=8)
+def _renderer_medicion(dpi: float):
+    """RendererAgg mínimo: mide texto igual que el canvas, sin dibujar la figura."""
+    from matplotlib.backends.backend_agg import RendererAgg
+    return RendererAgg(1, 1, dpi)
+
+
+@functools.lru_cache(maxsize=TABLA_CACHE_ANCHOS)
+def _ancho_texto_px(texto: str, fontsize: float, weight: str, familia: tuple, dpi: float) -> float:
+    from matplotlib.font_manager import FontProperties
+    fp = FontProperties(family=list(familia), size=fontsize, weight=weight)
+    w, _, _ = _renderer_medicion(dpi).get_text_width_height_descent(texto, fp, ismath=False)
+    return w
+
+
+def medidor_texto(fontsize: float, dpi: float, weight: str = "normal"):
+    """Devuelve una función texto -> ancho en px (con caché) para la fuente por defecto de rcParams."""
+    import matplotlib
+    familia = tuple(matplotlib.rcParams["font.family"])
+    fontsize, dpi = float(fontsize), float(dpi)
+
+    def medir(texto: str) -> float:
+        return _ancho_texto_px(texto, fontsize, weight, familia, dpi)
+    return medir
+
+
+def estadisticas_cache_anchos() -> dict:
+    info = _ancho_texto_px.cache_info()
+    return {"aciertos": info.hits, "fallos": info.misses, "entradas": info.currsize, "max_entradas": info.maxsize}
+
+
+def _corte_maximo(palabra: str, max_px: float, medir) -> int:
+    """Largo del prefijo más largo de 'palabra' que cabe en max_px (al menos 1 carácter)."""
+    lo, hi = 1, len(palabra)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if medir(palabra[:mid]) <= max_px:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def ajustar_texto_px(texto, max_px: float, medir) -> str:
+    """Inserta '\n' para no exceder max_px; parte palabras largas si es necesario."""
+    words = str(texto).replace("\r", " ").replace("\n", " ").split()
+    if not words:
+        return " "
+    lines, line = [], ""
+    for w in words:
+        cand = (line + " " + w) if line else w
+        if medir(cand) <= max_px:
+            line = cand
+            continue
+        if line:
+            lines.append(line)
+        # La palabra no cabe junto a la línea anterior: se parte en trozos que quepan solos
+        while len(w) > 1 and medir(w) > max_px:
+            n = _corte_maximo(w, max_px, medir)
+            lines.append(w[:n])
+            w = w[n:]
+        line = w
+    if line:
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# --- Tabla con Pillow ---
+# configuracion["motor"] = "pillow" (o TABLA_MOTOR=pillow): la tabla se maqueta directamente
+# (mismo ajuste de texto, col_widths y cabecera) y se rasteriza con Pillow, sin un artista de
+# Matplotlib por celda. Si el contenido no cabe en la altura de figsize, la imagen crece con él
+# (el motor Matplotlib comprime las filas y el texto se enciman).
+TABLA_MOTOR = os.environ.get("TABLA_MOTOR", "matplotlib").lower().strip()
+TABLA_DPI = 100          # el mismo dpi con que se guardan las figuras de Matplotlib
+TABLA_INTERLINEADO = 1.2  # linespacing por defecto de Matplotlib
+TABLA_PAD_PX = 10
+
+
+@functools.lru_cache(maxsize=16)
+def _fuente_pillow(weight: str, size_px: int):
+    """Fuente TrueType de Pillow con la misma familia que usa Matplotlib (rcParams)."""
+    from PIL import ImageFont
+    try:
+        from matplotlib.font_manager import FontProperties, findfont
+        ruta = findfont(FontProperties(weight=weight), fallback_to_default=True)
+        # Layout BASIC: sin shaping complejo (raqm), de sobra para texto latino y mucho más rápido
+        return ImageFont.truetype(ruta, size_px, layout_engine=ImageFont.Layout.BASIC)
+    except Exception:
+        return ImageFont.load_default(size_px)
+
+
+@functools.lru_cache(maxsize=TABLA_CACHE_ANCHOS)
+def _ancho_pillow_px(texto: str, weight: str, size_px: int) -> float:
+    return _fuente_pillow(weight, size_px).getlength(texto)
+
+
+def _pt_a_px(pt: float, dpi: float = TABLA_DPI) -> int:
+    return max(1, int(round(pt * dpi / 72.0)))
+
+
+def maquetar_tabla(headers, rows, fracciones, figsize, title, fontsize=9, cellLoc="left",
+                   header_weight=1.25, row_extra=0.0, title_pad=14, dpi=TABLA_DPI) -> dict:
+    """
+    Posiciones en px de la tabla: {ancho, alto, titulo, celdas, lineas_grilla}. Cada celda es
+    {x, y, w, h, lineas, negrita, alinear}. No dibuja nada (ver rasterizar_tabla).
+    """
+    size_px = _pt_a_px(fontsize, dpi)
+    size_titulo = _pt_a_px(fontsize * 1.2 + 1.2, dpi)  # ≈ axes.titlesize 'large' relativo al texto
+    alto_linea = size_px * TABLA_INTERLINEADO
+    margen = int(0.1 * dpi)
+
+    ancho = int(round(figsize[0] * dpi))
+    ancho_tabla = ancho - 2 * margen
+    total = float(sum(fracciones)) or 1.0
+    bordes_x = [margen]
+    for f in fracciones:
+        bordes_x.append(bordes_x[-1] + ancho_tabla * f / total)
+
+    def _ajustar(fila, weight):
+        medir = lambda t: _ancho_pillow_px(t, weight, size_px)
+        return [ajustar_texto_px(texto, max(12, (bordes_x[c + 1] - bordes_x[c]) - 2 * TABLA_PAD_PX), medir).split("\n")
+                for c, texto in enumerate(fila)]
+
+    filas = [(_ajustar(headers, "bold"), True)] + [(_ajustar(r, "normal"), False) for r in rows]
+
+    y = margen + size_titulo + title_pad * dpi / 72.0
+    titulo = {"texto": str(title), "x": ancho / 2.0, "y": margen, "size_px": size_titulo}
+    alturas = []
+    for i, (lineas_fila, _) in enumerate(filas):
+        n = max(len(l) for l in lineas_fila) if lineas_fila else 1
+        peso = n * header_weight if i == 0 else n + row_extra
+        alturas.append(max(peso, 1.0) * alto_linea + 2 * (alto_linea * 0.4))
+    # Si el contenido cabe en la altura de figsize, las filas se estiran para llenarla (como el
+    # motor Matplotlib); si no, la imagen crece en lugar de encimar las filas
+    disponible = figsize[1] * dpi - y - margen
+    if sum(alturas) < disponible:
+        alturas = [h * disponible / sum(alturas) for h in alturas]
+
+    celdas, bordes_y = [], [y]
+    for (lineas_fila, negrita), h in zip(filas, alturas):
+        for c, lineas in enumerate(lineas_fila):
+            celdas.append({"x": bordes_x[c], "y": y, "w": bordes_x[c + 1] - bordes_x[c], "h": h,
+                           "lineas": lineas, "negrita": negrita, "alinear": cellLoc})
+        y += h
+        bordes_y.append(y)
+
+    alto = int(round(y + margen))
+    return {"ancho": ancho, "alto": alto, "dpi": dpi, "size_px": size_px, "alto_linea": alto_linea,
+            "titulo": titulo, "celdas": celdas, "bordes_x": bordes_x, "bordes_y": bordes_y}
+
+
+def rasterizar_tabla(maqueta: dict, formato: str = "PNG") -> io.BytesIO:
+    """Dibuja una maqueta de maquetar_tabla con Pillow y la devuelve como imagen en un BytesIO."""
+    from PIL import Image, ImageDraw
+
+    img = Image.new("L", (maqueta["ancho"], maqueta["alto"]), 255)  # solo negro sobre blanco
+    draw = ImageDraw.Draw(img)
+    size_px, alto_linea = maqueta["size_px"], maqueta["alto_linea"]
+
+    t = maqueta["titulo"]
+    if t["texto"]:
+        draw.text((t["x"], t["y"]), t["texto"], fill=0, anchor="mt",
+                  font=_fuente_pillow("normal", t["size_px"]))
+
+    for celda in maqueta["celdas"]:
+        fuente = _fuente_pillow("bold" if celda["negrita"] else "normal", size_px)
+        padx = 0.02 * celda["w"]
+        if celda["alinear"] == "right":
+            x, anchor = celda["x"] + celda["w"] - padx, "rm"
+        elif celda["alinear"] == "center":
+            x, anchor = celda["x"] + celda["w"] / 2.0, "mm"
+        else:
+            x, anchor = celda["x"] + padx, "lm"
+        lineas = celda["lineas"]
+        y0 = celda["y"] + celda["h"] / 2.0 - alto_linea * (len(lineas) - 1) / 2.0
+        for k, linea in enumerate(lineas):
+            draw.text((x, y0 + k * alto_linea), linea, fill=0, anchor=anchor, font=fuente)
+
+    # Grilla: una línea por borde (no un rectángulo por celda); la cabecera con trazo más grueso
+    bx, by = maqueta["bordes_x"], maqueta["bordes_y"]
+    for x in bx:
+        draw.line([(round(x), round(by[0])), (round(x), round(by[-1]))], fill=0, width=1)
+    for i, y in enumerate(by):
+        draw.line([(round(bx[0]), round(y)), (round(bx[-1]), round(y))], fill=0, width=2 if i <= 1 else 1)
+
+    buf = io.BytesIO()
+    img.save(buf, format=formato, dpi=(maqueta["dpi"], maqueta["dpi"]))
+    buf.seek(0)
+    return buf
+
+
 # 3) tabla
 @register_chart("tabla", "table")
 def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
     """
     Tabla con ajuste automático de texto por celda (multilínea real) y clip.
     Parche rápido: ignora cualquier tercer argumento posicional que NO sea un Axes.
+    El Axes también puede llegar como ax=... (como en los demás plugins).
     Retorna (fig, ax).
     """
     import re
     import numpy as np
     import matplotlib.pyplot as plt
-    from matplotlib.font_manager import FontProperties
     from matplotlib.axes import Axes
 
     # ------------------ Parche rápido: aceptar 'ax' solo si es Axes ------------------
@@ -276,15 +574,10 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
             ax = cand  # usar el Axes si realmente lo pasaron
         else:
             ax = None  # ignorar cosas como True/False, etc.
+    if ax is None and isinstance(kwargs.get("ax"), Axes):
+        ax = kwargs["ax"]
 
     # ------------------ utilidades internas ------------------
-    def _ensure_fig_ax(ax=None, figsize=(8, 5)):
-        if ax is None:
-            fig, ax = plt.subplots(figsize=figsize)
-        else:
-            fig = ax.figure
-        return fig, ax
-
     def _parse_figsize(fs):
         """Admite (w,h), [w,h], '11x6.5', '11×6.5', '11,6.5', '[11,6.5]'."""
         if fs is None:
@@ -320,34 +613,6 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
         s = sum(vals) or 1.0
         return [v / s for v in vals]
 
-    def _measure_px(renderer, fp, text: str) -> float:
-        w, _, _ = renderer.get_text_width_height_descent(text, fp, ismath=False)
-        return w
-
-    def _wrap_to_px(renderer, fp, text: str, max_px: float) -> str:
-        """Inserta '\n' para no exceder max_px; parte palabras largas si es necesario."""
-        words = str(text).replace("\r", " ").replace("\n", " ").split()
-        if not words:
-            return " "
-        lines, line = [], ""
-        for w in words:
-            cand = (line + " " + w).strip() if line else w
-            if _measure_px(renderer, fp, cand) <= max_px:
-                line = cand
-            else:
-                if line:
-                    lines.append(line); line = ""
-                chunk = ""
-                for ch in w:
-                    if _measure_px(renderer, fp, chunk + ch) <= max_px or not chunk:
-                        chunk += ch
-                    else:
-                        lines.append(chunk); chunk = ch
-                line = chunk
-        if line:
-            lines.append(line)
-        return "\n".join(lines)
-
     # ------------------ validar datos ------------------
     matrix = datos.get("matrix")
     if not (isinstance(matrix, list) and matrix and all(isinstance(r, (list, tuple)) for r in matrix)):
@@ -381,7 +646,34 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
         fig_h = max(4.5, min(14.0, 0.55 * (nrows + 1)))
         fs = (fig_w, fig_h)
 
-    fig, ax = _ensure_fig_ax(ax, figsize=fs)
+    # ------------------ anchos de columna ------------------
+    col_widths = _parse_col_widths(cfg.get("col_widths"), ncols)
+    if col_widths is None:
+        # heurística por nº de caracteres
+        max_chars = []
+        for c in range(ncols):
+            col_vals = [headers[c]] + [rows[i][c] for i in range(nrows)]
+            max_chars.append(max(len(str(x)) for x in col_vals) if col_vals else 1)
+        total = float(sum(max_chars)) or 1.0
+        norm = [max(min_col_frac, min(max_col_frac, m / total)) for m in max_chars]
+        s = sum(norm) or 1.0
+        norm = [w / s * 0.98 for w in norm]
+    else:
+        norm = [max(min_col_frac, min(max_col_frac, float(w))) for w in col_widths]
+        s = sum(norm) or 1.0
+        norm = [w / s * 0.98 for w in norm]
+
+    # ------------------ motor alternativo: Pillow (sin artistas de Matplotlib) ------------------
+    # En SVG/PDF se usa siempre Matplotlib para que la tabla salga vectorial
+    motor = str(cfg.get("motor", TABLA_MOTOR)).lower().strip()
+    if motor in ("pillow", "pil") and ax is None and cfg.get("formato") not in FORMATOS_VECTORIALES:
+        maqueta = maquetar_tabla(headers, rows, norm, fs, title, fontsize=fontsize, cellLoc=cellLoc,
+                                 header_weight=header_weight, row_extra=row_extra,
+                                 title_pad=int(cfg.get("title_pad", 14)),
+                                 dpi=float(cfg.get("dpi") or TABLA_DPI))
+        return rasterizar_tabla(maqueta)
+
+    fig, ax = ensure_fig_ax(ax, figsize=fs)
     try:
         plt.rcParams["text.usetex"] = False
     except Exception:
@@ -403,32 +695,13 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
     for (r, c), cell in table.get_celld().items():
         cell.set_linewidth(0.8 if r == 0 else 0.5)
 
-    # ------------------ anchos de columna ------------------
-    col_widths = _parse_col_widths(cfg.get("col_widths"), ncols)
-    if col_widths is None:
-        # heurística por nº de caracteres
-        max_chars = []
-        for c in range(ncols):
-            col_vals = [headers[c]] + [rows[i][c] for i in range(nrows)]
-            max_chars.append(max(len(str(x)) for x in col_vals) if col_vals else 1)
-        total = float(sum(max_chars)) or 1.0
-        norm = [max(min_col_frac, min(max_col_frac, m / total)) for m in max_chars]
-        s = sum(norm) or 1.0
-        norm = [w / s * 0.98 for w in norm]
-    else:
-        norm = [max(min_col_frac, min(max_col_frac, float(w))) for w in col_widths]
-        s = sum(norm) or 1.0
-        norm = [w / s * 0.98 for w in norm]
     for (r, c), cell in table.get_celld().items():
         cell.set_width(norm[c])
 
-    # ------------------ 1er draw: medidas y wrapping ------------------
-    fig.canvas.draw()
-    renderer = fig.canvas.get_renderer()
-    fp = FontProperties(size=fontsize)
+    # ------------------ medidas y wrapping (sin dibujar la figura) ------------------
+    medir = medidor_texto(fontsize, fig.dpi)
 
-    axes_bb   = ax.get_window_extent(renderer=renderer)
-    axes_px_w = axes_bb.width
+    axes_px_w = ax.get_window_extent().width
     pad_px    = 10
     col_px    = [max(12, axes_px_w * float(norm[c]) - 2 * pad_px) for c in range(ncols)]
 
@@ -436,7 +709,7 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
     wrapped_header = []
     max_header_lines = 1
     for c in range(ncols):
-        w = _wrap_to_px(renderer, fp, headers[c], col_px[c])
+        w = ajustar_texto_px(headers[c], col_px[c], medir)
         wrapped_header.append(w)
         max_header_lines = max(max_header_lines, w.count("\n") + 1)
 
@@ -447,7 +720,7 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
         row_wrapped = []
         max_lines = 1
         for c in range(ncols):
-            w = _wrap_to_px(renderer, fp, rows[r][c], col_px[c])
+            w = ajustar_texto_px(rows[r][c], col_px[c], medir)
             row_wrapped.append(w)
             max_lines = max(max_lines, w.count("\n") + 1)
         wrapped_rows.append(row_wrapped)
@@ -461,7 +734,7 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
         for c in range(ncols):
             table[r, c].set_height(h)
 
-    # ------------------ 2º draw y overlay multilínea con clip ------------------
+    # ------------------ único draw (posiciona las celdas) y overlay multilínea con clip ------------------
     fig.canvas.draw()
 
     def _place_text(r, c, text, bold=False):
@@ -486,7 +759,7 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
         ax.text(
             xx, yy, text if text else " ",
             fontsize=fontsize, weight="bold" if bold else "normal",
-            ha=ha, va="center", wrap=True,
+            ha=ha, va="center",  # ya viene ajustado a la celda (sin wrap de Matplotlib)
             transform=ax.transAxes,
             clip_path=clip_rect, clip_on=True, zorder=6
         )
@@ -504,14 +777,15 @@ def plugin_tabla(datos: dict, configuracion: dict, *maybe_ax, **kwargs):
             _place_text(r + 1, c, wrapped_rows[r][c], bold=False)
 
     ax.set_title(title, pad=int(cfg.get("title_pad", 14)))
-    fig.canvas.draw()
-    plt.tight_layout()
+    fig.tight_layout()
     return fig, ax
 
 # 4) construccion_geometrica
-@register_chart("construccion_geometrica")
-def plugin_construccion(datos, configuracion, debug=False):
-    fig, ax = plt.subplots(figsize=(6, 6))
+@register_chart("construccion_geometrica", deps=(PYPLOT, "matplotlib.patches", "shapely.geometry"))
+def plugin_construccion(datos, configuracion, debug=False, ax=None):
+    from matplotlib.patches import Polygon as mpl_Polygon, Circle as mpl_Circle, FancyArrowPatch as mpl_FancyArrowPatch
+    from shapely.geometry import LineString, Polygon
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 6))
     ax.set_aspect('equal', adjustable='box')
     ax.set_title(configuracion.get("titulo", "Construcción Geométrica"), pad=10)
     min_x, max_x = float('inf'), float('-inf'); min_y, max_y = float('inf'), float('-inf')
@@ -578,8 +852,10 @@ def plugin_construccion(datos, configuracion, debug=False):
 
 
 # 5) diagrama_arbol (DOT opcional)
-@register_chart("diagrama_arbol")
-def plugin_arbol(datos, configuracion, debug=False):
+@register_chart("diagrama_arbol", deps=(PYPLOT, "graphviz", "networkx"))
+def plugin_arbol(datos, configuracion, debug=False, ax=None):
+    import networkx as nx
+    import graphviz
     if 'dot_source' in datos and isinstance(datos.get('dot_source'), str):
         try:
             dot = graphviz.Source(datos['dot_source'])
@@ -590,7 +866,7 @@ def plugin_arbol(datos, configuracion, debug=False):
             print(f"❌ DOT error: {e}; uso networkx.")
 
     # networkx fallback
-    fig, ax = plt.subplots(figsize=(8, 6))
+    fig, ax = ensure_fig_ax(ax, figsize=(8, 6))
     ax.set_title(configuracion.get("titulo", "Diagrama de Árbol"), pad=10); ax.axis('off')
     G = nx.DiGraph() if configuracion.get('directed', False) else nx.Graph()
     if 'nodes' in datos: G.add_nodes_from(datos['nodes'])
@@ -628,8 +904,9 @@ def plugin_arbol(datos, configuracion, debug=False):
 
 
 # 6) flujograma (DOT puro)
-@register_chart("flujograma")
+@register_chart("flujograma", deps=("graphviz",))
 def plugin_flujograma(datos, configuracion, debug=False):
+    import graphviz
     dot_src = datos.get("dot_source")
     if not isinstance(dot_src, str):
         raise ValueError("Para flujograma se requiere 'dot_source' (str).")
@@ -644,19 +921,24 @@ def plugin_flujograma(datos, configuracion, debug=False):
 
 # 7) pictograma (Waffle; fallback)
 @register_chart("pictograma", "waffle")
-def plugin_pictograma(datos, configuracion, debug=False):
+def plugin_pictograma(datos, configuracion, debug=False, ax=None):
+    import matplotlib.pyplot as plt
     values = datos.get('values'); colors = datos.get('colors'); rows = int(configuracion.get('rows', 10))
     show_legend = configuracion.get('show_legend', True)
     legend_loc = configuracion.get('legend_loc', 'lower left'); legend_bbox = configuracion.get('legend_bbox', (0, -0.1))
     if not isinstance(values, dict) or not values:
         raise ValueError("'values' debe ser dict no vacío.")
     try:
+        if ax is not None:
+            raise TypeError("pywaffle crea su propia figura; con 'ax' se usa el fallback manual")
         from pywaffle import Waffle
-        fig = plt.figure(FigureClass=Waffle, rows=rows, values=values, colors=colors,
-                         legend={'loc': legend_loc, 'bbox_to_anchor': legend_bbox} if show_legend else None)
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Waffle(rows=rows, values=values, colors=colors,
+                     legend={'loc': legend_loc, 'bbox_to_anchor': legend_bbox} if show_legend else None)
+        FigureCanvasAgg(fig)  # sin pyplot, como las figuras del pool
         ax = fig.axes[0]; ax.set_title(configuracion.get("titulo", "Pictograma (Waffle)"), pad=10)
         return fig, ax
-    except Exception as e:
+    except Exception:
         # Fallback manual
         cols = int(configuracion.get('cols', 10)); total = sum(values.values()); total_tiles = rows * cols
         tile_counts = {}; acc = 0
@@ -668,7 +950,7 @@ def plugin_pictograma(datos, configuracion, debug=False):
         while diff != 0 and keys_sorted:
             k0 = keys_sorted[i % len(keys_sorted)]; tile_counts[k0] += 1 if diff > 0 else -1
             diff += -1 if diff > 0 else 1; i += 1
-        fig, ax = plt.subplots(figsize=(6, 6))
+        fig, ax = ensure_fig_ax(ax, figsize=(6, 6))
         ax.set_title(configuracion.get("titulo", "Pictograma"), pad=10)
         ax.set_xlim(0, cols); ax.set_ylim(0, rows); ax.set_aspect('equal'); ax.axis('off')
         if not colors or len(colors) < len(values):
@@ -688,11 +970,11 @@ def plugin_pictograma(datos, configuracion, debug=False):
 
 # 8) scatter_plot
 @register_chart("scatter_plot")
-def plugin_scatter(datos, configuracion, debug=False):
+def plugin_scatter(datos, configuracion, debug=False, ax=None):
     x, y = datos.get('x'), datos.get('y')
     if not (isinstance(x, list) and isinstance(y, list) and len(x) == len(y)):
         raise ValueError("'x' y 'y' deben ser listas de igual longitud.")
-    fig, ax = plt.subplots(figsize=(6, 4))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
     if configuracion.get('use_seaborn', False):
         try:
             import seaborn as sns
@@ -709,11 +991,11 @@ def plugin_scatter(datos, configuracion, debug=False):
 
 # 9) line_plot
 @register_chart("line_plot")
-def plugin_line(datos, configuracion, debug=False):
+def plugin_line(datos, configuracion, debug=False, ax=None):
     x, y = datos.get('x'), datos.get('y')
     if not (isinstance(x, list) and isinstance(y, list) and len(x) == len(y)):
         raise ValueError("'x' y 'y' deben ser listas de igual longitud.")
-    fig, ax = plt.subplots(figsize=(6, 4))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
     if configuracion.get('use_seaborn', False):
         try:
             import seaborn as sns
@@ -732,11 +1014,11 @@ def plugin_line(datos, configuracion, debug=False):
 
 # 10) histogram
 @register_chart("histogram")
-def plugin_hist(datos, configuracion, debug=False):
+def plugin_hist(datos, configuracion, debug=False, ax=None):
     values = datos.get('values')
     if not (isinstance(values, list) and values):
         raise ValueError("'values' debe ser lista no vacía.")
-    fig, ax = plt.subplots(figsize=(6, 4))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
     if configuracion.get('use_seaborn', False):
         try:
             import seaborn as sns
@@ -752,7 +1034,7 @@ def plugin_hist(datos, configuracion, debug=False):
 
 # 11) box_plot
 @register_chart("box_plot")
-def plugin_box(datos, configuracion, debug=False):
+def plugin_box(datos, configuracion, debug=False, ax=None):
     data = datos.get('data'); labels = configuracion.get('labels')
     if data is None and any(isinstance(v, list) for v in datos.values()):
         keys = [k for k, v in datos.items() if isinstance(v, list)]
@@ -760,7 +1042,7 @@ def plugin_box(datos, configuracion, debug=False):
         if labels is None: labels = keys
     if not (isinstance(data, list) and all(isinstance(lst, list) for lst in data)):
         raise ValueError("Use 'data' como lista de listas o pase dict de listas (se normaliza).")
-    fig, ax = plt.subplots(figsize=(6, 4))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
     ax.boxplot(data, labels=labels, patch_artist=True)
     ax.set_title(configuracion.get('titulo', 'Diagrama de Caja'), pad=10)
     ax.set_ylabel(configuracion.get('ylabel', 'Valores'))
@@ -769,10 +1051,10 @@ def plugin_box(datos, configuracion, debug=False):
 
 # 12) violin_plot
 @register_chart("violin_plot")
-def plugin_violin(datos, configuracion, debug=False):
+def plugin_violin(datos, configuracion, debug=False, ax=None):
     data = datos.get('data'); labels = configuracion.get('labels')
     x_list, y_list = datos.get('x'), datos.get('y')
-    fig, ax = plt.subplots(figsize=(6, 4))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
     if configuracion.get('use_seaborn', False) and x_list is not None and y_list is not None:
         try:
             import pandas as pd, seaborn as sns
@@ -795,20 +1077,20 @@ def plugin_violin(datos, configuracion, debug=False):
 
 # 13) heatmap
 @register_chart("heatmap")
-def plugin_heatmap(datos, configuracion, debug=False):
+def plugin_heatmap(datos, configuracion, debug=False, ax=None):
     matrix = datos.get('matrix')
     if not (isinstance(matrix, list) and matrix and all(isinstance(r, list) for r in matrix)):
         raise ValueError("'matrix' debe ser lista de listas.")
-    fig, ax = plt.subplots(figsize=(6, 5))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 5))
     annot = bool(configuracion.get('annot', False)); cmap = configuracion.get('cmap', 'viridis')
     if configuracion.get('use_seaborn', False):
         try:
             import seaborn as sns
             sns.heatmap(matrix, annot=annot, cmap=cmap, ax=ax)
         except Exception:
-            im = ax.imshow(matrix, cmap=cmap, aspect='auto'); plt.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
+            im = ax.imshow(matrix, cmap=cmap, aspect='auto'); fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
     else:
-        im = ax.imshow(matrix, cmap=cmap, aspect='auto'); plt.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
+        im = ax.imshow(matrix, cmap=cmap, aspect='auto'); fig.colorbar(im, ax=ax, fraction=0.046, pad=0.04)
         if annot:
             for i in range(len(matrix)):
                 for j in range(len(matrix[0])):
@@ -819,25 +1101,26 @@ def plugin_heatmap(datos, configuracion, debug=False):
 
 # 14) contour_plot
 @register_chart("contour_plot")
-def plugin_contour(datos, configuracion, debug=False):
+def plugin_contour(datos, configuracion, debug=False, ax=None):
     x = datos.get('x'); y = datos.get('y'); z = datos.get('z')
     if not (isinstance(x, list) and isinstance(y, list) and isinstance(z, list)):
         raise ValueError("'x','y' listas y 'z' matriz (lista de listas).")
     X, Y = np.meshgrid(x, y); Z = np.array(z)
     if Z.shape != X.shape:
         raise ValueError(f"Z{Z.shape} debe coincidir con grid {X.shape}.")
-    fig, ax = plt.subplots(figsize=(6, 5))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 5))
     cs = ax.contourf(X, Y, Z, levels=int(configuracion.get("levels", 10)), cmap=configuracion.get('cmap', 'viridis'))
-    if configuracion.get("colorbar", True): plt.colorbar(cs, ax=ax, fraction=0.046, pad=0.04)
+    if configuracion.get("colorbar", True): fig.colorbar(cs, ax=ax, fraction=0.046, pad=0.04)
     ax.set_title(configuracion.get('titulo', 'Gráfico de Contorno'), pad=10)
     return fig, ax
 
 
 # 15) 3d_plot
-@register_chart("3d_plot")
-def plugin_3d(datos, configuracion, debug=False):
+@register_chart("3d_plot", deps=(PYPLOT, "mpl_toolkits.mplot3d"))
+def plugin_3d(datos, configuracion, debug=False, ax=None):
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 (registra la proyección '3d')
     plot_type = str(configuracion.get('plot_type', 'scatter')).lower()
-    fig = plt.figure(figsize=(6, 5)); ax = fig.add_subplot(111, projection='3d')
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 5), projection='3d')
     if plot_type in ('scatter', 'line'):
         x, y, z = datos.get('x'), datos.get('y'), datos.get('z')
         if not (isinstance(x, list) and isinstance(y, list) and isinstance(z, list) and len(x) == len(y) == len(z)):
@@ -857,13 +1140,14 @@ def plugin_3d(datos, configuracion, debug=False):
 
 
 # 16) network_diagram
-@register_chart("network_diagram")
-def plugin_network(datos, configuracion, debug=False):
+@register_chart("network_diagram", deps=(PYPLOT, "networkx"))
+def plugin_network(datos, configuracion, debug=False, ax=None):
+    import networkx as nx
     nodes, edges = datos.get('nodes', []), datos.get('edges', [])
     node_labels = datos.get('labels', {}); directed = configuracion.get('directed', False)
     if not (isinstance(nodes, list) and isinstance(edges, list)):
         raise ValueError("'nodes' y 'edges' deben ser listas.")
-    fig, ax = plt.subplots(figsize=(8, 6)); ax.set_title(configuracion.get("titulo", "Diagrama de Red"), pad=10); ax.axis('off')
+    fig, ax = ensure_fig_ax(ax, figsize=(8, 6)); ax.set_title(configuracion.get("titulo", "Diagrama de Red"), pad=10); ax.axis('off')
     G = nx.DiGraph() if directed else nx.Graph(); G.add_nodes_from(nodes); G.add_edges_from(edges)
     layout = str(configuracion.get('layout', 'spring')).lower()
     try:
@@ -893,10 +1177,10 @@ def plugin_network(datos, configuracion, debug=False):
 
 # 17) area_plot
 @register_chart("area_plot")
-def plugin_area(datos, configuracion, debug=False):
+def plugin_area(datos, configuracion, debug=False, ax=None):
     if 'y' not in datos or not isinstance(datos['y'], list):
         raise ValueError("Falta 'y' como lista (serie única o lista de listas).")
-    fig, ax = plt.subplots(figsize=(6, 4))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4))
     ax.set_title(configuracion.get("titulo", "Gráfico de Área"), pad=10)
     ax.set_xlabel(configuracion.get("xlabel", "Eje X")); ax.set_ylabel(configuracion.get("ylabel", "Eje Y"))
     x_data = datos.get('x'); y_data = datos['y']
@@ -922,7 +1206,7 @@ def plugin_area(datos, configuracion, debug=False):
 
 # 18) radar_chart
 @register_chart("radar_chart")
-def plugin_radar(datos, configuracion, debug=False):
+def plugin_radar(datos, configuracion, debug=False, ax=None):
     labels = datos.get('labels'); values_list = datos.get('values')
     if not (isinstance(labels, list) and isinstance(values_list, list) and labels):
         raise ValueError("'labels' lista y 'values' lista (o lista de listas) requeridas.")
@@ -932,7 +1216,7 @@ def plugin_radar(datos, configuracion, debug=False):
     if not all(len(lst) == num_vars and all(isinstance(v, (int, float)) for v in lst) for lst in values_list):
         raise ValueError("Cada serie debe ser numérica y del mismo largo que 'labels'.")
     angles = np.linspace(0, 2*np.pi, num_vars, endpoint=False).tolist(); angles += angles[:1]
-    fig, ax = plt.subplots(figsize=(6, 6), subplot_kw=dict(polar=True))
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 6), projection="polar")
     ax.set_title(configuracion.get("titulo", "Gráfico de Radar"), va="bottom", pad=10)
     ax.set_theta_offset(np.pi/2); ax.set_theta_direction(-1)
     for i, vals in enumerate(values_list):
@@ -947,12 +1231,13 @@ def plugin_radar(datos, configuracion, debug=False):
 
 
 # 19) venn_diagram
-@register_chart("venn_diagram")
-def plugin_venn(datos, configuracion, debug=False):
+@register_chart("venn_diagram", deps=(PYPLOT, "matplotlib_venn"))
+def plugin_venn(datos, configuracion, debug=False, ax=None):
+    from matplotlib_venn import venn2, venn3
     subsets = datos.get('subsets')
     if not isinstance(subsets, (tuple, list)):
         raise ValueError("'subsets' debe ser tuple/list.")
-    fig, ax = plt.subplots(figsize=(6, 4)); ax.set_title(configuracion.get("titulo", "Diagrama de Venn"), pad=10)
+    fig, ax = ensure_fig_ax(ax, figsize=(6, 4)); ax.set_title(configuracion.get("titulo", "Diagrama de Venn"), pad=10)
     if len(subsets) == 3:
         set_labels = configuracion.get('set_labels', None)
         if set_labels is not None and len(set_labels) != 2: set_labels = None
@@ -967,25 +1252,83 @@ def plugin_venn(datos, configuracion, debug=False):
 
 
 # 20) fractal (mandelbrot/julia)
+# Motor vectorizado de tiempo de escape: itera bloques completos de NumPy y
+# descarta de cada bloque los puntos que ya escaparon. La aritmética se hace
+# en reales (re/im por separado) y el radio con hypot, igual que abs(complex),
+# para reproducir exactamente las iteraciones del bucle puro de Python.
+FRACTAL_PUNTOS_POR_BLOQUE = 1 << 18
+
+
+def _escape_bloque(zr, zi, cr, ci, max_iter, smooth=False):
+    """
+    Itera z = z*z + c sobre un bloque aplanado de puntos.
+    cr/ci pueden ser arreglos (Mandelbrot) o escalares (Julia).
+    Devuelve, por punto, la iteración k en que |z| > 2 (0 si no escapa) o,
+    con smooth=True, el conteo continuo k + 1 - log2(log|z|).
+    """
+    n = zr.size
+    out = np.zeros(n, dtype=np.float64 if smooth else np.int64)
+    idx = np.arange(n)
+    c_es_arreglo = np.ndim(cr) > 0
+    for k in range(max_iter):
+        zr, zi = zr * zr - zi * zi + cr, zr * zi + zi * zr + ci
+        modulo = np.hypot(zr, zi)
+        escapo = modulo > 2
+        if not escapo.any():
+            continue
+        if smooth:
+            out[idx[escapo]] = k + 1 - np.log2(np.log(modulo[escapo]))
+        else:
+            out[idx[escapo]] = k
+        sigue = ~escapo
+        zr, zi, idx = zr[sigue], zi[sigue], idx[sigue]
+        if c_es_arreglo:
+            cr, ci = cr[sigue], ci[sigue]
+        if idx.size == 0:
+            break
+    return out
+
+
+def _escape_time(x_vals, y_vals, max_iter, c_const=None, smooth=False,
+                 puntos_por_bloque=FRACTAL_PUNTOS_POR_BLOQUE):
+    """
+    Calcula la imagen (height, width) de tiempos de escape por bloques de filas,
+    para acotar la memoria. Sin c_const es Mandelbrot (z0 = 0, c = punto);
+    con c_const es Julia (z0 = punto, c = c_const).
+    """
+    height, width = len(y_vals), len(x_vals)
+    img = np.zeros((height, width), dtype=np.float64 if smooth else np.int64)
+    filas_por_bloque = max(1, int(puntos_por_bloque) // max(1, width))
+    for i0 in range(0, height, filas_por_bloque):
+        ys = y_vals[i0:i0 + filas_por_bloque]
+        pr = np.broadcast_to(x_vals, (len(ys), width)).ravel()
+        pi = np.repeat(ys, width)
+        if c_const is None:
+            # Primera iteración desde z = 0 deja z = c, igual que el bucle original
+            res = _escape_bloque(np.zeros_like(pr), np.zeros_like(pi), pr, pi, max_iter, smooth)
+        else:
+            res = _escape_bloque(pr.copy(), pi, c_const.real, c_const.imag, max_iter, smooth)
+        img[i0:i0 + len(ys)] = res.reshape(len(ys), width)
+    return img
+
+
 @register_chart("fractal")
-def plugin_fractal(datos, configuracion, debug=False):
+def plugin_fractal(datos, configuracion, debug=False, ax=None):
     ftype = str(datos.get('type', 'mandelbrot')).lower().strip()
     cfg = datos.get('config', {}) or {}
+    smooth = bool(configuracion.get('smooth', False))
+    bloque = int(cfg.get('tile_points', FRACTAL_PUNTOS_POR_BLOQUE))
     if ftype == 'mandelbrot':
         width, height = int(cfg.get('width', 400)), int(cfg.get('height', 400))
         xmin, xmax = cfg.get('xmin', -2.0), cfg.get('xmax', 1.0)
         yres = cfg.get('yres', (xmax - xmin) * height / width)
         ymin, ymax = cfg.get('ymin', -yres/2), cfg.get('ymax', yres/2)
         max_iter = int(cfg.get('max_iter', 100)); cmap = configuracion.get('cmap', 'hot')
-        img = np.zeros((height, width), dtype=np.uint16)
         x_vals = np.linspace(xmin, xmax, width); y_vals = np.linspace(ymin, ymax, height)
-        for i in range(height):
-            for j in range(width):
-                c = complex(x_vals[j], y_vals[i]); z = 0
-                for k in range(max_iter):
-                    z = z*z + c
-                    if abs(z) > 2: img[i, j] = k; break
-        fig, ax = plt.subplots(figsize=(width/100, height/100))
+        img = _escape_time(x_vals, y_vals, max_iter, smooth=smooth, puntos_por_bloque=bloque)
+        if not smooth:
+            img = img.astype(np.uint16)
+        fig, ax = ensure_fig_ax(ax, figsize=(width/100, height/100))
         ax.imshow(img, origin='lower', extent=[xmin, xmax, ymin, ymax], cmap=cmap, **configuracion.get("plot_config", {}))
         ax.set_title(configuracion.get("titulo", "Conjunto de Mandelbrot"), pad=10)
         ax.set_xlabel(configuracion.get("xlabel", "Re(c)")); ax.set_ylabel(configuracion.get("ylabel", "Im(c)"))
@@ -998,15 +1341,11 @@ def plugin_fractal(datos, configuracion, debug=False):
         max_iter = int(cfg.get('max_iter', 100))
         c_const = complex(cfg.get('c_real', -0.7), cfg.get('c_imag', 0.27015))
         cmap = configuracion.get('cmap', 'hot')
-        img = np.zeros((height, width), dtype=np.uint8)
         x_vals = np.linspace(xmin, xmax, width); y_vals = np.linspace(ymin, ymax, height)
-        for i in range(height):
-            for j in range(width):
-                z = complex(x_vals[j], y_vals[i])
-                for k in range(max_iter):
-                    z = z*z + c_const
-                    if abs(z) > 2: img[i, j] = k; break
-        fig, ax = plt.subplots(figsize=(width/100, height/100))
+        img = _escape_time(x_vals, y_vals, max_iter, c_const=c_const, smooth=smooth, puntos_por_bloque=bloque)
+        if not smooth:
+            img = img.astype(np.uint8)
+        fig, ax = ensure_fig_ax(ax, figsize=(width/100, height/100))
         ax.imshow(img, origin='lower', extent=[xmin, xmax, ymin, ymax], cmap=cmap, **configuracion.get("plot_config", {}))
         ax.set_title(configuracion.get("titulo", "Conjunto de Julia"), pad=10)
         ax.set_xlabel(configuracion.get("xlabel", "Re(z)")); ax.set_ylabel(configuracion.get("ylabel", "Im(z)"))
@@ -1046,32 +1385,171 @@ CHART_ALIASES = {
 # 3. MOTOR PRINCIPAL DE GENERACIÓN DE GRÁFICOS
 # ==============================================================================
 
-def crear_grafico(tipo_grafico, datos, configuracion):
-    """Motor que usa el sistema de plugins para generar un gráfico."""
+def _clave_render(plugin_key, datos, configuracion, formato="png", dpi=None) -> str:
+    """Clave de caché: hash de la especificación normalizada (alias resuelto, None → {}), formato y dpi."""
+    return clave_canonica(RENDER_CACHE_VERSION, plugin_key, datos or {}, configuracion or {}, formato, dpi)
+
+
+def estadisticas_cache_render() -> dict:
+    """Contadores de aciertos/fallos de la caché de renders."""
+    return RENDER_CACHE.estadisticas()
+
+
+def _normalizar_formato(formato) -> str:
+    formato = str(formato or "png").lower().strip().lstrip(".")
+    formato = "pdf" if formato == "application/pdf" else formato.replace("image/", "").replace("+xml", "")
+    if formato not in FORMATOS_GRAFICO:
+        raise ValueError(f"Formato de gráfico '{formato}' no soportado (use {', '.join(FORMATOS_GRAFICO)}).")
+    return formato
+
+
+def crear_grafico(tipo_grafico, datos, configuracion, usar_cache=True, formato="png", dpi=None):
+    """
+    Motor que usa el sistema de plugins para generar un gráfico.
+    'formato': png | svg | pdf | webp. 'dpi' fija la resolución de las salidas rasterizadas
+    (None = la de la figura); en SVG/PDF solo afecta a las partes rasterizadas (p. ej. imshow).
+    """
     plugin_key = _resolve_plugin_key(tipo_grafico)
 
     if plugin_key not in PLUGIN_REGISTRY:
         raise ValueError(f"El tipo de gráfico '{tipo_grafico}' no está soportado.")
+    formato = _normalizar_formato(formato)
+    dpi = float(dpi) if dpi else None
+
+    # Un acierto devuelve los bytes guardados sin pasar por Matplotlib
+    clave = _clave_render(plugin_key, datos, configuracion, formato, dpi)
+    if usar_cache:
+        guardado = RENDER_CACHE.obtener(clave)
+        if guardado is not None:
+            return io.BytesIO(guardado)
+
+    if GRAFICOS_BACKEND == "procesos":
+        buf = _renderizar_en_pool(plugin_key, datos, configuracion, formato, dpi)
+    else:
+        buf = _renderizar_plugin(plugin_key, datos, configuracion, formato, dpi)
+    if buf is not None:
+        RENDER_CACHE.guardar(clave, buf.getvalue())
+    return buf
+
 
+def _renderizar_en_pool(plugin_key, datos, configuracion, formato="png", dpi=None):
+    """Envía el render a un proceso del pool (aislado y con timeout)."""
+    from pool_render import obtener_pool
+    try:
+        contenido = obtener_pool().renderizar(plugin_key, datos or {}, configuracion or {},
+                                              formato=formato, dpi=dpi)
+    except Exception as e:
+        print(f"❌ Error al ejecutar el plugin '{plugin_key}' en el pool de procesos: {e}")
+        return None
+    return io.BytesIO(contenido) if contenido else None
+
+
+def optimizar_png(contenido: bytes, compresion: int = None, colores: int = None) -> bytes:
+    """
+    Recodifica un PNG: quita el canal alfa si es opaco, pasa a paleta las imágenes con pocos
+    colores (sin pérdida) o cuantiza a 'colores' (con pérdida), y comprime con el nivel dado.
+    Si el resultado no es más liviano, devuelve el original.
+    """
+    from PIL import Image
+    compresion = GRAFICOS_PNG_COMPRESION if compresion is None else compresion
+    colores = GRAFICOS_PNG_COLORES if colores is None else colores
+    with Image.open(io.BytesIO(contenido)) as original:
+        img = original
+        info_dpi = original.info.get("dpi")
+        if img.mode == "RGBA" and img.getchannel("A").getextrema()[0] == 255:
+            img = img.convert("RGB")
+        if img.mode == "RGB":
+            if img.getcolors(256) is not None:
+                # Paleta exacta con los colores presentes (quantize() aproxima): mismo resultado píxel a píxel
+                pixeles = np.asarray(img, dtype=np.uint32)
+                codigos = (pixeles[..., 0] << 16) | (pixeles[..., 1] << 8) | pixeles[..., 2]
+                unicos, indices = np.unique(codigos, return_inverse=True)
+                paletizada = Image.fromarray(indices.reshape(codigos.shape).astype(np.uint8), "L")
+                paletizada.putpalette([(int(c) >> s) & 0xFF for c in unicos for s in (16, 8, 0)])
+                img = paletizada
+            elif colores:
+                img = img.quantize(colors=colores, dither=Image.Dither.NONE)
+        salida = io.BytesIO()
+        opciones = {"dpi": info_dpi} if info_dpi else {}
+        img.save(salida, format="PNG", compress_level=compresion, **opciones)
+    optimizado = salida.getvalue()
+    return optimizado if len(optimizado) < len(contenido) else contenido
+
+
+def _opciones_webp() -> dict:
+    return {"lossless": GRAFICOS_WEBP_SIN_PERDIDA, "quality": GRAFICOS_WEBP_CALIDAD, "method": 4}
+
+
+def _convertir_raster(buf: io.BytesIO, formato: str, dpi=None) -> io.BytesIO:
+    """Lleva una imagen ya rasterizada por el plugin (p. ej. la tabla con Pillow) al formato pedido."""
+    if formato == "png":
+        salida = io.BytesIO(optimizar_png(buf.getvalue()) if GRAFICOS_PNG_OPTIMIZAR else buf.getvalue())
+    elif formato == "svg":
+        # SVG con la imagen incrustada: el contenido no es vectorial, pero el formato es el pedido
+        import base64
+        from PIL import Image
+        with Image.open(io.BytesIO(buf.getvalue())) as img:
+            ancho, alto = img.size
+        b64 = base64.b64encode(buf.getvalue()).decode("ascii")
+        salida = io.BytesIO((
+            f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{ancho}" height="{alto}" viewBox="0 0 {ancho} {alto}">'
+            f'<image width="{ancho}" height="{alto}" xlink:href="data:image/png;base64,{b64}"/></svg>'
+        ).encode("utf-8"))
+    else:
+        from PIL import Image
+        salida = io.BytesIO()
+        with Image.open(io.BytesIO(buf.getvalue())) as img:
+            if formato == "webp":
+                img.save(salida, format="WEBP", **_opciones_webp())
+            else:
+                img.convert("RGB").save(salida, format="PDF", resolution=dpi or TABLA_DPI)
+    salida.seek(0)
+    return salida
+
+
+def _guardar_figura(fig, formato: str, dpi=None) -> io.BytesIO:
+    """savefig en el formato pedido (recorte 'tight', como siempre) y optimización del PNG."""
+    buf = io.BytesIO()
+    opciones = {"format": formato, "bbox_inches": "tight"}
+    if dpi:
+        opciones["dpi"] = dpi
+    if formato == "webp":
+        opciones["pil_kwargs"] = _opciones_webp()
+    elif formato == "svg":
+        opciones["metadata"] = {"Date": None}  # salida determinista (sin fecha)
+    elif formato == "pdf":
+        opciones["metadata"] = {"CreationDate": None}
+    fig.savefig(buf, **opciones)
+    if formato == "png" and GRAFICOS_PNG_OPTIMIZAR:
+        buf = io.BytesIO(optimizar_png(buf.getvalue()))
+    buf.seek(0)
+    return buf
+
+
+def _renderizar_plugin(plugin_key, datos, configuracion, formato="png", dpi=None):
+    """Ejecuta el plugin y serializa la figura al formato pedido (sin caché)."""
     plugin_function = PLUGIN_REGISTRY[plugin_key]
+    if dpi or formato != "png":
+        # Los plugins que rasterizan por su cuenta (tabla con Pillow) leen formato y dpi de la configuración
+        configuracion = dict(configuracion or {}, formato=formato, dpi=dpi)
 
     fig, ax = None, None
     try:
+        _cargar_dependencias(plugin_key)
         resultado = plugin_function(datos, configuracion)
 
         if isinstance(resultado, io.BytesIO):
-            return resultado
+            return _convertir_raster(resultado, formato, dpi)
         elif isinstance(resultado, tuple) and len(resultado) == 2:
             fig, ax = resultado
         else:
             raise TypeError(f"El plugin '{plugin_key}' devolvió un tipo de resultado inesperado.")
 
         if fig:
-            buf = io.BytesIO()
-            plt.tight_layout()
-            fig.savefig(buf, format="png", bbox_inches="tight")
-            plt.close(fig)
-            buf.seek(0)
+            fig.tight_layout()
+            buf = _guardar_figura(fig, formato, dpi)
+            liberar_figura(fig)
             return buf
         else:
             raise ValueError(f"El plugin '{plugin_key}' no generó una figura de Matplotlib válida.")
@@ -1079,7 +1557,7 @@ def crear_grafico(tipo_grafico, datos, configuracion):
     except Exception as e:
         print(f"❌ Error al ejecutar el plugin '{plugin_key}': {e}")
         if fig:
-            plt.close(fig)
+            liberar_figura(fig)
         return None
 
 # ==============================================================================
@@ -1144,16 +1622,46 @@ DESCRIPCION:
 {descripcion}
 """
 
-def build_visual_json_with_llm(descripcion: str) -> dict:
+_VISUAL_SPEC_PROMPT = None
+
+
+def _get_visual_spec_prompt():
+    """PromptTemplate de especificaciones, construido una sola vez (LangChain se importa aquí)."""
+    global _VISUAL_SPEC_PROMPT
+    if _VISUAL_SPEC_PROMPT is None:
+        _importar("langchain.prompts")
+        from langchain.prompts import PromptTemplate
+        _VISUAL_SPEC_PROMPT = PromptTemplate(input_variables=["descripcion"], template=VISUAL_SPEC_TEMPLATE)
+    return _VISUAL_SPEC_PROMPT
+
+
+def _normalizar_descripcion(descripcion: str) -> str:
+    """Normaliza Unicode (NFC) y colapsa espacios para que variaciones triviales compartan caché."""
+    texto = unicodedata.normalize("NFC", str(descripcion or ""))
+    return " ".join(texto.split())
+
+
+def estadisticas_cache_specs() -> dict:
+    """Contadores de aciertos/fallos de la caché descripción→spec."""
+    return SPEC_CACHE.estadisticas()
+
+
+def build_visual_json_with_llm(descripcion: str, usar_cache: bool = True) -> dict:
     """Llama al LLM para convertir una descripción textual en una especificación JSON."""
-    prompt = PromptTemplate(input_variables=["descripcion"], template=VISUAL_SPEC_TEMPLATE)
+    model_name, temperature = _llm_config()
+    # Solo la clave usa el texto normalizado; el LLM recibe la descripción tal cual (saltos de línea incluidos)
+    clave = clave_canonica("spec", _normalizar_descripcion(descripcion), model_name, temperature, VISUAL_SPEC_TEMPLATE)
+    if usar_cache:
+        guardado = SPEC_CACHE.obtener(clave)
+        if guardado is not None:
+            return json.loads(guardado.decode("utf-8"))
 
     # Evita que llaves en la descripción rompan el PromptTemplate
     descripcion_safe = _escape_braces(descripcion)
 
     # Construye la cadena prompt -> LLM (faltaba esto)
     llm = _get_llm()
-    chain = prompt | llm
+    chain = _get_visual_spec_prompt() | llm
 
     # Invoca y extrae texto
     response = chain.invoke({"descripcion": descripcion_safe})
@@ -1164,12 +1672,16 @@ def build_visual_json_with_llm(descripcion: str) -> dict:
         match = re.search(r"\{.*\}", content, re.DOTALL)
         if not match:
             raise json.JSONDecodeError("No se encontró un objeto JSON en la respuesta del LLM.", content, 0)
-        return json.loads(match.group(0))
+        spec = json.loads(match.group(0))
     except json.JSONDecodeError:
         print("❌ Error: La respuesta del LLM no fue un JSON válido.")
         print("Respuesta recibida:", content)
         raise
 
+    if isinstance(spec, dict):
+        SPEC_CACHE.guardar(clave, json.dumps(spec, ensure_ascii=False).encode("utf-8"))
+    return spec
+
 def generar_grafico_desde_texto(descripcion: str, ruta_png=None,
                                 mostrar: bool=False, abrir_archivo: bool=False):
     """Función principal y orquestadora."""
@@ -1219,6 +1731,7 @@ def generar_grafico_desde_texto(descripcion: str, ruta_png=None,
             try:
                 from PIL import Image
                 import io as _io
+                import matplotlib.pyplot as plt
                 img = Image.open(_io.BytesIO(buffer.getvalue()))
                 plt.figure()
                 plt.imshow(img)
@@ -1233,6 +1746,8 @@ def generar_grafico_desde_texto(descripcion: str, ruta_png=None,
         print(f"❌ Falló el renderizado del gráfico: {e}")
         return spec, None
 
+_TIEMPO_IMPORT_MODULO = time.perf_counter() - _T0_IMPORT
+
 # ==============================================================================
 # 5. EJEMPLO DE USO INTERACTIVO
 # ==============================================================================
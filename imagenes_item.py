@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Preparación de la imagen del ítem original antes de enviarla a Gemini.
+
+El pantallazo se decodifica UNA vez, se corrige la orientación EXIF, se reduce a
+un lado máximo razonable para el modelo y se recodifica en un formato compacto
+(WebP o JPEG con calidad acotada; PNG si así se configura). El resultado se guarda
+en una caché LRU por hash de contenido, de modo que los reintentos, los candidatos
+en paralelo y otras sesiones que suban el mismo pantallazo reutilizan los bytes ya
+preparados sin volver a decodificar.
+
+Configuración por variables de entorno:
+- IMAGEN_MAX_LADO (px, por defecto 1536)
+- IMAGEN_FORMATO (WEBP | JPEG | PNG, por defecto WEBP)
+- IMAGEN_CALIDAD (50-95, por defecto 85)
+- IMAGEN_CACHE_MB (por defecto 64)
+"""
+import io
+import os
+import hashlib
+
+from PIL import Image, ImageOps
+
+from cache_graficos import CacheLRU, clave_canonica
+
+IMAGEN_MAX_LADO = int(os.environ.get("IMAGEN_MAX_LADO", "1536"))
+IMAGEN_FORMATO = os.environ.get("IMAGEN_FORMATO", "WEBP").upper().strip()
+IMAGEN_CALIDAD = max(50, min(95, int(os.environ.get("IMAGEN_CALIDAD", "85"))))
+
+MIME_POR_FORMATO = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+if IMAGEN_FORMATO not in MIME_POR_FORMATO:
+    print(f"⚠️ IMAGEN_FORMATO '{IMAGEN_FORMATO}' no soportado; se usa WEBP.")
+    IMAGEN_FORMATO = "WEBP"
+
+# Guarda "<mime>\n<bytes>" para poder devolver el tipo sin volver a mirar la imagen
+IMAGEN_CACHE = CacheLRU("imagenes", int(float(os.environ.get("IMAGEN_CACHE_MB", "64")) * 1024 * 1024))
+
+
+def _leer_bytes(origen) -> bytes:
+    """Bytes crudos de un UploadedFile de Streamlit, un archivo/BytesIO o bytes."""
+    if isinstance(origen, (bytes, bytearray)):
+        return bytes(origen)
+    if hasattr(origen, "getvalue"):
+        return origen.getvalue()
+    if hasattr(origen, "seek"):
+        origen.seek(0)
+    return origen.read()
+
+
+def _recodificar(crudo: bytes, max_lado: int, formato: str, calidad: int):
+    """Decodifica, orienta, reduce y recodifica. Devuelve (bytes, mime)."""
+    with Image.open(io.BytesIO(crudo)) as img:
+        formato_original = (img.format or "").upper()
+        img = ImageOps.exif_transpose(img)
+        if max(img.size) > max_lado:
+            img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+            reducida = True
+        else:
+            reducida = False
+
+        tiene_alfa = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        if formato == "JPEG":
+            if tiene_alfa:
+                fondo = Image.new("RGB", img.size, "white")
+                fondo.paste(img.convert("RGBA"), mask=img.convert("RGBA").split()[-1])
+                img = fondo
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA") and formato == "WEBP":
+            img = img.convert("RGBA" if tiene_alfa else "RGB")
+
+        salida = io.BytesIO()
+        if formato == "PNG":
+            img.save(salida, format="PNG", optimize=True)
+        elif formato == "WEBP":
+            img.save(salida, format="WEBP", quality=calidad, method=4)
+        else:
+            img.save(salida, format="JPEG", quality=calidad, optimize=True)
+        datos = salida.getvalue()
+
+    # Si no hubo que reducir y el original ya es un formato aceptado y más liviano, se envía tal cual
+    if not reducida and formato_original in MIME_POR_FORMATO and len(crudo) <= len(datos):
+        return crudo, MIME_POR_FORMATO[formato_original]
+    return datos, MIME_POR_FORMATO[formato]
+
+
+def preparar_imagen(origen, max_lado: int = None, formato: str = None, calidad: int = None):
+    """
+    Devuelve (bytes, mime, hash_contenido) de la imagen lista para el modelo.
+    El hash es el SHA-256 de los bytes originales subidos.
+    """
+    max_lado = int(max_lado or IMAGEN_MAX_LADO)
+    formato = (formato or IMAGEN_FORMATO).upper()
+    calidad = int(calidad or IMAGEN_CALIDAD)
+
+    crudo = _leer_bytes(origen)
+    hash_contenido = hashlib.sha256(crudo).hexdigest()
+    clave = clave_canonica("imagen", hash_contenido, max_lado, formato, calidad)
+
+    guardado = IMAGEN_CACHE.obtener(clave)
+    if guardado is not None:
+        mime, _, datos = guardado.partition(b"\n")
+        return datos, mime.decode("ascii"), hash_contenido
+
+    datos, mime = _recodificar(crudo, max_lado, formato, calidad)
+    IMAGEN_CACHE.guardar(clave, mime.encode("ascii") + b"\n" + datos)
+    return datos, mime, hash_contenido
+
+
+def parte_imagen(origen):
+    """Part de Vertex AI con la imagen preparada (lista para generate_content)."""
+    from vertexai.generative_models import Part
+    datos, mime, _ = preparar_imagen(origen)
+    return Part.from_data(data=datos, mime_type=mime)
+
+
+def estadisticas_cache_imagenes() -> dict:
+    """Aciertos/fallos y ocupación de la caché de imágenes preparadas."""
+    return IMAGEN_CACHE.estadisticas()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Parser incremental para el objeto JSON que devuelve el generador en modo streaming.
+
+Recibe el texto por trozos (tal como llegan de generate_content(stream=True)) y
+entrega cada campo de PRIMER nivel en cuanto su valor termina, sin esperar al
+resto de la respuesta. Cuando se cierra la llave del objeto, 'completo' pasa a
+True y el llamador puede cortar el stream.
+
+Cualquier texto antes de la primera '{' (p. ej. un ```json que el modelo agregue
+por su cuenta) se ignora, igual que hacía la limpieza con find('{')/rfind('}').
+"""
+import json
+
+
+class ParserJSONIncremental:
+    """Tokeniza el objeto a medida que llega y emite (campo, valor) por cada campo de primer nivel."""
+
+    def __init__(self):
+        self._texto = ""
+        self._pos = 0              # siguiente carácter por examinar
+        self._inicio = None        # índice de la '{' de apertura
+        self._prof = 0             # profundidad de anidamiento ({ y [)
+        self._en_cadena = False
+        self._escape = False
+        self._cadena_es_clave = False
+        self._inicio_clave = None
+        self._clave = None
+        self._inicio_valor = None
+        self.fin = None            # índice (exclusivo) de la '}' de cierre
+        self.objeto = {}
+        self.completo = False
+
+    @property
+    def texto(self) -> str:
+        """Todo el texto recibido hasta ahora."""
+        return self._texto
+
+    @property
+    def json_str(self) -> str:
+        """El objeto JSON completo (desde la '{' hasta su '}'), o None si aún no cierra."""
+        if not self.completo:
+            return None
+        return self.texto[self._inicio:self.fin]
+
+    def alimentar(self, trozo: str):
+        """
+        Agrega un trozo de texto y devuelve la lista de (campo, valor) que quedaron
+        completos con él. Lanza json.JSONDecodeError si un valor no es JSON válido.
+        """
+        if self.completo or not trozo:
+            return []
+        self._texto += trozo
+        texto = self._texto
+        nuevos = []
+
+        i = self._pos
+        n = len(texto)
+        while i < n:
+            c = texto[i]
+            if self._inicio is None:
+                if c == "{":
+                    self._inicio = i
+                    self._prof = 1
+                i += 1
+                continue
+
+            if self._en_cadena:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_cadena = False
+                    if self._cadena_es_clave:
+                        self._clave = json.loads(texto[self._inicio_clave:i + 1])
+                i += 1
+                continue
+
+            if c == '"':
+                self._en_cadena = True
+                self._cadena_es_clave = self._prof == 1 and self._inicio_valor is None
+                if self._cadena_es_clave:
+                    self._inicio_clave = i
+            elif c in "{[":
+                self._prof += 1
+            elif c in "}]":
+                self._prof -= 1
+                if self._prof == 0:
+                    self._cerrar_valor(texto, i, nuevos)
+                    self.fin = i + 1
+                    self.completo = True
+                    i += 1
+                    break
+            elif self._prof == 1:
+                if c == ":" and self._inicio_valor is None:
+                    self._inicio_valor = i + 1
+                elif c == ",":
+                    self._cerrar_valor(texto, i, nuevos)
+            i += 1
+
+        self._pos = i
+        return nuevos
+
+    def _cerrar_valor(self, texto, fin, nuevos):
+        if self._inicio_valor is None or self._clave is None:
+            return
+        valor = json.loads(texto[self._inicio_valor:fin])
+        self.objeto[self._clave] = valor
+        nuevos.append((self._clave, valor))
+        self._clave = None
+        self._inicio_valor = None
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Modo por lotes (sin interfaz) del generador de ítems espejo.
+
+Recorre un manifiesto de imágenes y selecciones de taxonomía y, para cada fila, ejecuta el
+mismo bucle generador → reglas locales → auditor de la app (motor_items.producir_item),
+genera la oportunidad de mejora y, si se pide, los gráficos y el Word del ítem.
+
+- Los ítems se procesan en paralelo (--concurrencia) con un límite de llamadas a Gemini
+  por minuto (--rpm), compartido por todos los hilos.
+- Cada ítem terminado se agrega a <salida>/checkpoint.jsonl; al relanzar el mismo comando se
+  saltan los ítems ya terminados (los que fallaron por error se vuelven a intentar).
+- Las filas aprobadas se escriben a medida que terminan en <salida>/items.csv y al final se
+  vuelcan en streaming a <salida>/items.xlsx (mismas columnas que el Excel de la app) y,
+  con --parquet, a <salida>/items.parquet.
+- --graficos guarda el PNG de cada gráfico en <salida>/graficos (y, con --formatos-graficos
+  svg,pdf, también la versión vectorial); el Word siempre usa el PNG.
+- --word escribe un .docx por ítem; --word-unico, un solo lote.docx con todos los aprobados.
+
+Manifiesto: CSV (con encabezados) o JSONL con las columnas
+    id, imagen, Grado, Área, Componente_Estructura, Componente_Tematica, Ref. Temática,
+    Competencia, Afirmación, Evidencia, contexto
+'imagen' es una ruta local (relativa al manifiesto) o gs://bucket/ruta.
+
+Uso:
+    python lote_items.py manifiesto.csv --salida lote_01 --concurrencia 8 --rpm 120 --graficos --word
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from exportador_excel import ExportadorExcel
+from clientes_gcp import iniciar_vertex, obtener_storage
+from motor_items import (producir_item, generar_oportunidad_mejora_llm, OPORTUNIDAD_MEJORA_POR_DEFECTO,
+                         item_a_datos_exportables, fila_excel, COLUMNAS_EXCEL, crear_word, crear_word_lote)
+
+CAMPOS_TAXONOMIA = ("Grado", "Área", "Componente_Estructura", "Componente_Tematica", "Ref. Temática",
+                    "Competencia", "Afirmación", "Evidencia")
+COLUMNAS_CSV = ["id"] + COLUMNAS_EXCEL
+ESTADOS_TERMINADOS = ("aprobado", "rechazado")
+
+LOTE_CONCURRENCIA = int(os.environ.get("LOTE_CONCURRENCIA", "4"))
+LOTE_RPM = float(os.environ.get("LOTE_RPM", "60"))
+MODELO_POR_DEFECTO = os.environ.get("LOTE_MODELO", "gemini-2.5-flash")
+
+
+class LimitadorTasa:
+    """Cubeta de fichas: como máximo 'rpm' llamadas por minuto entre todos los hilos (rpm <= 0 = sin límite)."""
+
+    def __init__(self, rpm: float):
+        self.intervalo = 60.0 / rpm if rpm > 0 else 0.0
+        self.capacidad = max(1.0, rpm / 6.0)  # ráfaga de hasta 10 s de cuota
+        self._fichas = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) / self.intervalo)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) * self.intervalo
+            time.sleep(espera)
+
+
+# ------------------ Manifiesto y checkpoint ------------------
+def leer_manifiesto(ruta: str) -> list:
+    """Filas del manifiesto (CSV o JSONL) como dicts con 'id', 'imagen', 'taxonomia' y 'contexto'."""
+    if ruta.lower().endswith((".jsonl", ".ndjson")):
+        with open(ruta, encoding="utf-8") as f:
+            filas = [json.loads(linea) for linea in f if linea.strip()]
+    else:
+        with open(ruta, encoding="utf-8-sig", newline="") as f:
+            filas = list(csv.DictReader(f))
+
+    base = os.path.dirname(os.path.abspath(ruta))
+    tareas, vistos = [], set()
+    for n, fila in enumerate(filas, start=1):
+        id_item = str(fila.get("id") or n).strip()
+        if id_item in vistos:
+            raise ValueError(f"El id '{id_item}' está repetido en el manifiesto (fila {n}).")
+        vistos.add(id_item)
+        imagen = str(fila.get("imagen") or "").strip()
+        if not imagen:
+            raise ValueError(f"La fila {n} (id '{id_item}') no tiene 'imagen'.")
+        if not imagen.startswith("gs://") and not os.path.isabs(imagen):
+            imagen = os.path.join(base, imagen)
+        tareas.append({
+            "id": id_item,
+            "imagen": imagen,
+            "taxonomia": {campo: str(fila.get(campo) or "N/A") for campo in CAMPOS_TAXONOMIA},
+            "contexto": str(fila.get("contexto") or ""),
+        })
+    return tareas
+
+
+def leer_checkpoint(ruta: str) -> dict:
+    """Último registro de cada id en el checkpoint (una línea incompleta al final se ignora)."""
+    registros = {}
+    if not os.path.exists(ruta):
+        return registros
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                continue  # p. ej. la última línea si el proceso murió mientras escribía
+            registros[registro["id"]] = registro
+    return registros
+
+
+def _fila_csv(registro) -> dict:
+    fila = fila_excel(registro["item"], registro["taxonomia"], registro["oportunidad"])
+    fila["ID ÍTEM"] = registro["id"]
+    return {"id": registro["id"], **fila}
+
+
+class SalidaLote:
+    """Checkpoint JSONL + CSV incremental de los ítems aprobados (escrituras serializadas entre hilos)."""
+
+    def __init__(self, carpeta: str, previos: dict):
+        self.carpeta = carpeta
+        self.ruta_checkpoint = os.path.join(carpeta, "checkpoint.jsonl")
+        self.ruta_csv = os.path.join(carpeta, "items.csv")
+        self._lock = threading.Lock()
+        # El checkpoint manda: el CSV se rehace desde él para no duplicar filas tras una caída
+        with open(self.ruta_csv, "w", encoding="utf-8-sig", newline="") as f:
+            escritor = csv.DictWriter(f, fieldnames=COLUMNAS_CSV)
+            escritor.writeheader()
+            for registro in previos.values():
+                if registro["estado"] == "aprobado":
+                    escritor.writerow(_fila_csv(registro))
+
+    def guardar(self, registro: dict):
+        linea = json.dumps(registro, ensure_ascii=False) + "\n"
+        with self._lock:
+            if registro["estado"] == "aprobado":
+                with open(self.ruta_csv, "a", encoding="utf-8", newline="") as f:
+                    csv.DictWriter(f, fieldnames=COLUMNAS_CSV).writerow(_fila_csv(registro))
+            with open(self.ruta_checkpoint, "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+# ------------------ Procesamiento de un ítem ------------------
+def leer_imagen(origen: str) -> bytes:
+    """Bytes de una ruta local o de gs://bucket/ruta."""
+    if origen.startswith("gs://"):
+        bucket_name, _, ruta = origen[len("gs://"):].partition("/")
+        return obtener_storage().bucket(bucket_name).blob(ruta).download_as_bytes()
+    with open(origen, "rb") as f:
+        return f.read()
+
+
+_RENDER_LOCK = threading.Lock()  # pyplot no es seguro entre hilos
+
+
+def generar_graficos(item, carpeta, id_item, antes_de_llamar, formatos_extra=()):
+    """
+    Spec (LLM de plugins) y PNG (a resolución de exportación) de cada gráfico marcado "SÍ", más una
+    copia en cada formato de 'formatos_extra' (svg, pdf, webp). Devuelve ({elemento: spec}, {elemento: ruta PNG}).
+    """
+    from graficos_plugins import build_visual_json_with_llm, crear_grafico, GRAFICOS_DPI_EXPORTACION
+
+    opciones = item.get("opciones") if isinstance(item.get("opciones"), dict) else {}
+    elementos = [("enunciado", item.get("grafico_necesario_enunciado"), item.get("descripcion_texto_grafico_enunciado"))]
+    for letra in ["A", "B", "C", "D"]:
+        opcion = opciones.get(letra) if isinstance(opciones.get(letra), dict) else {}
+        elementos.append((letra, opcion.get("grafico_necesario"), opcion.get("descripcion_texto_grafico")))
+
+    specs, rutas = {}, {}
+    for elemento, necesario, descripcion in elementos:
+        if str(necesario).strip().upper() not in ("SÍ", "SI") or str(descripcion or "").strip() in ("", "N/A"):
+            continue
+        antes_de_llamar()
+        try:
+            spec = build_visual_json_with_llm(descripcion)
+        except Exception as e:
+            print(f"⚠️ [{id_item}] No se pudo generar el JSON del gráfico ({elemento}): {e}")
+            continue
+        if not spec:
+            continue
+        specs[elemento] = spec
+        for formato in ("png",) + tuple(f for f in formatos_extra if f != "png"):
+            try:
+                with _RENDER_LOCK:
+                    buf = crear_grafico(tipo_grafico=spec.get("tipo_elemento"), datos=spec.get("datos", {}),
+                                        configuracion=spec.get("configuracion", {}),
+                                        formato=formato, dpi=GRAFICOS_DPI_EXPORTACION)
+            except Exception as e:
+                print(f"⚠️ [{id_item}] No se pudo renderizar el gráfico ({elemento}, {formato}): {e}")
+                buf = None
+            if buf is None:
+                break  # si falla el PNG no se intentan los demás formatos
+            ruta = os.path.join(carpeta, "graficos", f"{id_item}_{elemento}.{formato}")
+            with open(ruta, "wb") as f:
+                f.write(buf.getvalue())
+            if formato == "png":
+                rutas[elemento] = ruta
+    return specs, rutas
+
+
+def procesar_tarea(tarea, args, limitador):
+    """Produce un ítem del manifiesto y devuelve su registro de checkpoint."""
+    t0 = time.perf_counter()
+    registro = {"id": tarea["id"], "imagen": tarea["imagen"], "taxonomia": tarea["taxonomia"]}
+    try:
+        imagen = leer_imagen(tarea["imagen"])
+        resultado = producir_item(imagen, tarea["taxonomia"], tarea["contexto"],
+                                  args.modelo_generador, args.modelo_auditor,
+                                  max_intentos=args.intentos, antes_de_llamar=limitador.esperar)
+        registro.update(intentos=resultado["intentos"], auditoria=resultado["auditoria"])
+        if not resultado["aprobado"]:
+            registro.update(estado="rechazado", feedback=resultado["feedback"])
+            return registro
+
+        item = resultado["item"]
+        specs, rutas = {}, {}
+        if args.graficos:
+            specs, rutas = generar_graficos(item, args.salida, tarea["id"], limitador.esperar,
+                                            formatos_extra=args.formatos_graficos)
+        datos = item_a_datos_exportables(item, specs)
+
+        if args.sin_oportunidad:
+            oportunidad = OPORTUNIDAD_MEJORA_POR_DEFECTO
+        else:
+            limitador.esperar()
+            oportunidad = generar_oportunidad_mejora_llm(tarea["taxonomia"], datos.get("justificacion_clave", ""),
+                                                         args.modelo_auditor)
+
+        ruta_word = None
+        if args.word:
+            buf = crear_word(datos, tarea["taxonomia"], oportunidad)
+            if buf is not None:
+                ruta_word = os.path.join(args.salida, "word", f"{tarea['id']}.docx")
+                with open(ruta_word, "wb") as f:
+                    f.write(buf.getvalue())
+
+        registro.update(estado="aprobado", item=datos, oportunidad=oportunidad, graficos=rutas, word=ruta_word)
+    except Exception as e:
+        registro.update(estado="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        registro["segundos"] = round(time.perf_counter() - t0, 2)
+    return registro
+
+
+def escribir_excel_final(carpeta, registros, parquet=False):
+    """items.xlsx (y items.parquet si se pide) con todas las filas aprobadas, en el orden dado."""
+    ruta = os.path.join(carpeta, "items.xlsx")
+    ruta_parquet = os.path.join(carpeta, "items.parquet") if parquet else None
+    # Mismas columnas que el Excel de la app: el id del manifiesto ya va en "ID ÍTEM"
+    with ExportadorExcel(ruta, COLUMNAS_EXCEL, hoja="Items Generados", parquet=ruta_parquet) as exportador:
+        for registro in registros.values():
+            if registro["estado"] == "aprobado":
+                exportador.agregar(_fila_csv(registro))
+    return ruta
+
+
+def _imagenes_registro(registro):
+    imagenes = {}
+    for elemento, ruta in (registro.get("graficos") or {}).items():
+        if os.path.exists(ruta):
+            with open(ruta, "rb") as f:
+                imagenes[elemento] = f.read()
+    return imagenes
+
+
+def escribir_word_unico(carpeta, registros):
+    """lote.docx con todos los ítems aprobados (uno por página y los gráficos como imagen)."""
+    ruta = os.path.join(carpeta, "lote.docx")
+    items = ((r["item"], r["taxonomia"], r["oportunidad"], _imagenes_registro(r))
+             for r in registros.values() if r["estado"] == "aprobado")
+    return ruta if crear_word_lote(items, destino=ruta) is not None else None
+
+
+def _lista_formatos(texto):
+    formatos = tuple(f.strip().lower() for f in texto.split(",") if f.strip())
+    invalidos = [f for f in formatos if f not in ("png", "svg", "pdf", "webp")]
+    if invalidos:
+        raise argparse.ArgumentTypeError(f"formato(s) no soportado(s): {', '.join(invalidos)}")
+    return formatos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera y audita ítems espejo por lotes a partir de un manifiesto.")
+    parser.add_argument("manifiesto", help="CSV o JSONL con id, imagen, taxonomía y contexto")
+    parser.add_argument("--salida", default="lote_salida", help="carpeta de resultados (checkpoint, CSV, Excel, Word, PNG)")
+    parser.add_argument("--modelo-generador", default=MODELO_POR_DEFECTO)
+    parser.add_argument("--modelo-auditor", default=MODELO_POR_DEFECTO)
+    parser.add_argument("--concurrencia", type=int, default=LOTE_CONCURRENCIA, help="ítems en paralelo")
+    parser.add_argument("--rpm", type=float, default=LOTE_RPM, help="llamadas a Gemini por minuto (0 = sin límite)")
+    parser.add_argument("--intentos", type=int, default=3, help="intentos por ítem (generador + auditor)")
+    parser.add_argument("--graficos", action="store_true", help="generar el JSON y el PNG de los gráficos")
+    parser.add_argument("--formatos-graficos", type=_lista_formatos, default=(),
+                        help="con --graficos, formatos adicionales al PNG separados por comas (svg,pdf,webp)")
+    parser.add_argument("--word", action="store_true", help="generar un .docx por ítem con la plantilla de GCS")
+    parser.add_argument("--word-unico", action="store_true",
+                        help="al final, un solo lote.docx con todos los ítems aprobados")
+    parser.add_argument("--parquet", action="store_true", help="escribir también items.parquet (requiere pyarrow)")
+    parser.add_argument("--sin-oportunidad", action="store_true", help="usar la oportunidad de mejora por defecto")
+    parser.add_argument("--reintentar-rechazados", action="store_true",
+                        help="volver a procesar también los ítems rechazados por el auditor")
+    args = parser.parse_args(argv)
+
+    tareas = leer_manifiesto(args.manifiesto)
+    for sub in ("", "graficos", "word"):
+        os.makedirs(os.path.join(args.salida, sub), exist_ok=True)
+
+    previos = leer_checkpoint(os.path.join(args.salida, "checkpoint.jsonl"))
+    terminados = ("aprobado",) if args.reintentar_rechazados else ESTADOS_TERMINADOS
+    pendientes = [t for t in tareas if previos.get(t["id"], {}).get("estado") not in terminados]
+    print(f"📋 {len(tareas)} ítems en el manifiesto; {len(tareas) - len(pendientes)} ya terminados, "
+          f"{len(pendientes)} pendientes.")
+
+    salida = SalidaLote(args.salida, previos)
+    registros = dict(previos)
+    if pendientes:
+        iniciar_vertex()
+        limitador = LimitadorTasa(args.rpm)
+        pool = ThreadPoolExecutor(max_workers=max(1, args.concurrencia))
+        try:
+            futuros = {pool.submit(procesar_tarea, t, args, limitador): t["id"] for t in pendientes}
+            for hechos, futuro in enumerate(as_completed(futuros), start=1):
+                registro = futuro.result()
+                salida.guardar(registro)
+                registros[registro["id"]] = registro
+                detalle = registro.get("error") or f"{registro.get('intentos', 0)} intento(s)"
+                print(f"[{hechos}/{len(pendientes)}] {registro['id']}: {registro['estado']} "
+                      f"({detalle}, {registro['segundos']} s)")
+        except KeyboardInterrupt:
+            print("⏹️ Interrumpido: lo terminado ya está en el checkpoint; relanza el comando para continuar.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            return 130
+        pool.shutdown()
+
+    # El Excel final se arma desde el checkpoint, en el orden del manifiesto
+    orden = {t["id"]: i for i, t in enumerate(tareas)}
+    registros = dict(sorted(registros.items(), key=lambda kv: orden.get(kv[0], len(orden))))
+    ruta_excel = escribir_excel_final(args.salida, registros, parquet=args.parquet)
+    if args.word_unico:
+        ruta_word = escribir_word_unico(args.salida, registros)
+        if ruta_word:
+            print(f"📄 Word del lote: {ruta_word}")
+
+    conteo = {}
+    for r in registros.values():
+        conteo[r["estado"]] = conteo.get(r["estado"], 0) + 1
+    print(f"✅ Resultados en '{args.salida}': {conteo}. Excel: {ruta_excel}")
+    return 0 if not conteo.get("error") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
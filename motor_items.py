@@ -0,0 +1,947 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de ítems espejo: generador, auditor, oportunidad de mejora y exportadores (Word/Excel).
+
+Es la parte de app.py que no depende de la interfaz, para que la app de Streamlit y el
+modo por lotes (lote_items.py) usen exactamente el mismo código. Los errores se informan
+con reportar_error: st.error dentro de una sesión de Streamlit, print fuera de ella.
+"""
+import io
+import os
+import re
+import copy
+import json
+import time
+import random
+import threading
+
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.oxml.shape import CT_Inline
+from docx.shared import Inches
+from docx.text.paragraph import Paragraph
+from vertexai.generative_models import GenerationConfig
+
+from clientes_gcp import GCP_PROJECT, obtener_modelo, obtener_storage, generar_con_prefijo
+from json_incremental import ParserJSONIncremental
+from reglas_auditoria import pre_auditar_item
+from imagenes_item import parte_imagen
+from exportador_excel import ExportadorExcel
+
+# Reglas deterministas (reglas_auditoria) antes del auditor LLM; PREAUDITORIA_LOCAL=0 las desactiva
+PREAUDITORIA_LOCAL = os.environ.get("PREAUDITORIA_LOCAL", "1").strip().lower() not in ("0", "false", "no")
+
+
+def reportar_error(mensaje):
+    """st.error si hay una sesión de Streamlit activa (ScriptRunContext); si no, print."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        if get_script_run_ctx(suppress_warning=True) is not None:
+            import streamlit as st
+            st.error(mensaje)
+            return
+    except ImportError:
+        pass
+    print(f"❌ {mensaje}")
+
+
+# --- 1. FUNCIÓN DEL GENERADOR (CORREGIDA PARA TEXTO NATURAL PURO) ---
+GENERADOR_STREAMING = os.environ.get("GENERADOR_STREAMING", "1").strip().lower() not in ("0", "false", "no")
+
+# --- Prefijo estático del Generador (se cachea en Vertex; ver clientes_gcp.generar_con_prefijo) ---
+INSTRUCCIONES_GENERADOR = """
+    Eres un  experto en evaluación educativa, con especialización en el diseño de ítems de lectura crítica para pruebas estandarizadas de alto impacto, como la prueba Saber 11 en Colombia. Tu misión es crear una pregunta espejo que sea un clon psicométrico de la pregunta original. Esto significa que, aunque se aplique a un texto nuevo, debe evaluar exactamente la misma habilidad, con el mismo formato y nivel de dificultad, garantizando que ambos ítems sean funcionalmente equivalentes.
+
+    **Shell Cognitivo (Pregunta Original):**
+    Analiza la estructura lógica y la "Tarea Cognitiva" de la pregunta en la IMAGEN ADJUNTA.
+    - Si la pregunta original usa una tabla o gráfico, tu ítem espejo también debería usar uno.
+    - **¡IMPORTANTE!** Si las *opciones de respuesta* en la imagen original son gráficas o tablas, debes replicar esa estructura para las opciones del ítem espejo.
+    2. Análisis de la pregunta modelo
+
+    Identifica la habilidad cognitiva (p. ej., inferencia, comprensión literal, vocabulario).
+    Observa el formato (cita breve, expresión subrayada, pregunta abierta, etc.).
+    Revisa el tipo de distractores (antónimos, conceptos afines, distractores temáticos).
+      
+    **¡INSTRUCCIÓN CRÍTICA DE SIMILITUD!**
+        1.  **NO CAMBIES LA ESTRUCTURA**: Si la pregunta usa una tabla, tu ítem espejo debe usar una tabla con la MISMA ESTRUCTURA (mismas columnas y filas).
+        2.  **DEBES CAMBIAR**:
+            - Los **valores numéricos** 
+            - Los **nombres ficticios**
+            - Los **contextos**
+        3. Creación de la pregunta espejo
+        Sobre el texto nuevo, elabora una pregunta que:
+        Evalúe la misma competencia y evidencia, con igual nivel de dificultad.
+        Repita el formato estructural.
+        Garantice una respuesta correcta única y clara; los distractores deben ser plausibles, pero inequívocamente incorrectos.
+        Utilice vocabulario y complejidad adecuados para estudiantes de grado 11.
+
+    **Taxonomía Requerida (Tu Guía):** la de la sección "TAXONOMÍA REQUERIDA" del mensaje.
+    **Contexto Adicional del Usuario (Tema del ítem nuevo):** el de la sección "CONTEXTO ADICIONAL" del mensaje.
+
+    --- ANÁLISIS COGNITIVO OBLIGATORIO (Tu paso 1) ---
+    Basado en la taxonomía (Evidencia, Afirmación, Competencia), define la Tarea Cognitiva exacta que el ítem espejo debe evaluar.
+    
+    --- CONSTRUCCIÓN DEL ÍTEM (Tu paso 2) ---
+    Basado en tu análisis, construye el ítem.
+    - ENUNCIADO: Debe ser claro y **NO** usar jerarquías ("más", "mejor", "principalmente").
+    - CLAVE: La respuesta correcta DEBE ser la opción indicada en la sección "CLAVE ASIGNADA" del mensaje.
+    - DISTRACTORES: Plausibles, basados en errores comunes de la Tarea Cognitiva. Deben tener la redacción "El estudiante podria escoger la opción XX porque... Sin embargo esto es incorrecto porque...
+    - DIFERENCIAS CON EL ITEM INICIAL: *CRITICO* NO se puede usar ninguno de los valores numéricos del ítem inicial. Deben ser totalmente diferentes.
+    
+    
+    --- INSTRUCCIONES DE SALIDA PARA GRÁFICO (ENUNCIADO Y OPCIONES) ---
+    ¡INSTRUCCIÓN CRÍTICA! Para los gráficos, NO debes generar el JSON.
+    En su lugar, proporciona una descripción detallada en LENGUAJE NATURAL de lo que el gráfico debe mostrar.
+    
+    Si el elemento (enunciado u opción) NO necesita un gráfico, usa "NO" y "N/A".
+    Si SÍ necesita un gráfico, usa "SÍ" y escribe la descripción.
+    
+    Ejemplo de descripción: "Una tabla de 3 columnas y 2 filas. Las columnas son 'País', 'Capital', 'Población'. La primera fila es 'Colombia', 'Bogotá', '8M'. La segunda es 'Argentina', 'Buenos Aires', '3M'."
+    Otro ejemplo: "Un gráfico de barras verticales simple con 3 barras. El eje X tiene las etiquetas 'A', 'B', 'C'. El eje Y (valores) tiene '10', '20', '15'."
+
+    --- FORMATO DE SALIDA OBLIGATORIO (JSON VÁLIDO) ---
+    Responde ÚNICAMENTE con el objeto JSON. No incluyas ```json.
+    {
+      "pregunta_espejo": "Texto completo del enunciado/stem...",
+      "clave": "LETRA DE LA CLAVE ASIGNADA",
+      "descripcion_imagen_original": "Descripción de la imagen que el usuario subió...",
+      "justificacion_clave": "Razón por la que la clave es correcta...",
+      
+      "grafico_necesario_enunciado": "SÍ",
+      "descripcion_texto_grafico_enunciado": "Una tabla simple. La primera fila es el encabezado con 'País' y 'Capital'. La segunda fila tiene 'Colombia' y 'Bogotá'.",
+      
+      "opciones": {
+        "A": {
+          "texto": "Ver gráfico A",
+          "grafico_necesario": "SÍ",
+          "descripcion_texto_grafico": "Un gráfico de barras verticales simple. El eje X tiene dos categorías: 'X' y 'Y'. Los valores del eje Y son 5 para 'X' y 10 para 'Y'."
+        },
+        "B": {
+          "texto": "Texto de la Opción B (sin gráfico)",
+          "grafico_necesario": "NO",
+          "descripcion_texto_grafico": "N/A"
+        },
+        "C": {
+          "texto": "Texto de la Opción C",
+          "grafico_necesario": "NO",
+          "descripcion_texto_grafico": "N/A"
+        },
+        "D": {
+          "texto": "Texto de la Opción D",
+          "grafico_necesario": "NO",
+          "descripcion_texto_grafico": "N/A"
+        }
+      },
+      
+      "justificaciones_distractores": [
+        { "opcion": "A", "justificacion": "Justificación para A..." },
+        { "opcion": "B", "justificacion": "Justificación para B..." },
+        { "opcion": "C", "justificacion": "Justificación para C..." },
+        { "opcion": "D", "justificacion": "Justificación para D..." }
+      ]
+    }
+"""
+
+def generar_item_llm(imagen_cargada, taxonomia_dict, contexto_adicional, model_name, feedback_auditor="",
+                     al_recibir_campo=None, cancelar=None):
+    """
+    GENERADOR: Genera el ítem, pidiendo descripciones de gráficos en LENGUAJE NATURAL PURO.
+    Con streaming (GENERADOR_STREAMING, activo por defecto) llama a al_recibir_campo(campo, valor)
+    por cada campo de primer nivel apenas llega, y corta el stream cuando el objeto JSON cierra.
+    Si 'cancelar' (threading.Event) se activa, abandona el stream y devuelve None.
+    """
+    
+    # --- Procesamiento de Imagen ---
+    # Decodificada, reducida y recodificada una sola vez; los reintentos la toman de la caché (imagenes_item)
+    vertex_img = parte_imagen(imagen_cargada)
+
+    # --- Preparación de variables del Prompt ---
+    taxonomia_texto = "\n".join([f"* {k}: {v}" for k, v in taxonomia_dict.items()])
+    clave_aleatoria = random.choice(['A', 'B', 'C', 'D'])
+
+    seccion_feedback = ""
+    if feedback_auditor:
+        seccion_feedback = f"""
+        --- RETROALIMENTACIÓN DE AUDITORÍA (Error a corregir) ---
+        El intento anterior fue rechazado. DEBES corregir los siguientes errores:
+        {feedback_auditor}
+        --- VUELVE A GENERAR EL ÍTEM CORRIGIENDO ESTO ---
+        """
+
+    # --- 4. Diseño del Prompt (Generador) ---
+    # Las instrucciones estáticas (INSTRUCCIONES_GENERADOR) van como prefijo en caché; aquí solo lo que cambia por ítem
+    prompt_texto = f"""
+    {seccion_feedback}
+    --- TAXONOMÍA REQUERIDA ---
+    {taxonomia_texto}
+
+    --- CONTEXTO ADICIONAL (Tema del ítem nuevo) ---
+    {contexto_adicional}
+
+    --- CLAVE ASIGNADA ---
+    La respuesta correcta DEBE ser la opción **{clave_aleatoria}** (en el JSON: "clave": "{clave_aleatoria}").
+    """
+
+    config_generacion = GenerationConfig(
+        response_mime_type="application/json"
+    )
+
+    try:
+        # --- 1. LLAMADA A LA API ---
+        if GENERADOR_STREAMING:
+            parser = ParserJSONIncremental()
+            respuesta_stream = generar_con_prefijo(
+                model_name, INSTRUCCIONES_GENERADOR,
+                [vertex_img, prompt_texto],
+                generation_config=config_generacion,
+                stream=True
+            )
+            trozos = []
+            parser_ok = True
+            for chunk in respuesta_stream:
+                if cancelar is not None and cancelar.is_set():
+                    return None  # otro candidato ya fue aprobado (modo especulativo)
+                try:
+                    trozo = chunk.text
+                except (ValueError, AttributeError):
+                    continue  # chunk sin texto (p. ej. solo metadatos)
+                trozos.append(trozo)
+                if not parser_ok:
+                    continue
+                try:
+                    campos_nuevos = parser.alimentar(trozo)
+                except json.JSONDecodeError:
+                    # Valor malformado: se sigue acumulando y al final se intenta la limpieza clásica
+                    parser_ok = False
+                    continue
+                if al_recibir_campo is not None:
+                    for campo, valor in campos_nuevos:
+                        al_recibir_campo(campo, valor)
+                if parser.completo:
+                    return parser.json_str  # el auditor puede empezar sin esperar el resto del stream
+            raw_text = "".join(trozos)
+        else:
+            response = generar_con_prefijo(
+                model_name, INSTRUCCIONES_GENERADOR,
+                [vertex_img, prompt_texto], 
+                generation_config=config_generacion
+            )
+            raw_text = response.text
+        
+        # --- 2. MEJORA: LIMPIEZA DE JSON ---
+        try:
+            start_index = raw_text.find('{')
+            end_index = raw_text.rfind('}') + 1
+            if start_index == -1 or end_index == 0:
+                raise ValueError("No se encontraron los delimitadores JSON '{' o '}'.")
+            json_str = raw_text[start_index:end_index]
+            item_obj = json.loads(json_str)
+            if al_recibir_campo is not None and isinstance(item_obj, dict):
+                # Sin streaming (o si el stream no se pudo parsear) los campos llegan todos juntos
+                for campo, valor in item_obj.items():
+                    al_recibir_campo(campo, valor)
+            return json_str
+        
+        except (ValueError, json.JSONDecodeError) as json_e:
+            reportar_error(f"Error al limpiar/parsear la respuesta del Generador: {json_e}")
+            reportar_error(f"Respuesta cruda recibida (esto puede ayudar a depurar): {raw_text}")
+            return None
+        # --- FIN DE LA MEJORA DE LIMPIEZA ---
+
+    except Exception as e:
+        reportar_error(f"Error al contactar Vertex AI (Generador): {e}")
+        return None
+
+
+# --- Prefijo estático del Auditor (se cachea en Vertex; ver clientes_gcp.generar_con_prefijo) ---
+INSTRUCCIONES_AUDITOR = """
+    Eres un auditor psicométrico experto y riguroso. Tu tarea es auditar el siguiente ítem (en JSON)
+    contra la taxonomía y las reglas de estilo.
+    
+    **Taxonomía de Referencia (ObligatorIA):** la de la sección "TAXONOMÍA DE REFERENCIA" del mensaje.
+    **Ítem Generado (JSON a Auditar):** el de la sección "ÍTEM A AUDITAR" del mensaje.
+
+    --- CRITERIOS DE AUDITORÍA (Evalúa uno por uno) ---
+    1.  **Alineación con Taxonomía:** ¿El ítem evalúa CLARAMENTE la Evidencia, Afirmación y Competencia?
+    2.  **Estilo del Enunciado (No Jerarquización):** ¿El enunciado usa palabras prohibidas como "más", "mejor", "principalmente"? (RECHAZO automático).
+    3.  **Calidad de Distractores:** ¿Las justificaciones de los distractores explican el *error* (ej. "El estudiante podría...")?
+    4.  **Clave y Opciones:** ¿Hay 4 opciones? ¿La clave coincide con una opción?
+    5.  **Coherencia de Gráficos (¡ACTUALIZADO!):** - ¿Es coherente el "grafico_necesario_enunciado" con la pregunta?
+        - ¿Son coherentes los "grafico_necesario" DENTRO de cada opción?
+        - Si un gráfico existe, ¿es un JSON válido?
+
+    --- FORMATO DE SALIDA OBLIGATORIO (JSON VÁLIDO) ---
+    Devuelve tu auditoría como un único objeto JSON. No uses ```json.
+    {
+      "criterios": [
+        { "criterio": "1. Alineación con Taxonomía", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." },
+        { "criterio": "2. Estilo (No Jerarquización)", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." },
+        { "criterio": "3. Calidad de Distractores", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." },
+        { "criterio": "4. Clave y Opciones", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." },
+        { "criterio": "5. Coherencia de Gráficos", "estado": "✅ CUMPLE" o "❌ NO CUMPLE", "comentario": "Justificación breve." }
+      ],
+      "dictamen_final": "✅ CUMPLE" o "❌ RECHAZADO",
+      "observaciones_finales": "Si es RECHAZADO, explica aquí CLARAMENTE qué debe corregir el generador. (Ej: 'El enunciado usa la palabra 'principalmente'. O 'El gráfico de la opción C es SÍ pero no se proporcionó JSON.')"
+    }
+"""
+
+# --- 2. FUNCIÓN DEL AUDITOR (ACTUALIZADA CON LIMPIEZA DE JSON) ---
+def auditar_item_llm(item_json_texto, taxonomia_dict, model_name):
+    """
+    AUDITOR: Audita el ítem Y la coherencia de los gráficos (enunciado Y opciones).
+    """
+    
+    taxonomia_texto = "\n".join([f"* {k}: {v}" for k, v in taxonomia_dict.items()])
+
+    # Las instrucciones y criterios (INSTRUCCIONES_AUDITOR) van como prefijo en caché
+    prompt_auditor = f"""
+    --- TAXONOMÍA DE REFERENCIA ---
+    {taxonomia_texto}
+
+    --- ÍTEM A AUDITAR (JSON) ---
+    {item_json_texto}
+    """
+    
+    config_generacion = GenerationConfig(
+        response_mime_type="application/json"
+    )
+
+    try:
+        response = generar_con_prefijo(
+            model_name, INSTRUCCIONES_AUDITOR,
+            prompt_auditor, 
+            generation_config=config_generacion
+        )
+        
+        raw_text = response.text
+        
+        # --- INICIO DE LA MEJORA: LIMPIEZA DE JSON (AUDITOR) ---
+        try:
+            # Encuentra el primer { y el último } para eliminar texto extra
+            start_index = raw_text.find('{')
+            end_index = raw_text.rfind('}') + 1
+            
+            if start_index == -1 or end_index == 0:
+                raise ValueError("No se encontraron los delimitadores JSON '{' o '}'.")
+
+            # Extrae solo el JSON
+            json_str = raw_text[start_index:end_index]
+            
+            # Valida que es un JSON antes de devolver
+            json.loads(json_str) 
+            return json_str
+        
+        except (ValueError, json.JSONDecodeError) as json_e:
+            reportar_error(f"Error al limpiar/parsear la respuesta del Auditor: {json_e}")
+            reportar_error(f"Respuesta cruda recibida (esto puede ayudar a depurar): {raw_text}")
+            return None
+        # --- FIN DE LA MEJORA DE LIMPIEZA ---
+
+    except Exception as e:
+        reportar_error(f"Error al contactar Vertex AI (Auditor): {e}")
+        return None
+
+
+# --- 3. FUNCIONES DE EXPORTACIÓN (ACTUALIZADAS) ---
+
+# Motor de placeholders de una sola pasada: un único patrón compilado encuentra los '{{...}}'
+# (aunque Word los haya partido en varios runs) y se buscan en el diccionario de reemplazos.
+PATRON_PLACEHOLDER = re.compile(r"\{\{.*?\}\}", re.DOTALL)
+
+def _normalizar_placeholder(token):
+    """'{{  Clave }}' -> '{{Clave}}' (tolera espacios dentro de las llaves)."""
+    return "{{" + token[2:-2].strip() + "}}"
+
+def _iterar_parrafos(doc):
+    """Párrafos del cuerpo y de las celdas de las tablas, siempre en el mismo orden."""
+    yield from doc.paragraphs
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                yield from cell.paragraphs
+
+def indexar_placeholders(doc):
+    """
+    Índice de la plantilla: posiciones (según _iterar_parrafos) de los párrafos con placeholders.
+    Se calcula una vez por plantilla y vale para cualquier copia (deepcopy) de ella.
+    """
+    return [i for i, p in enumerate(_iterar_parrafos(doc)) if PATRON_PLACEHOLDER.search(p.text)]
+
+def _reemplazar_en_parrafo(p, buscar):
+    """Sustituye los placeholders del párrafo tocando solo los runs implicados (conserva el formato)."""
+    runs = p.runs
+    textos = [r.text for r in runs]
+    completo = "".join(textos)
+    coincidencias = [(m.span(), buscar(m.group(0))) for m in PATRON_PLACEHOLDER.finditer(completo)]
+    coincidencias = [(span, valor) for span, valor in coincidencias if valor is not None]
+    if not coincidencias:
+        return
+
+    inicios, acumulado = [], 0
+    for t in textos:
+        inicios.append(acumulado)
+        acumulado += len(t)
+
+    def _run_de(offset):
+        i = len(inicios) - 1
+        while i > 0 and inicios[i] > offset:
+            i -= 1
+        return i
+
+    nuevos = list(textos)
+    # De atrás hacia adelante: cada cambio solo afecta texto posterior al inicio de la coincidencia
+    for (ini, fin), valor in reversed(coincidencias):
+        r_ini, r_fin = _run_de(ini), _run_de(fin - 1)
+        off_ini, off_fin = ini - inicios[r_ini], fin - inicios[r_fin]
+        if r_ini == r_fin:
+            nuevos[r_ini] = nuevos[r_ini][:off_ini] + valor + nuevos[r_ini][off_fin:]
+        else:
+            nuevos[r_ini] = nuevos[r_ini][:off_ini] + valor
+            for k in range(r_ini + 1, r_fin):
+                nuevos[k] = ""
+            nuevos[r_fin] = nuevos[r_fin][off_fin:]
+
+    for run, antes, despues in zip(runs, textos, nuevos):
+        if antes != despues:
+            run.text = despues
+
+def reemplazar_texto_en_doc(doc, reemplazos, indice=None):
+    """
+    Reemplaza los placeholders '{{...}}' de párrafos y tablas en una sola pasada.
+    Con 'indice' (ver indexar_placeholders) solo se visitan los párrafos que los contienen.
+    """
+    normalizados = {_normalizar_placeholder(k): v for k, v in reemplazos.items() if PATRON_PLACEHOLDER.fullmatch(k)}
+
+    def buscar(token):
+        valor = reemplazos.get(token)
+        if valor is None:
+            valor = normalizados.get(_normalizar_placeholder(token))
+        return None if valor is None else str(valor)
+
+    parrafos = _iterar_parrafos(doc)
+    if indice is not None:
+        todos = list(parrafos)
+        parrafos = (todos[i] for i in indice if i < len(todos))
+    for p in parrafos:
+        _reemplazar_en_parrafo(p, buscar)
+    return doc
+
+def verificar_llenado_plantilla(documento, indice=None):
+    """
+    Prueba de ida y vuelta: llena una copia de la plantilla, la guarda, la vuelve a abrir y
+    devuelve los placeholders que siguen en el archivo (lista vacía si todo se reemplazó).
+    """
+    copia = copy.deepcopy(documento)
+    tokens = {m.group(0) for p in _iterar_parrafos(copia) for m in PATRON_PLACEHOLDER.finditer(p.text)}
+    reemplazar_texto_en_doc(copia, {t: "x" for t in tokens}, indice=indice)
+    salida = io.BytesIO()
+    copia.save(salida)
+    salida.seek(0)
+    return sorted({m.group(0) for p in _iterar_parrafos(Document(salida)) for m in PATRON_PLACEHOLDER.finditer(p.text)})
+
+# --- 3. FUNCIONES DE EXPORTACIÓN (EXCEL REESCRITO CON AFIRMACIÓN) ---
+
+# Orden exacto de las columnas del Excel (una fila por ítem)
+COLUMNAS_EXCEL = [
+    "Área",
+    "RESPONSABLE",
+    "COMPONENTE",
+    "Competencia",
+    "Afirmación", # <-- AÑADIDA DE VUELTA
+    "Evidencia",
+    "PASTILLA",
+    "Temática",
+    "Dificultad estimada",
+    "Estándar",
+    "Estado",
+    "Nivel (curso)",
+    "Número en el PDF",
+    "ID ÍTEM",
+    "ID CONTEXTO",
+    "Guía (Primeras palabras del ítem)",
+    "Oportunidad de mejora",
+    "Justificación de la respuesta A",
+    "Justificación de la respuesta B",
+    "Justificación de la respuesta C",
+    "Justificación de la respuesta D",
+    "Clave"
+]
+
+def fila_excel(datos_generados, taxonomia_seleccionada, oportunidad_mejora):
+    """Dict con la fila del Excel de un ítem (claves = COLUMNAS_EXCEL)."""
+    # Mapear las justificaciones a un diccionario para fácil acceso
+    justificaciones = datos_generados.get("justificaciones_distractores", [])
+    justifs_map = {j.get('opcion'): j.get('justificacion') for j in justificaciones}
+
+    return {
+        # --- Columnas de Taxonomía ---
+        "Área": taxonomia_seleccionada.get("Área", "N/A"),
+        "RESPONSABLE": "IA ESPEJAZOS",
+        "COMPONENTE": taxonomia_seleccionada.get("Componente_Estructura", "N/A"),
+        "Competencia": taxonomia_seleccionada.get("Competencia", "N/A"),
+        "Afirmación": taxonomia_seleccionada.get("Afirmación", "N/A"),
+        "Evidencia": taxonomia_seleccionada.get("Evidencia", "N/A"),
+        "Temática": taxonomia_seleccionada.get("Ref. Temática", "N/A"),
+        "Nivel (curso)": taxonomia_seleccionada.get("Grado", "N/A"),
+
+        # --- Columnas de Metadatos (Fijas) ---
+        "PASTILLA": "NA",
+        "Dificultad estimada": "NA",
+        "Estándar": "NA",
+        "Estado": "Espejo",
+        "Número en el PDF": "NA",
+        "ID ÍTEM": "NA",
+        "ID CONTEXTO": "NA",
+
+        # --- Columnas de Contenido del Ítem ---
+        "Guía (Primeras palabras del ítem)": datos_generados.get("pregunta_espejo", "N/A"),
+        "Oportunidad de mejora": oportunidad_mejora,
+        "Justificación de la respuesta A": justifs_map.get("A", "N/A"),
+        "Justificación de la respuesta B": justifs_map.get("B", "N/A"),
+        "Justificación de la respuesta C": justifs_map.get("C", "N/A"),
+        "Justificación de la respuesta D": justifs_map.get("D", "N/A"),
+        "Clave": datos_generados.get("clave", "N/A")
+    }
+
+def crear_excel(datos_generados, taxonomia_seleccionada, oportunidad_mejora):
+    """
+    Crea un Excel en formato HORIZONTAL (una fila por ítem) con las columnas
+    específicas solicitadas.
+    """
+    with ExportadorExcel(io.BytesIO(), COLUMNAS_EXCEL) as exportador:
+        exportador.agregar(fila_excel(datos_generados, taxonomia_seleccionada, oportunidad_mejora))
+    return exportador.destino.getvalue()
+
+# --- 3a. PLANTILLA WORD CACHEADA POR PROCESO ---
+# La plantilla se descarga y parsea una sola vez; cada WORD_TEMPLATE_REVALIDAR_S segundos se
+# consulta solo la "generation" del blob en GCS y se vuelve a descargar únicamente si cambió.
+PLANTILLA_REVALIDAR_S = float(os.environ.get("WORD_TEMPLATE_REVALIDAR_S", "300"))
+_PLANTILLA_WORD = {"generacion": None, "documento": None, "indice": None, "revisado": 0.0}
+_PLANTILLA_LOCK = threading.Lock()
+
+def obtener_plantilla_word():
+    """
+    Devuelve (copia en memoria de la plantilla Word ya parseada, índice de placeholders).
+    Lanza FileNotFoundError si la plantilla no existe en el bucket.
+    """
+    bucket_name = os.environ.get("GCS_BUCKET_NAME", "bucket-espejos1")
+    template_name = os.environ.get("WORD_TEMPLATE_NAME", "formato_limpio.docx")
+    with _PLANTILLA_LOCK:
+        ahora = time.time()
+        if _PLANTILLA_WORD["documento"] is None or ahora - _PLANTILLA_WORD["revisado"] > PLANTILLA_REVALIDAR_S:
+            storage_client = obtener_storage(GCP_PROJECT)
+            blob = storage_client.bucket(bucket_name).get_blob(template_name)  # solo metadatos
+            if blob is None:
+                if _PLANTILLA_WORD["documento"] is None:
+                    raise FileNotFoundError(f"La plantilla '{template_name}' no se encontró en el bucket '{bucket_name}'.")
+                print(f"⚠️ La plantilla '{template_name}' ya no está en el bucket; se usa la versión en memoria.")
+            elif blob.generation != _PLANTILLA_WORD["generacion"]:
+                contenido = blob.download_as_bytes(if_generation_match=blob.generation)
+                documento = Document(io.BytesIO(contenido))
+                # El índice se calcula sobre una copia: recorrer doc.paragraphs deja en caché el
+                # envoltorio del cuerpo, y un deepcopy posterior lo separaría del XML que se guarda
+                indice = indexar_placeholders(copy.deepcopy(documento))
+                pendientes = verificar_llenado_plantilla(documento, indice)
+                if pendientes:
+                    raise RuntimeError(f"La plantilla '{template_name}' queda sin llenar al guardarla: {', '.join(pendientes)}")
+                _PLANTILLA_WORD["documento"], _PLANTILLA_WORD["indice"] = documento, indice
+                _PLANTILLA_WORD["generacion"] = blob.generation
+            _PLANTILLA_WORD["revisado"] = ahora
+        plantilla, indice = _PLANTILLA_WORD["documento"], _PLANTILLA_WORD["indice"]
+    # La plantilla compartida nunca se modifica: cada llenado trabaja sobre su propia copia
+    return copy.deepcopy(plantilla), indice
+
+
+def reemplazos_word(datos_editados, taxonomia_seleccionada, oportunidad_mejora):
+    """Diccionario placeholder -> texto para llenar la plantilla Word con un ítem."""
+    # 3. Preparar los distractores
+    clave = datos_editados.get("clave", "")
+    distractores_texto = []
+    for just in datos_editados.get("justificaciones_distractores", []):
+        opcion = just.get("opcion")
+        if opcion and opcion != clave:
+            distractores_texto.append(f"Opción {opcion}: {just.get('justificacion', 'N/A')}")
+    analisis_distractores = "\n".join(distractores_texto)
+
+    # 4. Preparar las instrucciones de gráficos (convierte JSON a string)
+    def get_grafico_json(data):
+        if not data or data == "[]" or data == []:
+            return "N/A"
+        # Usamos ensure_ascii=False para que no escape tildes (ej. \u00f3)
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    inst_enunciado = get_grafico_json(datos_editados.get("descripcion_grafico_enunciado", []))
+    inst_a = get_grafico_json(datos_editados.get("opciones", {}).get("A", {}).get("descripcion_grafico", []))
+    inst_b = get_grafico_json(datos_editados.get("opciones", {}).get("B", {}).get("descripcion_grafico", []))
+    inst_c = get_grafico_json(datos_editados.get("opciones", {}).get("C", {}).get("descripcion_grafico", []))
+    inst_d = get_grafico_json(datos_editados.get("opciones", {}).get("D", {}).get("descripcion_grafico", []))
+
+    # 5. Definir todos los reemplazos (¡TODOS CON str()!)
+    reemplazos = {
+        "{{ItemPruebaId}}": str(taxonomia_seleccionada.get("Área", "N/A")),
+        "{{ItemGradoId}}": str(taxonomia_seleccionada.get("Grado", "N/A")), 
+        "{{CompetenciaNombre}}": str(taxonomia_seleccionada.get("Competencia", "N/A")),
+        "{{ComponenteNombre}}": str(taxonomia_seleccionada.get("Componente_Estructura", "N/A")),
+        "{{AfirmacionNombre}}": str(taxonomia_seleccionada.get("Afirmación", "N/A")),
+        "{{EvidenciaNombre}}": str(taxonomia_seleccionada.get("Evidencia", "N/A")),
+        "{{ItemContexto}}": "", 
+        "{{ItemEnunciado}}": str(datos_editados.get("pregunta_espejo", "N/A")),
+        "{{Opción A}}": str(datos_editados.get("opciones", {}).get("A", {}).get("texto", "N/A")),
+        "{{Opción B}}": str(datos_editados.get("opciones", {}).get("B", {}).get("texto", "N/A")),
+        "{{Opción C}}": str(datos_editados.get("opciones", {}).get("C", {}).get("texto", "N/A")),
+        "{{Opción D}}": str(datos_editados.get("opciones", {}).get("D", {}).get("texto", "N/A")),
+        "{{  Clave}}": str(clave),
+        "{{Justificacion_Correcta}}": str(datos_editados.get("justificacion_clave", "N/A")),
+        "{{Analisis_Distractores}}": str(analisis_distractores),
+        "{{Instrucciones_enuncuado}}": str(inst_enunciado),
+        "{{Instrucciones_A}}": str(inst_a),
+        "{{Instrucciones_B}}": str(inst_b),
+        "{{Instrucciones_C}}": str(inst_c),
+        "{{Instrucciones_D}}": str(inst_d),
+        "Enunciado: {{Instrucciones_D}}": str(inst_d), # Por si acaso
+        "{{Oportunidad_mejora}}": str(oportunidad_mejora)
+    }
+    return reemplazos
+
+
+def crear_word(datos_editados, taxonomia_seleccionada, oportunidad_mejora):
+    """
+    Genera un documento Word rellenando una plantilla desde GCS.
+    """
+    try:
+        # 1. Copia en memoria de la plantilla (descargada de GCS una vez por proceso)
+        try:
+            doc, indice_placeholders = obtener_plantilla_word()
+        except FileNotFoundError as e:
+            reportar_error(f"Error: {e}")
+            return None
+        
+        # 2. Oportunidad de mejora (Ahora se recibe como argumento)
+        # (La llamada a la IA se eliminó de aquí)
+        
+        # 3-5. Distractores, instrucciones de gráficos y demás reemplazos
+        reemplazos = reemplazos_word(datos_editados, taxonomia_seleccionada, oportunidad_mejora)
+
+        # 6. Ejecutar los reemplazos
+        doc = reemplazar_texto_en_doc(doc, reemplazos, indice=indice_placeholders)
+
+        # 7. Guardar el documento final en un nuevo buffer
+        final_buffer = io.BytesIO()
+        doc.save(final_buffer)
+        final_buffer.seek(0)
+        return final_buffer
+
+    except Exception as e:
+        reportar_error(f"Error al crear el documento Word: {e}")
+        return None
+
+
+# --- 3b. WORD DE VARIOS ÍTEMS (UN SOLO DOCUMENTO) ---
+# El cuerpo de la plantilla se toma una vez como XML y se clona por ítem; los gráficos se insertan
+# como imagen en lugar del JSON de las "Instrucciones".
+WORD_GRAFICO_ANCHO_IN = float(os.environ.get("WORD_GRAFICO_ANCHO_IN", "4.5"))
+PLACEHOLDERS_GRAFICO = {
+    "enunciado": "{{Instrucciones_enuncuado}}",
+    "A": "{{Instrucciones_A}}",
+    "B": "{{Instrucciones_B}}",
+    "C": "{{Instrucciones_C}}",
+    "D": "{{Instrucciones_D}}",
+}
+
+def _specs_de(datos_editados, elemento):
+    if elemento == "enunciado":
+        specs = datos_editados.get("descripcion_grafico_enunciado")
+    else:
+        specs = datos_editados.get("opciones", {}).get(elemento, {}).get("descripcion_grafico")
+    if isinstance(specs, dict):
+        specs = [specs]
+    return [s for s in specs if isinstance(s, dict)] if isinstance(specs, list) else []
+
+def renderizar_graficos_item(datos_editados):
+    """{elemento: [PNG]} con crear_grafico (a resolución de exportación) para cada spec de 'descripcion_grafico' del ítem."""
+    try:
+        from graficos_plugins import crear_grafico, GRAFICOS_DPI_EXPORTACION
+    except ImportError:
+        return {}
+    imagenes = {}
+    for elemento in PLACEHOLDERS_GRAFICO:
+        for spec in _specs_de(datos_editados, elemento):
+            try:
+                buf = crear_grafico(tipo_grafico=spec.get("tipo_elemento"), datos=spec.get("datos", {}),
+                                    configuracion=spec.get("configuracion", {}),
+                                    formato="png", dpi=GRAFICOS_DPI_EXPORTACION)
+            except Exception as e:
+                print(f"⚠️ No se pudo renderizar el gráfico ({elemento}) para el Word: {e}")
+                continue
+            if buf is not None:
+                imagenes.setdefault(elemento, []).append(buf.getvalue())
+    return imagenes
+
+def _salto_de_pagina():
+    p, r, br = OxmlElement("w:p"), OxmlElement("w:r"), OxmlElement("w:br")
+    br.set(qn("w:type"), "page")
+    r.append(br)
+    p.append(r)
+    return p
+
+class _IdsDibujo:
+    """Ids únicos para wp:docPr sin recorrer todo el documento en cada imagen (StoryPart.next_id lo hace)."""
+
+    def __init__(self, cuerpo):
+        ids = [int(v) for v in cuerpo.xpath("//wp:docPr/@id") if str(v).isdigit()]
+        self._siguiente = max(ids, default=0) + 1
+
+    def nuevo(self):
+        valor = self._siguiente
+        self._siguiente += 1
+        return valor
+
+def _insertar_imagenes(parrafo, imagenes, parte, ids, ancho):
+    """Agrega las imágenes (PNG) como runs inline al final del párrafo."""
+    for png in imagenes:
+        rId, imagen = parte.get_or_add_image(io.BytesIO(png))  # mismo PNG -> misma parte de imagen
+        cx, cy = imagen.scaled_dimensions(Inches(ancho), None)
+        inline = CT_Inline.new_pic_inline(ids.nuevo(), rId, imagen.filename, cx, cy)
+        parrafo.add_run()._r.add_drawing(inline)
+
+def crear_word_lote(items, destino=None, renderizar_graficos=True, ancho_grafico=WORD_GRAFICO_ANCHO_IN):
+    """
+    Un solo documento Word con todos los ítems, uno por página.
+    'items' es un iterable de (datos_editados, taxonomia_seleccionada, oportunidad_mejora) o
+    (datos_editados, taxonomia_seleccionada, oportunidad_mejora, imagenes), con imagenes =
+    {"enunciado"|"A".."D": PNG o lista de PNG (bytes/BytesIO)}. Si no se dan imágenes y
+    renderizar_graficos es True, se renderizan con crear_grafico desde 'descripcion_grafico'.
+    Donde hay imagen, reemplaza al JSON de las "Instrucciones"; si no, queda el texto de siempre.
+    Guarda en 'destino' (ruta o archivo) o devuelve un BytesIO. Devuelve None si falla.
+    """
+    try:
+        try:
+            doc, _ = obtener_plantilla_word()  # una sola descarga/parseo para todo el lote
+        except FileNotFoundError as e:
+            reportar_error(f"Error: {e}")
+            return None
+
+        cuerpo = doc.element.body
+        sect_pr = cuerpo.find(qn("w:sectPr"))
+        # Modelo del cuerpo (sin las propiedades de sección, que quedan una sola vez al final)
+        modelo = [el for el in cuerpo.iterchildren() if el is not sect_pr]
+        ids = _IdsDibujo(cuerpo)
+        for el in modelo:
+            cuerpo.remove(el)
+
+        def _agregar(el):
+            if sect_pr is not None:
+                sect_pr.addprevious(el)
+            else:
+                cuerpo.append(el)
+
+        n = 0
+        for entrada in items:
+            datos_editados, taxonomia_seleccionada, oportunidad_mejora = entrada[:3]
+            imagenes = entrada[3] if len(entrada) > 3 and entrada[3] else None
+            if imagenes is None and renderizar_graficos:
+                imagenes = renderizar_graficos_item(datos_editados)
+            imagenes = {k: v if isinstance(v, list) else [v] for k, v in (imagenes or {}).items() if v}
+            imagenes = {k: [x.getvalue() if hasattr(x, "getvalue") else x for x in v] for k, v in imagenes.items()}
+
+            reemplazos = reemplazos_word(datos_editados, taxonomia_seleccionada, oportunidad_mejora)
+            con_imagen = {PLACEHOLDERS_GRAFICO[k]: v for k, v in imagenes.items() if k in PLACEHOLDERS_GRAFICO}
+            for token in con_imagen:
+                reemplazos[token] = ""  # el texto JSON se quita; la imagen va en su lugar
+            normalizados = {_normalizar_placeholder(k): v for k, v in reemplazos.items() if PATRON_PLACEHOLDER.fullmatch(k)}
+
+            def buscar(token):
+                valor = reemplazos.get(token)
+                if valor is None:
+                    valor = normalizados.get(_normalizar_placeholder(token))
+                return None if valor is None else str(valor)
+
+            if n:
+                _agregar(_salto_de_pagina())
+            for el in modelo:
+                copia = copy.deepcopy(el)
+                _agregar(copia)
+                parrafos = [copia] if copia.tag == qn("w:p") else list(copia.iter(qn("w:p")))
+                for p_el in parrafos:
+                    parrafo = Paragraph(p_el, doc._body)
+                    texto = parrafo.text
+                    if "{{" not in texto:
+                        continue
+                    pendientes = [v for token, v in con_imagen.items()
+                                  if any(_normalizar_placeholder(m.group(0)) == _normalizar_placeholder(token)
+                                         for m in PATRON_PLACEHOLDER.finditer(texto))]
+                    _reemplazar_en_parrafo(parrafo, buscar)
+                    for pngs in pendientes:
+                        _insertar_imagenes(parrafo, pngs, doc.part, ids, ancho_grafico)
+            n += 1
+
+        salida = destino if destino is not None else io.BytesIO()
+        doc.save(salida)
+        if destino is None:
+            salida.seek(0)
+        return salida
+
+    except Exception as e:
+        reportar_error(f"Error al crear el documento Word del lote: {e}")
+        return None
+
+
+# --- 2b. NUEVA FUNCIÓN: GENERADOR DE OPORTUNIDAD DE MEJORA ---
+OPORTUNIDAD_MEJORA_POR_DEFECTO = "Para mejorar en esta habilidad, repasa los conceptos clave de la competencia y practica con ejercicios similares."
+
+def generar_oportunidad_mejora_llm(taxonomia_data, justificacion_clave, model_name):
+    """
+    Genera una breve recomendación académica basada en la habilidad evaluada.
+    """
+    try:
+        model = obtener_modelo(model_name)
+        
+        # Extraemos los datos clave para el prompt
+        evidencia = taxonomia_data.get("Evidencia", "la habilidad evaluada")
+        competencia = taxonomia_data.get("Competencia", "la competencia general")
+        
+        prompt = f"""
+        Eres un tutor académico experto. Tu tarea es escribir una breve recomendación (1-2 frases)
+        para un estudiante o profesor.
+        
+        HABILIDAD EVALUADA (Evidencia): {evidencia}
+        COMPETENCIA: {competencia}
+        JUSTIFICACIÓN DE LA RESPUESTA CORRECTA: {justificacion_clave}
+
+        Basado en esta información, escribe una recomendación fácil de aplicar durante clase.
+        Habla en tercera persona y manten un tono formal pero sencillo
+        NO uses más de 50 palabras.
+        """
+        
+        response = model.generate_content(prompt)
+        return response.text.strip()
+    
+    except Exception as e:
+        print(f"Error al generar oportunidad de mejora: {e}")
+        return OPORTUNIDAD_MEJORA_POR_DEFECTO
+
+
+# --- BUCLE GENERADOR → REGLAS LOCALES → AUDITOR (sin interfaz) ---
+def generar_y_auditar_candidato(imagen_bytes, taxonomia_dict, contexto_adicional, modelo_gen, modelo_aud, cancelar):
+    """Un candidato completo: genera (cancelable) y audita. Devuelve (item_json_str, campos, audit_data)."""
+    campos = {}
+    item_json_str = generar_item_llm(
+        io.BytesIO(imagen_bytes), taxonomia_dict, contexto_adicional, modelo_gen,
+        al_recibir_campo=campos.__setitem__, cancelar=cancelar
+    )
+    if item_json_str is None or cancelar.is_set():
+        return None, None, None
+    if PREAUDITORIA_LOCAL:
+        dictamen_local = pre_auditar_item(campos or item_json_str)
+        if dictamen_local is not None:
+            return item_json_str, campos, dictamen_local
+    audit_json_str = auditar_item_llm(item_json_str, taxonomia_dict, modelo_aud)
+    try:
+        audit_data = json.loads(audit_json_str) if audit_json_str else None
+    except json.JSONDecodeError:
+        audit_data = None
+    return item_json_str, campos, audit_data
+
+
+def producir_item(imagen, taxonomia_dict, contexto_adicional, modelo_gen, modelo_aud,
+                  max_intentos=3, antes_de_llamar=None, al_recibir_campo=None, al_avanzar=None,
+                  intento_inicial=0, feedback_inicial="", max_generaciones=None):
+    """
+    El bucle de reintentos del botón de la app (y del modo por lotes): genera, pasa las reglas
+    locales y el auditor, y reintenta con la retroalimentación hasta max_intentos.
+
+    - 'antes_de_llamar' se invoca antes de cada llamada a Gemini (p. ej. para limitar la tasa).
+    - 'al_recibir_campo(campo, valor)' recibe los campos del ítem a medida que llegan por streaming.
+    - 'al_avanzar(evento, intento, detalle)' informa el progreso de cada intento: "generando",
+      "error_generacion", "rechazado_local" (detalle = dictamen), "auditando", "error_auditoria",
+      "rechazado" (detalle = auditoría) y "aprobado" (detalle = auditoría).
+    - 'intento_inicial' y 'feedback_inicial' permiten continuar después de una ronda previa (la
+      especulativa de la app); 'max_generaciones' limita las generaciones de esta llamada.
+
+    Devuelve {"aprobado", "item", "item_json", "auditoria", "intentos", "feedback"}.
+    """
+    antes_de_llamar = antes_de_llamar or (lambda: None)
+    avisar = al_avanzar or (lambda evento, intento, detalle=None: None)
+    feedback_auditor = feedback_inicial
+    ultima_auditoria = None
+    ultimo = max_intentos if max_generaciones is None else min(max_intentos, intento_inicial + max_generaciones)
+    intento = intento_inicial
+    for intento in range(intento_inicial + 1, ultimo + 1):
+        campos = {}
+
+        def _al_recibir_campo(campo, valor):
+            campos[campo] = valor
+            if al_recibir_campo is not None:
+                al_recibir_campo(campo, valor)
+
+        avisar("generando", intento)
+        antes_de_llamar()
+        item_json_str = generar_item_llm(imagen, taxonomia_dict, contexto_adicional, modelo_gen,
+                                         feedback_auditor, al_recibir_campo=_al_recibir_campo)
+        if item_json_str is None:
+            avisar("error_generacion", intento)
+            continue
+
+        # Reglas locales: si fallan, el feedback vuelve al generador sin llamar al auditor LLM
+        dictamen_local = pre_auditar_item(campos or item_json_str) if PREAUDITORIA_LOCAL else None
+        if dictamen_local is not None:
+            ultima_auditoria = dictamen_local
+            feedback_auditor = dictamen_local["observaciones_finales"]
+            avisar("rechazado_local", intento, dictamen_local)
+            continue
+
+        avisar("auditando", intento)
+        antes_de_llamar()
+        audit_json_str = auditar_item_llm(item_json_str, taxonomia_dict, modelo_aud)
+        if audit_json_str is None:
+            avisar("error_auditoria", intento)
+            continue
+        try:
+            audit_data = json.loads(audit_json_str)
+        except json.JSONDecodeError:
+            reportar_error(f"Error al leer respuesta JSON del auditor: {audit_json_str}")
+            feedback_auditor = "La respuesta del auditor no fue un JSON válido."
+            continue
+
+        ultima_auditoria = audit_data
+        if audit_data.get("dictamen_final") == "✅ CUMPLE":
+            try:
+                item = campos or json.loads(item_json_str)
+            except json.JSONDecodeError:
+                reportar_error(f"Error al parsear el JSON final: {item_json_str}")
+                continue
+            avisar("aprobado", intento, audit_data)
+            return {"aprobado": True, "item": item, "item_json": item_json_str,
+                    "auditoria": audit_data, "intentos": intento, "feedback": ""}
+        feedback_auditor = audit_data.get("observaciones_finales", "Rechazado sin observaciones.")
+        avisar("rechazado", intento, audit_data)
+
+    return {"aprobado": False, "item": None, "item_json": None,
+            "auditoria": ultima_auditoria, "intentos": intento, "feedback": feedback_auditor}
+
+
+def item_a_datos_exportables(item, specs=None):
+    """
+    Arma desde la salida del generador el mismo dict que la app re-ensambla en el editor
+    (el que reciben crear_word/crear_excel). 'specs' = {"enunciado"|"A".."D": spec del gráfico}.
+    """
+    specs = specs or {}
+    opciones = item.get("opciones") if isinstance(item.get("opciones"), dict) else {}
+    datos = {
+        "pregunta_espejo": item.get("pregunta_espejo", ""),
+        "clave": item.get("clave", ""),
+        "justificacion_clave": item.get("justificacion_clave", ""),
+        "grafico_necesario_enunciado": item.get("grafico_necesario_enunciado", "NO"),
+        "descripcion_grafico_enunciado": [specs["enunciado"]] if specs.get("enunciado") else [],
+        "opciones": {},
+        "justificaciones_distractores": item.get("justificaciones_distractores", []),
+    }
+    for letra in ["A", "B", "C", "D"]:
+        opcion = opciones.get(letra) if isinstance(opciones.get(letra), dict) else {}
+        datos["opciones"][letra] = {
+            "texto": opcion.get("texto", ""),
+            "grafico_necesario": opcion.get("grafico_necesario", "NO"),
+            "descripcion_grafico": [specs[letra]] if specs.get(letra) else [],
+        }
+    return datos
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Pool de figuras de Matplotlib (Agg, sin pyplot) reutilizables entre renders.
+
+Los plugins piden su figura con ensure_fig_ax(ax, figsize=..., projection=...) en lugar de
+plt.subplots: la figura es una matplotlib.figure.Figure con su propio FigureCanvasAgg (no se
+registra en el estado global de pyplot, así que varios hilos pueden dibujar a la vez en
+figuras distintas). Tras el savefig, _renderizar_plugin la devuelve al pool, que la limpia
+(ax.clear(), márgenes y motor de layout por defecto) y la guarda para el próximo render con
+el mismo (figsize, proyección).
+
+Solo se reutilizan las proyecciones de FIGURAS_POOL_PROYECCIONES: limpiar unos ejes polares
+o 3D cuesta bastante menos que crearlos, pero en los ejes cartesianos ax.clear() cuesta lo
+mismo que crear la figura (ambos recrean los ticks), así que por defecto esos se crean nuevos.
+Una figura que el plugin dejó con ejes extra (p. ej. una barra de colores), textos o leyendas
+a nivel de figura, u otro tamaño, no vuelve al pool.
+
+Configuración por variables de entorno:
+- FIGURAS_POOL (1/0, por defecto 1)
+- FIGURAS_POOL_PROYECCIONES (por defecto "polar,3d"; "rectilinear" agrega los cartesianos)
+- FIGURAS_POR_CLAVE (figuras libres por (figsize, proyección), por defecto 4)
+- FIGURAS_POOL_MAX_CLAVES (por defecto 16; se descartan las claves menos usadas)
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+FIGURAS_POOL = os.environ.get("FIGURAS_POOL", "1").strip().lower() not in ("0", "false", "no")
+FIGURAS_POOL_PROYECCIONES = tuple(
+    p.strip().lower() for p in os.environ.get("FIGURAS_POOL_PROYECCIONES", "polar,3d").split(",") if p.strip()
+)
+FIGURAS_POR_CLAVE = int(os.environ.get("FIGURAS_POR_CLAVE", "4"))
+FIGURAS_POOL_MAX_CLAVES = int(os.environ.get("FIGURAS_POOL_MAX_CLAVES", "16"))
+
+_MARGENES = ("left", "right", "top", "bottom", "wspace", "hspace")
+
+
+def _clave(figsize, projection) -> tuple:
+    ancho, alto = figsize
+    return round(float(ancho), 3), round(float(alto), 3), str(projection or "rectilinear").lower()
+
+
+def nueva_figura(figsize=None, projection=None):
+    """Figure + FigureCanvasAgg + un Axes, sin pasar por pyplot."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    if projection == "3d":
+        from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 (registra la proyección '3d')
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(projection=projection)
+    return fig, ax
+
+
+def _estado_inicial(fig, ax) -> dict:
+    """Propiedades de la figura recién creada que ax.clear() no restablece."""
+    get_frame_on = getattr(ax, "get_frame_on", None)  # los ejes 3D no tienen marco
+    return {"facecolor": tuple(fig.get_facecolor()), "aspect": ax.get_aspect(), "adjustable": ax.get_adjustable(),
+            "anchor": ax.get_anchor(), "frame_on": get_frame_on() if callable(get_frame_on) else None}
+
+
+class PoolFiguras:
+    """Figuras libres por (ancho, alto, proyección); tomar() y devolver() son seguros entre hilos."""
+
+    def __init__(self, por_clave: int = FIGURAS_POR_CLAVE, max_claves: int = FIGURAS_POOL_MAX_CLAVES,
+                 proyecciones=FIGURAS_POOL_PROYECCIONES):
+        self.por_clave = max(0, int(por_clave))
+        self.max_claves = max(1, int(max_claves))
+        self.proyecciones = tuple(proyecciones)
+        self._libres = OrderedDict()                   # clave -> [(fig, ax, inicial), ...]
+        self._prestadas = weakref.WeakKeyDictionary()  # fig -> (clave, ax, inicial)
+        self._lock = threading.Lock()
+        self._reusos = 0
+        self._creadas = 0
+        self._descartadas = 0
+
+    def usa_pool(self, projection=None) -> bool:
+        return str(projection or "rectilinear").lower() in self.proyecciones and self.por_clave > 0
+
+    def tomar(self, figsize, projection=None):
+        """(fig, ax) libre para ese tamaño y proyección; si no hay, se crea una nueva."""
+        clave = _clave(figsize, projection)
+        par = None
+        with self._lock:
+            libres = self._libres.get(clave)
+            if libres:
+                par = libres.pop()
+                self._libres.move_to_end(clave)
+                self._reusos += 1
+            else:
+                self._creadas += 1
+        if par is None:
+            fig, ax = nueva_figura(figsize, projection)
+            par = (fig, ax, _estado_inicial(fig, ax))
+        fig, ax, inicial = par
+        with self._lock:
+            self._prestadas[fig] = (clave, ax, inicial)
+        return fig, ax
+
+    def _esta_limpia(self, fig, clave, ax, inicial) -> bool:
+        """True si el plugin solo dibujó dentro del Axes original (nada que ax.clear() no borre)."""
+        if fig.axes != [ax] or fig.texts or fig.legends or fig.patches or fig.lines or fig.images or fig.artists:
+            return False
+        if getattr(fig, "_suptitle", None) is not None or getattr(fig, "_supxlabel", None) is not None \
+                or getattr(fig, "_supylabel", None) is not None:
+            return False
+        ancho, alto = fig.get_size_inches()
+        return (round(float(ancho), 3), round(float(alto), 3)) == clave[:2] and tuple(fig.get_facecolor()) == inicial["facecolor"]
+
+    def devolver(self, fig) -> bool:
+        """Limpia la figura y la deja libre para otro render. False si no es del pool o se descartó."""
+        with self._lock:
+            prestada = self._prestadas.pop(fig, None)
+        if prestada is None:
+            return False
+        clave, ax, inicial = prestada
+        try:
+            if not self._esta_limpia(fig, clave, ax, inicial):
+                raise ValueError("figura modificada fuera del Axes")
+            import matplotlib
+            ax.clear()
+            # ax.clear() no restablece la relación de aspecto ni el marco (p. ej. tras ax.axis("equal") de un pie)
+            ax.set_aspect(inicial["aspect"], adjustable=inicial["adjustable"], anchor=inicial["anchor"])
+            if inicial["frame_on"] is not None:
+                ax.set_frame_on(inicial["frame_on"])
+            ax.set_in_layout(True)
+            fig.set_layout_engine(None)
+            fig.subplots_adjust(**{m: matplotlib.rcParams[f"figure.subplot.{m}"] for m in _MARGENES})
+        except Exception:
+            with self._lock:
+                self._descartadas += 1
+            return False
+        with self._lock:
+            libres = self._libres.setdefault(clave, [])
+            self._libres.move_to_end(clave)
+            if len(libres) < self.por_clave:
+                libres.append((fig, ax, inicial))
+            while len(self._libres) > self.max_claves:
+                self._libres.popitem(last=False)
+        return True
+
+    def vaciar(self) -> None:
+        with self._lock:
+            self._libres.clear()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {"reusos": self._reusos, "creadas": self._creadas, "descartadas": self._descartadas,
+                    "libres": sum(len(v) for v in self._libres.values()), "claves": len(self._libres),
+                    "proyecciones": list(self.proyecciones)}
+
+
+POOL_FIGURAS = PoolFiguras()
+
+
+def tomar_figura(figsize=None, projection=None):
+    """(fig, ax) para un plugin: del pool si esa proyección se reutiliza; si no, una figura nueva."""
+    import matplotlib
+    figsize = tuple(figsize or matplotlib.rcParams["figure.figsize"])
+    if FIGURAS_POOL and POOL_FIGURAS.usa_pool(projection):
+        return POOL_FIGURAS.tomar(figsize, projection)
+    return nueva_figura(figsize, projection)
+
+
+def liberar_figura(fig) -> None:
+    """Devuelve la figura al pool; si no es del pool y la creó pyplot, la cierra."""
+    if fig is None or POOL_FIGURAS.devolver(fig):
+        return
+    if getattr(fig.canvas, "manager", None) is not None:
+        import matplotlib.pyplot as plt
+        plt.close(fig)
+
+
+def estadisticas_pool_figuras() -> dict:
+    """Reusos, figuras creadas/descartadas y figuras libres del pool."""
+    return POOL_FIGURAS.estadisticas()
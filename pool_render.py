@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Backend opcional de renderizado en procesos para graficos_plugins.
+
+pyplot mantiene estado global y no es seguro entre hilos: con varias sesiones de
+Streamlit en la misma instancia todos comparten un único renderizador. Este módulo
+mantiene un pool de procesos "calientes" (backend Agg y registro de plugins ya
+importados); cada trabajo entra como una spec JSON y vuelve como bytes de imagen.
+Un trabajo que excede el tiempo límite mata SOLO a su proceso, que se reemplaza,
+sin afectar a los renders de otros usuarios.
+
+Se activa con GRAFICOS_BACKEND=procesos (ver crear_grafico).
+"""
+import os
+import json
+import queue
+import atexit
+import threading
+import multiprocessing as mp
+
+N_PROCESOS = int(os.environ.get("GRAFICOS_PROCESOS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+TIMEOUT_S = float(os.environ.get("GRAFICOS_TIMEOUT_S", "30"))
+TIMEOUT_ARRANQUE_S = float(os.environ.get("GRAFICOS_TIMEOUT_ARRANQUE_S", "120"))
+TAREAS_POR_PROCESO = int(os.environ.get("GRAFICOS_TAREAS_POR_PROCESO", "200"))
+
+
+def _bucle_worker(conn):
+    """Proceso hijo: importa Agg + plugins una sola vez y atiende trabajos hasta recibir None."""
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib
+    matplotlib.use("Agg")
+    import graficos_plugins
+    graficos_plugins.precargar_plugins()
+
+    conn.send(("listo", None))
+    while True:
+        try:
+            mensaje = conn.recv()
+        except (EOFError, OSError):
+            break
+        if mensaje is None:
+            break
+        try:
+            spec = json.loads(mensaje)
+            buf = graficos_plugins._renderizar_plugin(spec["tipo"], spec.get("datos") or {}, spec.get("configuracion") or {},
+                                                      spec.get("formato") or "png", spec.get("dpi"))
+            conn.send(("ok", buf.getvalue() if buf is not None else None))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, proceso, conn):
+        self.proceso = proceso
+        self.conn = conn
+        self.listo = False
+        self.tareas = 0
+
+
+class PoolRender:
+    """Pool de procesos de renderizado; renderizar() es seguro entre hilos."""
+
+    def __init__(self, n_procesos: int = N_PROCESOS, timeout: float = TIMEOUT_S):
+        self.timeout = timeout
+        self._ctx = mp.get_context("spawn")
+        self._libres = queue.Queue()
+        self._n = max(1, int(n_procesos))
+        for _ in range(self._n):
+            self._libres.put(self._lanzar())
+
+    def _lanzar(self) -> _Worker:
+        padre, hijo = self._ctx.Pipe()
+        proceso = self._ctx.Process(target=_bucle_worker, args=(hijo,), daemon=True, name="render-graficos")
+        proceso.start()
+        hijo.close()
+        return _Worker(proceso, padre)
+
+    @staticmethod
+    def _matar(worker: _Worker) -> None:
+        try:
+            worker.proceso.kill()
+            worker.proceso.join(timeout=5)
+        except Exception:
+            pass
+        try:
+            worker.conn.close()
+        except Exception:
+            pass
+
+    def _esperar_arranque(self, worker: _Worker) -> None:
+        if worker.listo:
+            return
+        if not worker.conn.poll(TIMEOUT_ARRANQUE_S):
+            raise TimeoutError("el proceso de renderizado no terminó de arrancar")
+        worker.conn.recv()
+        worker.listo = True
+
+    def renderizar(self, plugin_key, datos, configuracion, timeout=None, formato="png", dpi=None) -> bytes:
+        """
+        Envía la spec a un proceso libre y devuelve los bytes de la imagen (PNG u otro 'formato').
+        Lanza TimeoutError si no hay proceso libre o el trabajo excede el tiempo,
+        y RuntimeError si el plugin falla dentro del proceso.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        payload = json.dumps({"tipo": plugin_key, "datos": datos, "configuracion": configuracion,
+                              "formato": formato, "dpi": dpi},
+                             ensure_ascii=False, default=str)
+        try:
+            worker = self._libres.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no hubo un proceso de renderizado libre en {timeout:.0f}s")
+
+        reemplazar = False
+        try:
+            self._esperar_arranque(worker)
+            worker.conn.send(payload)
+            if not worker.conn.poll(timeout):
+                raise TimeoutError(f"el render excedió {timeout:.0f}s")
+            estado, valor = worker.conn.recv()
+            worker.tareas += 1
+        except TimeoutError:
+            reemplazar = True
+            raise
+        except (EOFError, OSError) as e:
+            reemplazar = True
+            raise RuntimeError(f"el proceso de renderizado terminó inesperadamente ({e})")
+        finally:
+            # Reciclar procesos colgados, caídos o con muchas tareas (acota fugas de memoria)
+            if reemplazar or worker.tareas >= TAREAS_POR_PROCESO:
+                self._matar(worker)
+                worker = self._lanzar()
+            self._libres.put(worker)
+
+        if estado != "ok":
+            raise RuntimeError(valor)
+        return valor
+
+    def cerrar(self) -> None:
+        """Detiene todos los procesos del pool."""
+        for _ in range(self._n):
+            try:
+                worker = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            self._matar(worker)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def obtener_pool() -> PoolRender:
+    """Pool compartido del proceso (se crea en el primer uso)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = PoolRender()
+            atexit.register(_POOL.cerrar)
+        return _POOL
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-auditoría local y determinista del ítem generado.
+
+Varios criterios del auditor (auditar_item_llm) se pueden verificar mecánicamente:
+palabras de jerarquización en el enunciado, las 4 opciones, la clave, la redacción
+de las justificaciones de los distractores y la coherencia de las banderas de
+gráfico. Revisarlos aquí toma microsegundos; si alguno falla, el ítem vuelve al
+generador con el feedback sin gastar una llamada al auditor LLM.
+
+El resultado usa el mismo formato que la respuesta del auditor (criterios,
+dictamen_final, observaciones_finales) para que el flujo de la app lo trate igual.
+"""
+import re
+import json
+import unicodedata
+
+LETRAS_OPCIONES = ("A", "B", "C", "D")
+PALABRAS_PROHIBIDAS = re.compile(r"\b(más|mejor(?:es)?|principalmente)\b", re.IGNORECASE)
+FRASE_DISTRACTOR = "el estudiante podria escoger"
+SIN_GRAFICO = ("", "N/A", "NA", "NINGUNO")
+
+
+def _sin_tildes(texto: str) -> str:
+    """Minúsculas y sin diacríticos ('Podría' -> 'podria')."""
+    descompuesto = unicodedata.normalize("NFD", str(texto))
+    return "".join(c for c in descompuesto if unicodedata.category(c) != "Mn").lower()
+
+
+def _bandera(valor):
+    """Normaliza 'SÍ'/'SI'/'sí' -> 'SÍ' y 'NO' -> 'NO'; cualquier otra cosa -> None."""
+    v = _sin_tildes(valor).strip()
+    if v == "si":
+        return "SÍ"
+    if v == "no":
+        return "NO"
+    return None
+
+
+def _sin_descripcion(texto) -> bool:
+    return str(texto or "").strip().upper() in SIN_GRAFICO
+
+
+def _opciones_por_letra(opciones) -> dict:
+    """Opciones con las claves normalizadas como las letras ('a ' -> 'A')."""
+    return {str(k).strip().upper(): v for k, v in opciones.items()}
+
+
+def _revisar_estilo(item):
+    enunciado = str(item.get("pregunta_espejo", "") or "")
+    if not enunciado.strip():
+        return ["El enunciado ('pregunta_espejo') está vacío."]
+    encontradas = sorted({m.group(0).lower() for m in PALABRAS_PROHIBIDAS.finditer(enunciado)})
+    if encontradas:
+        return [f"El enunciado usa palabras de jerarquización prohibidas: {', '.join(repr(p) for p in encontradas)}."]
+    return []
+
+
+def _revisar_clave_y_opciones(item):
+    errores = []
+    opciones = item.get("opciones")
+    if not isinstance(opciones, dict):
+        return ["El campo 'opciones' falta o no es un objeto con las opciones A, B, C y D."]
+    letras = sorted(str(k).strip().upper() for k in opciones)
+    if letras != list(LETRAS_OPCIONES):
+        errores.append(f"Debe haber exactamente 4 opciones (A, B, C, D); se recibieron: {', '.join(letras) or 'ninguna'}.")
+    opciones = _opciones_por_letra(opciones)
+    for letra in LETRAS_OPCIONES:
+        opcion = opciones.get(letra)
+        if opcion is None:
+            continue
+        if not isinstance(opcion, dict):
+            errores.append(f"La opción {letra} no tiene el formato esperado.")
+            continue
+        if not str(opcion.get("texto", "") or "").strip() and _bandera(opcion.get("grafico_necesario")) != "SÍ":
+            errores.append(f"La opción {letra} no tiene texto ni gráfico.")
+
+    clave = str(item.get("clave", "") or "").strip().upper()
+    if clave not in LETRAS_OPCIONES:
+        errores.append(f"La clave '{item.get('clave', '')}' no es una de las opciones A, B, C o D.")
+    elif clave not in opciones:
+        errores.append(f"La clave '{clave}' no coincide con ninguna opción del ítem.")
+    return errores
+
+
+def _revisar_distractores(item):
+    clave = str(item.get("clave", "") or "").strip().upper()
+    justifs = item.get("justificaciones_distractores")
+    if not isinstance(justifs, list):
+        return ["Faltan las 'justificaciones_distractores'."]
+    por_opcion = {}
+    for j in justifs:
+        if isinstance(j, dict):
+            por_opcion[str(j.get("opcion", "")).strip().upper()] = str(j.get("justificacion", "") or "")
+
+    errores = []
+    for letra in LETRAS_OPCIONES:
+        if letra == clave:
+            continue
+        texto = por_opcion.get(letra)
+        if not texto or not texto.strip():
+            errores.append(f"Falta la justificación del distractor {letra}.")
+        elif FRASE_DISTRACTOR not in _sin_tildes(texto):
+            errores.append(f"La justificación del distractor {letra} no usa la redacción "
+                           f"\"El estudiante podría escoger la opción {letra} porque... Sin embargo esto es incorrecto porque...\".")
+    return errores
+
+
+def _revisar_graficos(item):
+    errores = []
+    elementos = [("el enunciado", item.get("grafico_necesario_enunciado"), item.get("descripcion_texto_grafico_enunciado"))]
+    opciones = _opciones_por_letra(item["opciones"]) if isinstance(item.get("opciones"), dict) else {}
+    for letra in LETRAS_OPCIONES:
+        opcion = opciones.get(letra)
+        if isinstance(opcion, dict):
+            elementos.append((f"la opción {letra}", opcion.get("grafico_necesario"), opcion.get("descripcion_texto_grafico")))
+
+    for nombre, bandera, descripcion in elementos:
+        valor = _bandera(bandera)
+        if valor is None:
+            errores.append(f"El indicador de gráfico de {nombre} debe ser \"SÍ\" o \"NO\" (se recibió {bandera!r}).")
+        elif valor == "SÍ" and _sin_descripcion(descripcion):
+            errores.append(f"El gráfico de {nombre} está marcado \"SÍ\" pero no tiene descripción.")
+    return errores
+
+
+REGLAS = (
+    ("2. Estilo (No Jerarquización)", _revisar_estilo),
+    ("3. Calidad de Distractores", _revisar_distractores),
+    ("4. Clave y Opciones", _revisar_clave_y_opciones),
+    ("5. Coherencia de Gráficos", _revisar_graficos),
+)
+
+
+def validar_item(item):
+    """
+    Aplica todas las reglas. 'item' puede ser el dict o el texto JSON del generador.
+    Devuelve una lista de (criterio, [errores]) solo con los criterios que fallan.
+    """
+    if isinstance(item, str):
+        try:
+            item = json.loads(item)
+        except json.JSONDecodeError as e:
+            return [("Formato JSON", [f"El ítem no es un JSON válido: {e}"])]
+    if not isinstance(item, dict):
+        return [("Formato JSON", ["El ítem debe ser un objeto JSON."])]
+    fallas = []
+    for criterio, regla in REGLAS:
+        errores = regla(item)
+        if errores:
+            fallas.append((criterio, errores))
+    return fallas
+
+
+def pre_auditar_item(item):
+    """
+    Devuelve None si el ítem pasa todas las reglas locales; si no, un dictamen
+    '❌ RECHAZADO' con el mismo formato que el auditor LLM, listo para usar como feedback.
+    """
+    fallas = validar_item(item)
+    if not fallas:
+        return None
+    observaciones = " ".join(e for _, errores in fallas for e in errores)
+    return {
+        "criterios": [
+            {"criterio": criterio, "estado": "❌ NO CUMPLE", "comentario": " ".join(errores)}
+            for criterio, errores in fallas
+        ],
+        "dictamen_final": "❌ RECHAZADO",
+        "observaciones_finales": observaciones,
+        "origen": "reglas locales",
+    }
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de la taxonomía (libro Excel de Estructura) para los filtros en cascada.
+
+En lugar de volver a filtrar los DataFrames con máscaras booleanas en cada rerun
+de Streamlit, las hojas se recorren UNA vez y se arma un árbol de diccionarios:
+
+    Hoja 1: Grado -> Área -> Componente1 -> Competencia -> Afirmación -> Evidencia
+    Hoja 2: Grado -> Área -> Componente2 -> Ref. Temática
+
+Cada nivel conserva el orden de primera aparición en la hoja (el mismo que daba
+.unique()), así que las opciones y el valor por defecto de cada selectbox no cambian.
+Las opciones de un selectbox se obtienen con una búsqueda en diccionarios.
+
+CargadorTaxonomia mantiene UNA copia parseada (hojas + índice) por proceso, revisa en
+segundo plano el número de generación del archivo en GCS y cambia a la nueva versión
+sin reiniciar. Junto al .xlsx guarda una instantánea Parquet por generación para que
+un arranque en frío no tenga que pasar el libro por openpyxl (requiere pyarrow).
+"""
+import io
+import os
+import json
+import math
+import time
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (motor de pd.read_parquet / DataFrame.to_parquet)
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    PARQUET_DISPONIBLE = False
+
+TAXONOMIA_REVALIDAR_S = float(os.environ.get("TAXONOMIA_REVALIDAR_S", "300"))
+TAXONOMIA_SNAPSHOT = os.environ.get("TAXONOMIA_SNAPSHOT", "1").strip().lower() not in ("0", "false", "no")
+
+COLUMNAS_H1 = ("Grado", "Área", "Componente1", "Competencia", "Afirmación", "Evidencia")
+COLUMNAS_H2 = ("Grado", "Área", "Componente2", "Ref. Temática")
+
+# Todas las celdas vacías comparten el mismo objeto NaN para que .unique() y el índice coincidan
+_NAN = float("nan")
+
+
+def _clave(valor):
+    if isinstance(valor, float) and math.isnan(valor):
+        return _NAN
+    return valor
+
+
+def _arbol(df, columnas):
+    """Árbol de dicts anidados (el último nivel es un dict valor -> None, usado como conjunto ordenado)."""
+    raiz = {}
+    for fila in df[list(columnas)].itertuples(index=False, name=None):
+        nodo = raiz
+        for valor in fila[:-1]:
+            nodo = nodo.setdefault(_clave(valor), {})
+        nodo.setdefault(_clave(fila[-1]), None)
+    return raiz
+
+
+def construir_indice(df1, df2) -> dict:
+    """
+    Índice de las dos hojas. Lanza KeyError si falta alguna columna
+    (el mismo error que daba el filtrado con pandas).
+    """
+    return {"h1": _arbol(df1, COLUMNAS_H1), "h2": _arbol(df2, COLUMNAS_H2)}
+
+
+def opciones(indice: dict, hoja: str, *ruta) -> list:
+    """
+    Opciones del siguiente nivel de la hoja ('h1' o 'h2') dados los valores ya elegidos.
+    Ej.: opciones(indice, "h1", grado, area) -> lista de Componente1.
+    """
+    nodo = indice.get(hoja) or {}
+    for valor in ruta:
+        nodo = nodo.get(_clave(valor)) or {}
+    return list(nodo)
+
+
+# ------------------ Carga versionada desde GCS ------------------
+def _prefijo_snapshot(file_path: str, generacion) -> str:
+    return f"{file_path}.snapshot/{generacion}/"
+
+
+def _leer_snapshot(bucket, file_path, generacion):
+    """Hojas desde la instantánea Parquet de esa generación, o None si no existe (o está incompleta)."""
+    if not (PARQUET_DISPONIBLE and TAXONOMIA_SNAPSHOT):
+        return None
+    prefijo = _prefijo_snapshot(file_path, generacion)
+    manifiesto = bucket.blob(f"{prefijo}manifiesto.json")
+    if not manifiesto.exists():
+        return None
+    hojas = {}
+    for i, nombre in enumerate(json.loads(manifiesto.download_as_bytes())["hojas"]):
+        contenido = bucket.blob(f"{prefijo}{i:02d}.parquet").download_as_bytes()
+        hojas[nombre] = pd.read_parquet(io.BytesIO(contenido))
+    return hojas
+
+
+def _escribir_snapshot(bucket, file_path, generacion, hojas) -> None:
+    """
+    Guarda una instantánea Parquet de las hojas (mejor esfuerzo: requiere permiso de escritura).
+    El manifiesto se sube al final, así una instantánea a medias nunca se lee.
+    """
+    if not (PARQUET_DISPONIBLE and TAXONOMIA_SNAPSHOT):
+        return
+    try:
+        archivos = []
+        for df in hojas.values():
+            buf = io.BytesIO()
+            df.to_parquet(buf, index=False)
+            archivos.append(buf.getvalue())
+        prefijo = _prefijo_snapshot(file_path, generacion)
+        for i, contenido in enumerate(archivos):
+            bucket.blob(f"{prefijo}{i:02d}.parquet").upload_from_string(
+                contenido, content_type="application/vnd.apache.parquet")
+        bucket.blob(f"{prefijo}manifiesto.json").upload_from_string(
+            json.dumps({"hojas": list(hojas)}, ensure_ascii=False), content_type="application/json")
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar la instantánea Parquet de la taxonomía: {e}")
+
+
+class CargadorTaxonomia:
+    """
+    Versión vigente de la taxonomía, compartida por todas las sesiones del proceso.
+    actual() devuelve un dict inmutable {generacion, hojas, indice, error_indice, origen}: las hojas
+    se comparten, NO deben modificarse.
+    """
+
+    def __init__(self, bucket_name: str, file_path: str, revalidar_s: float = TAXONOMIA_REVALIDAR_S):
+        self.bucket_name = bucket_name
+        self.file_path = file_path
+        self.revalidar_s = revalidar_s
+        self._version = None
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def _bucket(self):
+        from clientes_gcp import obtener_storage
+        return obtener_storage().bucket(self.bucket_name)
+
+    def _cargar(self, blob):
+        bucket = self._bucket()
+        hojas, origen = None, "parquet"
+        try:
+            hojas = _leer_snapshot(bucket, self.file_path, blob.generation)
+        except Exception as e:
+            print(f"⚠️ Instantánea Parquet de la taxonomía ilegible ({e}); se lee el Excel.")
+        if hojas is None:
+            origen = "xlsx"
+            contenido = blob.download_as_bytes(if_generation_match=blob.generation)
+            hojas = pd.read_excel(io.BytesIO(contenido), sheet_name=None)
+            _escribir_snapshot(bucket, self.file_path, blob.generation, hojas)
+        valores = list(hojas.values())
+        indice, error_indice = None, None
+        if len(valores) >= 2:
+            try:
+                indice = construir_indice(valores[0], valores[1])
+            except KeyError as e:
+                error_indice = e  # columna faltante: la app muestra el error con las columnas de cada hoja
+        return {"generacion": blob.generation, "hojas": hojas, "indice": indice,
+                "error_indice": error_indice, "origen": origen}
+
+    def revisar(self) -> bool:
+        """Compara la generación del blob (solo metadatos) y recarga si cambió. Devuelve True si cambió."""
+        with self._lock:  # una sola carga a la vez
+            blob = self._bucket().get_blob(self.file_path)
+            if blob is None:
+                if self._version is None:
+                    raise FileNotFoundError(f"El archivo '{self.file_path}' no se encontró en el bucket '{self.bucket_name}'.")
+                print(f"⚠️ '{self.file_path}' ya no está en el bucket; se conserva la versión en memoria.")
+                return False
+            if self._version is not None and blob.generation == self._version["generacion"]:
+                return False
+            # Intercambio atómico: cada sesión toma la nueva versión en su próximo rerun
+            self._version = self._cargar(blob)
+            return True
+
+    def actual(self) -> dict:
+        """Versión vigente; la primera llamada carga y arranca la revisión en segundo plano."""
+        if self._version is None:
+            self.revisar()  # si otro hilo ya cargó, solo compara la generación
+            self._arrancar_revision()
+        return self._version
+
+    def _arrancar_revision(self):
+        with self._lock:
+            if self._hilo is not None or self.revalidar_s <= 0:
+                return
+            self._hilo = threading.Thread(target=self._bucle_revision, daemon=True, name="revisar-taxonomia")
+            self._hilo.start()
+
+    def _bucle_revision(self):
+        while True:
+            time.sleep(self.revalidar_s)
+            try:
+                if self.revisar():
+                    print(f"🔄 Taxonomía actualizada a la generación {self._version['generacion']}.")
+            except Exception as e:
+                print(f"⚠️ No se pudo revisar la versión de la taxonomía: {e}")